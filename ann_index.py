@@ -0,0 +1,125 @@
+import os
+import numpy as np
+
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "auto")
+IVF_MINIMUM_TICKETS = 20000
+IVF_DEFAULT_PROBES = 8
+KMEANS_ITERATIONS = 10
+KMEANS_TRAINING_SAMPLES_PER_CLUSTER = 64
+ASSIGNMENT_CHUNK_SIZE = 16384
+# Largest query x ticket score matrix search_many materializes at once.
+BATCH_SCORE_MATRIX_MAX_ELEMENTS = 1 << 24
+
+def normalize_rows(matrix):
+    row_norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    row_norms[row_norms == 0] = 1.0
+    return matrix / row_norms
+
+def top_k_indices(similarity_scores, number_of_results):
+    if number_of_results >= similarity_scores.shape[0]:
+        return np.argsort(-similarity_scores)
+    candidate_indices = np.argpartition(-similarity_scores, number_of_results - 1)[:number_of_results]
+    return candidate_indices[np.argsort(-similarity_scores[candidate_indices])]
+
+def top_k_indices_per_row(similarity_score_matrix, number_of_results):
+    if number_of_results >= similarity_score_matrix.shape[1]:
+        return np.argsort(-similarity_score_matrix, axis=1)
+    candidate_indices = np.argpartition(-similarity_score_matrix, number_of_results - 1, axis=1)[:, :number_of_results]
+    candidate_scores = np.take_along_axis(similarity_score_matrix, candidate_indices, axis=1)
+    return np.take_along_axis(candidate_indices, np.argsort(-candidate_scores, axis=1), axis=1)
+
+def _assign_to_centroids(embedding_matrix, centroids):
+    return np.concatenate([
+        np.argmax(embedding_matrix[start_index:start_index + ASSIGNMENT_CHUNK_SIZE] @ centroids.T, axis=1)
+        for start_index in range(0, len(embedding_matrix), ASSIGNMENT_CHUNK_SIZE)
+    ])
+
+def _train_spherical_kmeans(embedding_matrix, number_of_clusters, random_generator, iterations=KMEANS_ITERATIONS):
+    sample_size = min(len(embedding_matrix), number_of_clusters * KMEANS_TRAINING_SAMPLES_PER_CLUSTER)
+    training_vectors = embedding_matrix[np.sort(random_generator.choice(len(embedding_matrix), sample_size, replace=False))]
+    centroids = training_vectors[random_generator.choice(sample_size, number_of_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign_to_centroids(training_vectors, centroids)
+        cluster_sizes = np.bincount(assignments, minlength=number_of_clusters)
+        non_empty_clusters = cluster_sizes > 0
+        cluster_offsets = np.concatenate([[0], np.cumsum(cluster_sizes)[:-1]])
+        cluster_sums = np.add.reduceat(
+            training_vectors[np.argsort(assignments, kind="stable")], cluster_offsets[non_empty_clusters], axis=0
+        )
+        centroids[non_empty_clusters] = normalize_rows(cluster_sums)
+    return centroids
+
+class ExactSearchBackend:
+    """Brute-force scoring of every (optionally pre-filtered) ticket."""
+
+    def __init__(self, embedding_matrix):
+        self.embedding_matrix = embedding_matrix
+
+    def search(self, query_vector, number_of_results, candidate_mask=None):
+        if candidate_mask is None:
+            return top_k_indices(self.embedding_matrix @ query_vector, number_of_results)
+        candidate_indices = np.flatnonzero(candidate_mask)
+        similarity_scores = self.embedding_matrix[candidate_indices] @ query_vector
+        return candidate_indices[top_k_indices(similarity_scores, number_of_results)]
+
+    def search_many(self, query_matrix, number_of_results, candidate_mask=None):
+        """Top indices for each row of query_matrix, scored a chunk of queries at a time with one matrix product."""
+        candidate_indices = None if candidate_mask is None else np.flatnonzero(candidate_mask)
+        candidate_matrix = self.embedding_matrix if candidate_indices is None else self.embedding_matrix[candidate_indices]
+        queries_per_chunk = max(1, BATCH_SCORE_MATRIX_MAX_ELEMENTS // max(1, len(candidate_matrix)))
+        top_index_rows = np.concatenate([
+            top_k_indices_per_row(query_matrix[start_index:start_index + queries_per_chunk] @ candidate_matrix.T, number_of_results)
+            for start_index in range(0, len(query_matrix), queries_per_chunk)
+        ])
+        return top_index_rows if candidate_indices is None else candidate_indices[top_index_rows]
+
+class IVFSearchBackend:
+    """Inverted-file index: spherical k-means cells, only the closest cells are scanned per query."""
+
+    def __init__(self, embedding_matrix, number_of_clusters=None, number_of_probes=IVF_DEFAULT_PROBES, random_seed=0):
+        self.embedding_matrix = embedding_matrix
+        self.number_of_clusters = min(len(embedding_matrix), number_of_clusters or max(1, int(np.sqrt(len(embedding_matrix)))))
+        self.number_of_probes = min(number_of_probes, self.number_of_clusters)
+        self.centroids = _train_spherical_kmeans(embedding_matrix, self.number_of_clusters, np.random.default_rng(random_seed))
+
+        cluster_assignments = _assign_to_centroids(embedding_matrix, self.centroids)
+        self.clustered_ticket_indices = np.argsort(cluster_assignments, kind="stable")
+        self.cluster_offsets = np.concatenate([[0], np.cumsum(np.bincount(cluster_assignments, minlength=self.number_of_clusters))])
+
+    def _probed_candidate_indices(self, query_vector, number_of_probes):
+        probed_clusters = top_k_indices(self.centroids @ query_vector, number_of_probes)
+        return np.concatenate([
+            self.clustered_ticket_indices[self.cluster_offsets[cluster]:self.cluster_offsets[cluster + 1]]
+            for cluster in probed_clusters
+        ])
+
+    def search(self, query_vector, number_of_results, candidate_mask=None, number_of_probes=None):
+        number_of_probes = number_of_probes or self.number_of_probes
+        if candidate_mask is not None:
+            expected_probe_size = len(self.embedding_matrix) * number_of_probes / self.number_of_clusters
+            if np.count_nonzero(candidate_mask) <= expected_probe_size:
+                return ExactSearchBackend(self.embedding_matrix).search(query_vector, number_of_results, candidate_mask)
+
+        candidate_indices = self._probed_candidate_indices(query_vector, number_of_probes)
+        if candidate_mask is not None:
+            candidate_indices = candidate_indices[candidate_mask[candidate_indices]]
+        if len(candidate_indices) < number_of_results:
+            return ExactSearchBackend(self.embedding_matrix).search(query_vector, number_of_results, candidate_mask)
+
+        similarity_scores = self.embedding_matrix[candidate_indices] @ query_vector
+        return candidate_indices[top_k_indices(similarity_scores, number_of_results)]
+
+    def search_many(self, query_matrix, number_of_results, candidate_mask=None):
+        # Each query probes its own cells, so there is no shared matrix to multiply against.
+        return [self.search(query_vector, number_of_results, candidate_mask) for query_vector in query_matrix]
+
+def create_search_backend(embedding_matrix, backend_name=None):
+    backend_name = backend_name or VECTOR_SEARCH_BACKEND
+    if backend_name == "auto":
+        backend_name = "ivf" if len(embedding_matrix) >= IVF_MINIMUM_TICKETS else "exact"
+    if backend_name == "ivf" and len(embedding_matrix) > 0:
+        return IVFSearchBackend(embedding_matrix)
+    if backend_name in ("exact", "ivf"):
+        return ExactSearchBackend(embedding_matrix)
+    raise ValueError(f"Unknown vector search backend: {backend_name}")
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import os
+import re
+import time
+import types
+from embedding_cache import acreate_embedding
+from llm_response_cache import cache_for_call_site, llm_cache_key
+from llm_scheduler import COMPLETION_TOKEN_ESTIMATE, estimate_tokens, get_llm_scheduler
+from llm_service import (
+    CHAT_MODEL, RETRIEVAL_EMBEDDING_TIMEOUT_SECONDS, _chat_request_arguments, predict_request_type_from_neighbours,
+    _build_classification_prompt, _build_extraction_prompt, _split_extracted_fields,
+    _build_follow_up_questions_prompt, _build_decision_prompt, _unpack_decision, _build_analysis_prompt, _split_analysis
+)
+from metrics import RETRIEVAL_EMBEDDING_FALLBACKS_TOTAL, record_llm_request, stage_timer
+from prompt_builder import MERGED_ANALYSIS
+from request_classifier import LOCAL_CLASSIFIER_METHOD, classify_request_locally
+from request_catalog import get_request_type_catalog
+from utils import get_async_openai_client
+from vector_index import RETRIEVAL_MODE, get_historical_ticket_index
+
+SPECULATIVE_EXTRACTION = os.getenv("SPECULATIVE_EXTRACTION", "1") == "1"
+
+async def _aget_cached_response(llm_response_cache, cache_key, call_site):
+    # Only a persistent cache touches the database, so only it is worth a thread hop.
+    if getattr(llm_response_cache, "persist", False):
+        return await asyncio.to_thread(llm_response_cache.get, cache_key, call_site)
+    return llm_response_cache.get(cache_key, call_site)
+
+async def _aput_cached_response(llm_response_cache, cache_key, call_site, response_content):
+    if getattr(llm_response_cache, "persist", False):
+        await asyncio.to_thread(llm_response_cache.put, cache_key, CHAT_MODEL, call_site, response_content)
+    else:
+        llm_response_cache.put(cache_key, CHAT_MODEL, call_site, response_content)
+
+async def _acall_llm(prompt, parse_content, response_format=None, call_site=None):
+    llm_response_cache = cache_for_call_site(call_site)
+    cache_key = llm_cache_key(CHAT_MODEL, prompt, response_format)
+    if llm_response_cache is not None:
+        cached_content = await _aget_cached_response(llm_response_cache, cache_key, call_site)
+        if cached_content is not None:
+            return parse_content(cached_content)
+
+    async def request_chat_completion():
+        requested_at = time.perf_counter()
+        response = await get_async_openai_client().chat.completions.create(**_chat_request_arguments(prompt, response_format))
+        record_llm_request(call_site, time.perf_counter() - requested_at, getattr(response, "usage", None))
+        return response
+
+    response = await get_llm_scheduler().arun(
+        CHAT_MODEL, request_chat_completion, estimate_tokens([prompt], COMPLETION_TOKEN_ESTIMATE), coalesce_key=cache_key
+    )
+    response_content = response.choices[0].message.content
+    parsed_response = parse_content(response_content)
+
+    if llm_response_cache is not None:
+        await _aput_cached_response(llm_response_cache, cache_key, call_site, response_content)
+    return parsed_response
+
+async def _astream_llm(prompt, response_format=None, call_site=None):
+    """Yield the completion's content as the API streams it; a cached response comes back as one chunk."""
+    llm_response_cache = cache_for_call_site(call_site)
+    cache_key = llm_cache_key(CHAT_MODEL, prompt, response_format)
+    if llm_response_cache is not None:
+        cached_content = await _aget_cached_response(llm_response_cache, cache_key, call_site)
+        if cached_content is not None:
+            yield cached_content
+            return
+
+    content_deltas = asyncio.Queue()
+
+    async def request_chat_completion_stream():
+        requested_at = time.perf_counter()
+        content_parts, usage = [], None
+        response_stream = await get_async_openai_client().chat.completions.create(
+            **_chat_request_arguments(prompt, response_format), stream=True, stream_options={"include_usage": True}
+        )
+        try:
+            async for response_chunk in response_stream:
+                usage = getattr(response_chunk, "usage", None) or usage
+                content_delta = response_chunk.choices[0].delta.content if response_chunk.choices else None
+                if content_delta:
+                    content_parts.append(content_delta)
+                    content_deltas.put_nowait(content_delta)
+        except Exception as stream_error:
+            if content_parts:
+                # Part of the answer has already been forwarded, so the scheduler must not retry it.
+                raise RuntimeError(f"Chat completion stream broke off after {len(content_parts)} chunks") from stream_error
+            raise
+        record_llm_request(call_site, time.perf_counter() - requested_at, usage)
+        return types.SimpleNamespace(content="".join(content_parts), usage=usage)
+
+    async def request_through_scheduler():
+        try:
+            return await get_llm_scheduler().arun(CHAT_MODEL, request_chat_completion_stream, estimate_tokens([prompt], COMPLETION_TOKEN_ESTIMATE))
+        finally:
+            content_deltas.put_nowait(None)
+
+    request_task = asyncio.create_task(request_through_scheduler())
+    try:
+        while (content_delta := await content_deltas.get()) is not None:
+            yield content_delta
+        response = await request_task
+    finally:
+        request_task.cancel()
+
+    if llm_response_cache is not None:
+        await _aput_cached_response(llm_response_cache, cache_key, call_site, response.content)
+
+class _JSONStringFieldReader:
+    """Decodes one string field of a JSON object while the object is still streaming in."""
+
+    def __init__(self, field_name):
+        self.field_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field_name))
+        self.raw_text = ""
+        self.value_start = None
+        self.decoded_length = 0
+        self.is_complete = False
+
+    def _decodable_value(self):
+        raw_value = self.raw_text[self.value_start:]
+        is_escaped = False
+        for character_index, character in enumerate(raw_value):
+            if is_escaped:
+                is_escaped = False
+            elif character == "\\":
+                is_escaped = True
+            elif character == '"':
+                self.is_complete = True
+                return raw_value[:character_index]
+        # Drop a trailing escape sequence that has not fully arrived yet.
+        for trimmed_length in range(len(raw_value), max(len(raw_value) - 6, 0) - 1, -1):
+            try:
+                json.loads(f'"{raw_value[:trimmed_length]}"')
+                return raw_value[:trimmed_length]
+            except json.JSONDecodeError:
+                continue
+        return ""
+
+    def feed(self, content_delta):
+        """Add the next chunk of raw JSON; returns the newly decoded part of the field's value."""
+        self.raw_text += content_delta
+        if self.is_complete:
+            return ""
+        if self.value_start is None:
+            field_match = self.field_pattern.search(self.raw_text)
+            if field_match is None:
+                return ""
+            self.value_start = field_match.end()
+        decoded_value = json.loads(f'"{self._decodable_value()}"')
+        new_text, self.decoded_length = decoded_value[self.decoded_length:], len(decoded_value)
+        return new_text
+
+async def _acall_llm_for_text(prompt, call_site=None):
+    return await _acall_llm(prompt, str.strip, call_site=call_site)
+
+async def _acall_llm_for_json(prompt, call_site=None):
+    return await _acall_llm(prompt, json.loads, {"type": "json_object"}, call_site)
+
+async def aretrieval_query_embedding(create_query_embedding):
+    """retrieval_query_embedding() for a coroutine factory; hybrid mode also gives up after RETRIEVAL_EMBEDDING_TIMEOUT_SECONDS."""
+    if RETRIEVAL_MODE == "lexical":
+        return None
+    if RETRIEVAL_MODE != "hybrid":
+        return await create_query_embedding()
+    try:
+        return await asyncio.wait_for(create_query_embedding(), RETRIEVAL_EMBEDDING_TIMEOUT_SECONDS)
+    except Exception:
+        RETRIEVAL_EMBEDDING_FALLBACKS_TOTAL.inc()
+        return None
+
+async def afind_similar_historical_tickets(query_text, number_of_tickets_to_retrieve=5, request_type=None, outcome=None, created_after=None, created_before=None, query_embedding=None, embed_missing_query=True):
+    with stage_timer("retrieval"):
+        if query_embedding is None and embed_missing_query:
+            query_embedding = await aretrieval_query_embedding(lambda: acreate_embedding(query_text))
+
+        return await asyncio.to_thread(
+            lambda: get_historical_ticket_index().retrieve(
+                query_text, query_embedding, number_of_tickets_to_retrieve,
+                request_type=request_type, outcome=outcome, created_after=created_after, created_before=created_before
+            )
+        )
+
+async def _aclassify_locally(user_message, query_embedding=None):
+    if LOCAL_CLASSIFIER_METHOD == "off" or (query_embedding is None and RETRIEVAL_MODE != "vector"):
+        return None, 0.0, False
+    with stage_timer("local_classification"):
+        if query_embedding is None:
+            query_embedding = await acreate_embedding(user_message)
+        return await asyncio.to_thread(classify_request_locally, query_embedding)
+
+async def _aclassify_with_llm(user_message, similar_historical_tickets, request_types_list=None):
+    with stage_timer("classification"):
+        if request_types_list is None:
+            request_types_list = (await asyncio.to_thread(get_request_type_catalog)).request_types
+
+        classification_prompt = _build_classification_prompt(user_message, similar_historical_tickets, request_types_list)
+
+        return await _acall_llm_for_text(classification_prompt, call_site="classification")
+
+async def _aanalyze_with_llm(user_message, similar_historical_tickets):
+    with stage_timer("analysis"):
+        request_type_catalog = await asyncio.to_thread(get_request_type_catalog)
+
+        analysis_prompt = _build_analysis_prompt(user_message, similar_historical_tickets, request_type_catalog)
+
+        return _split_analysis(await _acall_llm_for_json(analysis_prompt, call_site="analysis"), request_type_catalog)
+
+async def aextract_required_fields_from_request(user_message, request_type, fields_to_extract=None):
+    with stage_timer("extraction"):
+        mandatory_fields_list = (await asyncio.to_thread(get_request_type_catalog)).mandatory_fields(request_type)
+
+        extraction_prompt = _build_extraction_prompt(user_message, mandatory_fields_list if fields_to_extract is None else fields_to_extract)
+
+        extracted_fields_data = await _acall_llm_for_json(extraction_prompt, call_site="extraction")
+
+    provided_fields, missing_fields = _split_extracted_fields(extracted_fields_data)
+
+    return provided_fields, missing_fields, mandatory_fields_list
+
+async def aanalyze_security_request(user_message, similar_historical_tickets, request_types_list=None, query_embedding=None):
+    """Classify and extract concurrently.
+
+    A confident local classification skips the LLM classifier. With MERGED_ANALYSIS one LLM call does
+    both; otherwise extraction starts straight away for the locally predicted request type and is only
+    redone if the LLM classification disagrees.
+    """
+    predicted_request_type, _, is_confident = await _aclassify_locally(user_message, query_embedding)
+    if is_confident:
+        return (predicted_request_type, *await aextract_required_fields_from_request(user_message, predicted_request_type))
+    if MERGED_ANALYSIS:
+        return await _aanalyze_with_llm(user_message, similar_historical_tickets)
+
+    classification_task = asyncio.create_task(_aclassify_with_llm(user_message, similar_historical_tickets, request_types_list))
+    predicted_request_type = predicted_request_type or predict_request_type_from_neighbours(similar_historical_tickets)
+    speculative_extraction_task = None
+    if SPECULATIVE_EXTRACTION and predicted_request_type is not None:
+        speculative_extraction_task = asyncio.create_task(aextract_required_fields_from_request(user_message, predicted_request_type))
+
+    try:
+        identified_request_type = await classification_task
+    except BaseException:
+        if speculative_extraction_task is not None:
+            speculative_extraction_task.cancel()
+        raise
+
+    if speculative_extraction_task is not None and identified_request_type == predicted_request_type:
+        provided_fields, missing_fields, mandatory_fields = await speculative_extraction_task
+    else:
+        if speculative_extraction_task is not None:
+            speculative_extraction_task.cancel()
+        provided_fields, missing_fields, mandatory_fields = await aextract_required_fields_from_request(user_message, identified_request_type)
+    return identified_request_type, provided_fields, missing_fields, mandatory_fields
+
+async def agenerate_follow_up_questions(missing_fields_list, conversation_context):
+    question_prompt = _build_follow_up_questions_prompt(missing_fields_list, conversation_context)
+
+    with stage_timer("follow_up"):
+        return await _acall_llm_for_text(question_prompt, call_site="follow_up")
+
+async def astream_follow_up_questions(missing_fields_list, conversation_context):
+    """agenerate_follow_up_questions(), yielding the message as the model writes it."""
+    question_prompt = _build_follow_up_questions_prompt(missing_fields_list, conversation_context)
+
+    with stage_timer("follow_up"):
+        async for content_delta in _astream_llm(question_prompt, call_site="follow_up"):
+            yield content_delta
+
+async def amake_security_decision(user_message, request_type, provided_fields, missing_fields, similar_historical_tickets=None):
+    if missing_fields:
+        return "Info Requested", "Missing required fields", None, None
+
+    if similar_historical_tickets is None:
+        similar_historical_tickets = await afind_similar_historical_tickets(user_message, number_of_tickets_to_retrieve=5, request_type=request_type)
+
+    with stage_timer("decision"):
+        decision_prompt = _build_decision_prompt(user_message, request_type, provided_fields, similar_historical_tickets)
+
+        decision_result = await _acall_llm_for_json(decision_prompt, call_site="decision")
+
+    return _unpack_decision(decision_result)
+
+
+async def astream_security_decision(user_message, request_type, provided_fields, similar_historical_tickets):
+    """amake_security_decision() for a request with every field provided, streaming the rationale.
+
+    Yields (rationale_delta, None) while the rationale is being written, then ("", decision) once with
+    the same (outcome, rationale, risk_score, confidence_score) tuple amake_security_decision() returns.
+    """
+    with stage_timer("decision"):
+        decision_prompt = _build_decision_prompt(user_message, request_type, provided_fields, similar_historical_tickets)
+
+        rationale_reader = _JSONStringFieldReader("rationale")
+        async for content_delta in _astream_llm(decision_prompt, {"type": "json_object"}, call_site="decision"):
+            rationale_delta = rationale_reader.feed(content_delta)
+            if rationale_delta:
+                yield rationale_delta, None
+
+    yield "", _unpack_decision(json.loads(rationale_reader.raw_text))
\ No newline at end of file
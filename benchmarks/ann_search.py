@@ -0,0 +1,49 @@
+import argparse
+import time
+import numpy as np
+from ann_index import ExactSearchBackend, IVFSearchBackend, normalize_rows
+from benchmarks.synthetic_data import generate_clustered_embeddings
+
+REQUEST_TYPE_COUNT = 7
+
+def _measure(search_function, query_vectors, number_of_results):
+    started_at = time.perf_counter()
+    results = [set(search_function(query_vector, number_of_results).tolist()) for query_vector in query_vectors]
+    return results, (time.perf_counter() - started_at) / len(query_vectors) * 1000
+
+def _recall(expected_results, actual_results, number_of_results):
+    return np.mean([len(expected & actual) / min(number_of_results, len(expected) or 1) for expected, actual in zip(expected_results, actual_results)])
+
+def run_benchmark(corpus_sizes, probe_counts, number_of_queries=200, number_of_results=10):
+    random_generator = np.random.default_rng(0)
+    print(f"{'tickets':>8} {'filter':>12} {'probes':>6} {'exact ms':>9} {'ivf ms':>8} {'recall@' + str(number_of_results):>10}")
+    for number_of_tickets in corpus_sizes:
+        embedding_matrix, _ = generate_clustered_embeddings(number_of_tickets, max(50, number_of_tickets // 200), random_generator)
+        embedding_matrix = normalize_rows(embedding_matrix)
+        request_type_codes = random_generator.integers(0, REQUEST_TYPE_COUNT, number_of_tickets)
+        query_vectors = normalize_rows(embedding_matrix[random_generator.choice(number_of_tickets, number_of_queries)]
+                                       + random_generator.standard_normal((number_of_queries, embedding_matrix.shape[1]), dtype=np.float32) * 0.02)
+
+        started_at = time.perf_counter()
+        ivf_backend = IVFSearchBackend(embedding_matrix)
+        print(f"{number_of_tickets:>8} built IVF with {ivf_backend.number_of_clusters} cells in {time.perf_counter() - started_at:.1f}s")
+        exact_backend = ExactSearchBackend(embedding_matrix)
+
+        for filter_name, candidate_mask in (("none", None), ("request_type", request_type_codes == 0)):
+            exact_results, exact_milliseconds = _measure(
+                lambda query_vector, k: exact_backend.search(query_vector, k, candidate_mask), query_vectors, number_of_results
+            )
+            for number_of_probes in probe_counts:
+                ivf_results, ivf_milliseconds = _measure(
+                    lambda query_vector, k: ivf_backend.search(query_vector, k, candidate_mask, number_of_probes),
+                    query_vectors, number_of_results
+                )
+                recall = _recall(exact_results, ivf_results, number_of_results)
+                print(f"{number_of_tickets:>8} {filter_name:>12} {number_of_probes:>6} {exact_milliseconds:>9.2f} {ivf_milliseconds:>8.2f} {recall:>10.3f}")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Recall and latency of the IVF backend against exact search")
+    argument_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    argument_parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16])
+    arguments = argument_parser.parse_args()
+    run_benchmark(arguments.sizes, arguments.probes)
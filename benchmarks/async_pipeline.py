@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import csv
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Thread count the sync path has always been measured with, so results stay comparable across runs.
+SYNC_WORKERS = 7
+
+def _prepare_database(csv_file_path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    from benchmarks.stub_openai import install_stub_clients
+    from initialize import initialize_database, load_historical_tickets_from_csv
+    install_stub_clients(embedding_latency=0, chat_latency=0)
+    initialize_database()
+    load_historical_tickets_from_csv(csv_file_path)
+
+def _load_request_texts(csv_file_path, number_of_requests):
+    with open(csv_file_path, newline="", encoding="utf-8") as csv_file:
+        ticket_rows = list(csv.DictReader(csv_file))
+    return [f"{ticket_rows[index % len(ticket_rows)]['request_summary']}. {ticket_rows[index % len(ticket_rows)]['details']}" for index in range(number_of_requests)]
+
+def _report(label, request_latencies, elapsed_seconds):
+    latencies_ms = np.array(request_latencies) * 1000
+    print(f"{label:>6}: p50 {np.percentile(latencies_ms, 50):8.1f} ms  p99 {np.percentile(latencies_ms, 99):8.1f} ms  "
+          f"throughput {len(request_latencies) / elapsed_seconds:7.1f} req/s")
+
+def run_sync_path(request_texts):
+    from benchmarks.sync_pipeline import process_incoming_message_sync
+    from main import MessageInput
+
+    def timed_request(request_text):
+        started_at = time.perf_counter()
+        process_incoming_message_sync(str(uuid.uuid4()), MessageInput(text=request_text))
+        return time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        request_latencies = list(executor.map(timed_request, request_texts))
+    return request_latencies, time.perf_counter() - started_at
+
+async def run_async_path(request_texts, concurrency):
+    from main import MessageInput, process_incoming_message
+    concurrency_limit = asyncio.Semaphore(concurrency)
+
+    async def timed_request(request_text):
+        async with concurrency_limit:
+            started_at = time.perf_counter()
+            await process_incoming_message(str(uuid.uuid4()), MessageInput(text=request_text))
+            return time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    request_latencies = await asyncio.gather(*(timed_request(request_text) for request_text in request_texts))
+    return request_latencies, time.perf_counter() - started_at
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Compare the sync and async message pipelines against a stub LLM")
+    argument_parser.add_argument("--requests", type=int, default=200)
+    argument_parser.add_argument("--concurrency", type=int, default=100)
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    _prepare_database(arguments.csv)
+    from benchmarks.stub_openai import install_stub_clients
+    install_stub_clients(arguments.embedding_latency, arguments.chat_latency)
+    request_texts = _load_request_texts(arguments.csv, arguments.requests)
+
+    print(f"{arguments.requests} requests, stub latency: embeddings {arguments.embedding_latency}s, chat {arguments.chat_latency}s")
+    _report("sync", *run_sync_path(request_texts))
+    _report("async", *asyncio.run(run_async_path(request_texts, arguments.concurrency)))
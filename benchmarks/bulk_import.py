@@ -0,0 +1,81 @@
+import argparse
+import os
+import tempfile
+import time
+
+def _legacy_import(csv_file_path):
+    """The previous loader: iterrows, sequential batches of 100 embeddings, one ORM object per row."""
+    import pandas as pd
+    from datetime import datetime
+    from database import HistoricalTicket
+    from embedding_store import encode_embedding
+    from utils import get_db_session, get_openai_client
+
+    tickets_data_frame = pd.read_csv(csv_file_path)
+    texts_for_embedding = [
+        f"{ticket_row['request_type']}: {ticket_row['request_summary']}\n{ticket_row['details']}"
+        for _, ticket_row in tickets_data_frame.iterrows()
+    ]
+    generated_embeddings = []
+    for start_index in range(0, len(texts_for_embedding), 100):
+        embedding_response = get_openai_client().embeddings.create(model="text-embedding-3-small", input=texts_for_embedding[start_index:start_index + 100])
+        generated_embeddings.extend(embedding_item.embedding for embedding_item in embedding_response.data)
+    with get_db_session() as database_session:
+        for ticket_index, ticket_row in tickets_data_frame.iterrows():
+            embedding_blob, embedding_scale = encode_embedding(generated_embeddings[ticket_index])
+            database_session.add(HistoricalTicket(
+                ticket_id=ticket_row['ticket_id'],
+                request_type=ticket_row['request_type'],
+                request_summary=ticket_row['request_summary'],
+                details=ticket_row['details'],
+                mandatory_fields=ticket_row['mandatory_fields'],
+                fields_provided=ticket_row['fields_provided'],
+                outcome=ticket_row['outcome'],
+                security_risk_score=int(ticket_row['security_risk_score']),
+                embedding_vector=embedding_blob,
+                embedding_scale=embedding_scale,
+                created_at=datetime.strptime(ticket_row['created_at'], "%Y-%m-%d %H:%M:%S"),
+                requester_department=ticket_row['requester_department'],
+                requester_title=ticket_row['requester_title']
+            ))
+
+def _reset_tables():
+    from database import Base, engine, initialize_database
+    Base.metadata.drop_all(bind=engine)
+    initialize_database()
+
+def _report(label, number_of_rows, elapsed_seconds):
+    print(f"{label:>24}: {number_of_rows:7d} rows in {elapsed_seconds:7.1f} s  ({number_of_rows / elapsed_seconds:8.0f} rows/s)")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Measure historical ticket import throughput against a stub embeddings API")
+    argument_parser.add_argument("--tickets", type=int, default=100000)
+    argument_parser.add_argument("--legacy-tickets", type=int, default=10000, help="Rows for the legacy loader (0 to skip)")
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.2, help="Stub latency per embeddings request, seconds")
+    arguments = argument_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{working_directory}/benchmark.db"
+    from benchmarks.stub_openai import install_stub_clients
+    from benchmarks.synthetic_data import write_synthetic_ticket_csv
+    from ticket_importer import import_historical_tickets
+    install_stub_clients(embedding_latency=arguments.embedding_latency, chat_latency=0)
+
+    csv_file_path = f"{working_directory}/tickets.csv"
+    write_synthetic_ticket_csv(csv_file_path, arguments.tickets)
+    print(f"{arguments.tickets} synthetic tickets, stub embedding latency {arguments.embedding_latency}s per request")
+
+    if arguments.legacy_tickets:
+        legacy_csv_file_path = f"{working_directory}/legacy_tickets.csv"
+        write_synthetic_ticket_csv(legacy_csv_file_path, arguments.legacy_tickets)
+        _reset_tables()
+        started_at = time.perf_counter()
+        _legacy_import(legacy_csv_file_path)
+        _report("legacy loader", arguments.legacy_tickets, time.perf_counter() - started_at)
+
+    _reset_tables()
+    import_summary = import_historical_tickets(csv_file_path)
+    _report("importer, empty table", import_summary["rows_read"], import_summary["elapsed_seconds"])
+    import_summary = import_historical_tickets(csv_file_path)
+    _report("importer, re-import", import_summary["rows_read"], import_summary["elapsed_seconds"])
+    print(f"re-import skipped {import_summary['skipped']} unchanged tickets")
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+from benchmarks.load_test import _free_port, _post_json
+
+def _wait_for_connection(app_url, app_process, started_at, timeout_seconds=120):
+    while time.perf_counter() - started_at < timeout_seconds:
+        if app_process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {app_process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{app_url}/metrics", timeout=5):
+                return time.perf_counter() - started_at
+        except OSError:
+            time.sleep(0.01)
+    raise TimeoutError(f"{app_url} did not come up within {timeout_seconds}s")
+
+def _wait_until_ready(app_url, started_at, timeout_seconds=120):
+    while time.perf_counter() - started_at < timeout_seconds:
+        try:
+            with urllib.request.urlopen(f"{app_url}/ready", timeout=5) as http_response:
+                return time.perf_counter() - started_at, json.loads(http_response.read())
+        except urllib.error.HTTPError as http_error:
+            if http_error.code == 404:
+                return None, None
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{app_url}/ready did not report ready within {timeout_seconds}s")
+
+def measure_cold_start(server_environment, message_text, wait_for_ready):
+    """Spawn a fresh server and send one message as soon as it accepts connections (or once /ready says so)."""
+    app_port = _free_port()
+    app_url = f"http://127.0.0.1:{app_port}"
+    started_at = time.perf_counter()
+    app_process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"
+    ], env=server_environment)
+    try:
+        cold_start_timings = {"accepting": _wait_for_connection(app_url, app_process, started_at)}
+        if wait_for_ready:
+            cold_start_timings["ready"], _ = _wait_until_ready(app_url, started_at)
+        thread_id = _post_json(f"{app_url}/threads")["thread_id"]
+        message_sent_at = time.perf_counter()
+        _post_json(f"{app_url}/threads/{thread_id}/messages", {"text": message_text})
+        cold_start_timings["first_message"] = time.perf_counter() - message_sent_at
+        cold_start_timings["first_response"] = time.perf_counter() - started_at
+        thread_id = _post_json(f"{app_url}/threads")["thread_id"]
+        message_sent_at = time.perf_counter()
+        _post_json(f"{app_url}/threads/{thread_id}/messages", {"text": message_text + " (second)"})
+        cold_start_timings["second_message"] = time.perf_counter() - message_sent_at
+        return cold_start_timings
+    finally:
+        app_process.terminate()
+        app_process.wait()
+
+def measure_import_seconds(server_environment, module_name):
+    import_timer = f"import time; started_at = time.perf_counter(); import {module_name}; print(time.perf_counter() - started_at)"
+    return float(subprocess.run([sys.executable, "-c", import_timer], env=server_environment, check=True, capture_output=True, text=True).stdout)
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Cold start to first response for a freshly spawned server")
+    argument_parser.add_argument("--runs", type=int, default=5)
+    argument_parser.add_argument("--warm-up-modes", default="off,blocking,background", help="Comma-separated WARM_UP values to compare")
+    argument_parser.add_argument("--tickets", type=int, default=0, help="Load this many resampled tickets instead of the CSV, to see how index building scales")
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    fake_openai_port = _free_port()
+    server_environment = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{working_directory}/cold_start.db",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_openai_port}/v1",
+        OPENAI_API_KEY="fake-key",
+        LLM_RESPONSE_CACHE="off"
+    )
+    fake_openai_process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(fake_openai_port),
+        "--embedding-latency", str(arguments.embedding_latency), "--chat-latency", str(arguments.chat_latency)
+    ], env=server_environment, stdout=subprocess.DEVNULL)
+    try:
+        ticket_csv_path = arguments.csv
+        if arguments.tickets:
+            from benchmarks.synthetic_data import write_synthetic_ticket_csv
+            ticket_csv_path = f"{working_directory}/tickets.csv"
+            write_synthetic_ticket_csv(ticket_csv_path, arguments.tickets, arguments.csv)
+        subprocess.run([sys.executable, "-c", f"from initialize import initialize_database, load_historical_tickets_from_csv; "
+                        f"initialize_database(); load_historical_tickets_from_csv({ticket_csv_path!r})"],
+                       env=server_environment, check=True, stdout=subprocess.DEVNULL)
+        print(f"import main: {measure_import_seconds(server_environment, 'main') * 1000:.0f} ms, "
+              f"import initialize: {measure_import_seconds(server_environment, 'initialize') * 1000:.0f} ms")
+
+        from benchmarks.synthetic_data import generate_synthetic_threads
+        message_text = generate_synthetic_threads(1, arguments.csv, 1)[0]["opening_message"]
+        for warm_up_mode in arguments.warm_up_modes.split(","):
+            run_timings = [
+                measure_cold_start(dict(server_environment, WARM_UP=warm_up_mode), message_text, wait_for_ready=warm_up_mode == "background")
+                for _ in range(arguments.runs)
+            ]
+            print(f"WARM_UP={warm_up_mode} (median of {arguments.runs} runs)")
+            for measurement in run_timings[0]:
+                measured_values = [run_timing[measurement] for run_timing in run_timings if run_timing[measurement] is not None]
+                if measured_values:
+                    print(f"  {measurement:>15}: {np.median(measured_values) * 1000:7.0f} ms")
+    finally:
+        fake_openai_process.terminate()
+        fake_openai_process.wait()
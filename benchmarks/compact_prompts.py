@@ -0,0 +1,91 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import urllib.request
+import numpy as np
+from benchmarks.load_test import _free_port, _percentiles, _wait_until_serving, run_load_test
+
+PROMPT_CONFIGURATIONS = {
+    "verbose": {"PROMPT_STYLE": "verbose", "MERGED_ANALYSIS": "0"},
+    "compact": {"PROMPT_STYLE": "compact", "MERGED_ANALYSIS": "0"},
+    "compact+merged": {"PROMPT_STYLE": "compact", "MERGED_ANALYSIS": "1"}
+}
+
+def _llm_token_totals(app_url):
+    """Prompt and completion tokens by call site, scraped from /metrics."""
+    with urllib.request.urlopen(f"{app_url}/metrics", timeout=10) as metrics_response:
+        metrics_text = metrics_response.read().decode("utf-8")
+    token_totals = {}
+    for call_site, kind, token_count in re.findall(r'^acme_llm_tokens_total\{call_site="([^"]+)",kind="([^"]+)"\} (\S+)$', metrics_text, re.M):
+        token_totals[(call_site, kind)] = token_totals.get((call_site, kind), 0.0) + float(token_count)
+    return token_totals
+
+def measure_configuration(server_environment, synthetic_threads, concurrency):
+    app_port = _free_port()
+    app_url = f"http://127.0.0.1:{app_port}"
+    app_process = subprocess.Popen([sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(app_port)],
+                                   env=dict(server_environment, WARM_UP="blocking"), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_serving(f"{app_url}/ready", app_process)
+        message_results, elapsed_seconds = run_load_test(app_url, synthetic_threads, concurrency)
+        return message_results, elapsed_seconds, _llm_token_totals(app_url)
+    finally:
+        app_process.terminate()
+        app_process.wait()
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Prompt tokens and latency per message with verbose, compact and merged prompts")
+    argument_parser.add_argument("--threads", type=int, default=100, help="Synthetic conversations per configuration")
+    argument_parser.add_argument("--max-turns", type=int, default=3)
+    argument_parser.add_argument("--concurrency", type=int, default=10)
+    argument_parser.add_argument("--prompt-token-budget", type=int, default=600)
+    argument_parser.add_argument("--local-classifier", default="off", help="LOCAL_CLASSIFIER_METHOD; off so every new thread is classified by the LLM")
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    fake_openai_port = _free_port()
+    server_environment = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{working_directory}/compact_prompts.db",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_openai_port}/v1",
+        OPENAI_API_KEY="fake-key",
+        LLM_RESPONSE_CACHE="off",
+        LOCAL_CLASSIFIER_METHOD=arguments.local_classifier,
+        PROMPT_TOKEN_BUDGET=str(arguments.prompt_token_budget)
+    )
+    fake_openai_process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(fake_openai_port),
+        "--embedding-latency", str(arguments.embedding_latency), "--chat-latency", str(arguments.chat_latency)
+    ], env=server_environment, stdout=subprocess.DEVNULL)
+    try:
+        from benchmarks.synthetic_data import generate_synthetic_threads
+        subprocess.run([sys.executable, "-c", f"from initialize import initialize_database, load_historical_tickets_from_csv; "
+                        f"initialize_database(); load_historical_tickets_from_csv({arguments.csv!r})"],
+                       env=server_environment, check=True, stdout=subprocess.DEVNULL)
+        synthetic_threads = generate_synthetic_threads(arguments.threads, arguments.csv, arguments.max_turns)
+        print(f"{arguments.threads} threads at concurrency {arguments.concurrency}, fake chat latency {arguments.chat_latency}s "
+              f"(independent of prompt size), prompt token budget {arguments.prompt_token_budget}")
+        print(f"{'prompts':>15} {'messages':>8} {'LLM calls':>9} {'prompt tok':>10} {'completion tok':>14} {'p50 ms':>8} {'p95 ms':>8}  prompt tokens per message by call site")
+        for configuration_name, configuration_environment in PROMPT_CONFIGURATIONS.items():
+            message_results, elapsed_seconds, token_totals = measure_configuration(
+                dict(server_environment, **configuration_environment), synthetic_threads, arguments.concurrency
+            )
+            number_of_messages = len(message_results)
+            p50, p95, _ = _percentiles([client_seconds * 1000 for client_seconds, _ in message_results])
+            prompt_tokens = sum(token_count for (_, kind), token_count in token_totals.items() if kind == "prompt")
+            completion_tokens = sum(token_count for (_, kind), token_count in token_totals.items() if kind == "completion")
+            call_site_tokens = ", ".join(
+                f"{call_site} {token_count / number_of_messages:.0f}" for (call_site, kind), token_count in sorted(token_totals.items()) if kind == "prompt"
+            )
+            print(f"{configuration_name:>15} {number_of_messages:8d} "
+                  f"{np.mean([message_timings['llm_calls'] for _, message_timings in message_results]):9.2f} "
+                  f"{prompt_tokens / number_of_messages:10.0f} {completion_tokens / number_of_messages:14.0f} {p50:8.1f} {p95:8.1f}  {call_site_tokens}")
+    finally:
+        fake_openai_process.terminate()
+        fake_openai_process.wait()
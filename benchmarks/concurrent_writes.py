@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+STORAGE_CONFIGURATIONS = {
+    "rollback journal, inline inserts": {"SQLITE_JOURNAL_MODE": "DELETE", "WRITE_BEHIND": "off"},
+    "WAL, inline inserts": {"SQLITE_JOURNAL_MODE": "WAL", "WRITE_BEHIND": "off"},
+    "WAL, write-behind": {"SQLITE_JOURNAL_MODE": "WAL", "WRITE_BEHIND": "on"}
+}
+
+def _persist_message(thread_id, message_index):
+    """The database work of one /messages request, without the LLM calls in between."""
+    from conversation_state import load_conversation_state, save_conversation_state
+    from main import _create_audit_log, _save_user_message, _upsert_decision_record
+    from utils import get_db_session, request_scoped_db_session
+
+    message_text = f"Message {message_index}: please grant read access to the billing warehouse for the quarterly audit."
+    with request_scoped_db_session():
+        with get_db_session() as database_session:
+            conversation_state = load_conversation_state(database_session, thread_id)
+        _save_user_message(thread_id, message_text)
+        conversation_state.append_message("user", message_text)
+        conversation_state.record_analysis("Database Access", {"justification": "audit"}, ["duration"], ["justification", "duration"])
+        with get_db_session() as database_session:
+            save_conversation_state(database_session, conversation_state)
+            _upsert_decision_record(database_session, thread_id, "Database Access", {"justification": "audit"}, ["duration"],
+                                    ["justification", "duration"], None, None, None, None)
+        _create_audit_log(thread_id, message_text, "Database Access", ["duration"], None)
+
+def run_concurrent_writers(number_of_writers, messages_per_writer, number_of_readers):
+    """Writers persist messages on their own threads while readers poll decisions; runs against DATABASE_URL."""
+    from benchmarks.stub_openai import install_stub_clients
+    from database import Decision, Message, initialize_database
+    from utils import get_db_session
+    from write_behind import flush_write_behind
+    install_stub_clients(embedding_latency=0, chat_latency=0)
+    initialize_database()
+
+    stop_reading = threading.Event()
+    read_counts = [0] * number_of_readers
+
+    def read_decisions(reader_index):
+        while not stop_reading.is_set():
+            with get_db_session() as database_session:
+                database_session.query(Decision).order_by(Decision.id.desc()).limit(20).all()
+            read_counts[reader_index] += 1
+
+    def write_messages(writer_index):
+        thread_id = str(uuid.uuid4())
+        message_latencies, failed_messages = [], 0
+        for message_index in range(messages_per_writer):
+            started_at = time.perf_counter()
+            try:
+                _persist_message(thread_id, message_index)
+            except Exception:
+                failed_messages += 1
+                continue
+            message_latencies.append(time.perf_counter() - started_at)
+        return message_latencies, failed_messages
+
+    reader_threads = [threading.Thread(target=read_decisions, args=(reader_index,), daemon=True) for reader_index in range(number_of_readers)]
+    for reader_thread in reader_threads:
+        reader_thread.start()
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=number_of_writers) as executor:
+        writer_results = list(executor.map(write_messages, range(number_of_writers)))
+    writes_finished_at = time.perf_counter()
+    flush_write_behind()
+    elapsed_seconds = time.perf_counter() - started_at
+    stop_reading.set()
+    for reader_thread in reader_threads:
+        reader_thread.join()
+
+    with get_db_session() as database_session:
+        stored_messages = database_session.query(Message).count()
+    message_latencies_ms = [latency * 1000 for message_latencies, _ in writer_results for latency in message_latencies]
+    return {
+        "messages": len(message_latencies_ms),
+        "failed": sum(failed_messages for _, failed_messages in writer_results),
+        "stored_messages": stored_messages,
+        "elapsed_seconds": elapsed_seconds,
+        "request_seconds": writes_finished_at - started_at,
+        "latency_ms": list(np.percentile(message_latencies_ms, [50, 95, 99])) if message_latencies_ms else [float("nan")] * 3,
+        "reads_per_second": sum(read_counts) / elapsed_seconds
+    }
+
+def _run_configuration(configuration_environment, database_url, arguments):
+    worker_environment = dict(os.environ, DATABASE_URL=database_url, **configuration_environment)
+    worker_output = subprocess.run([
+        sys.executable, "-m", "benchmarks.concurrent_writes", "--worker",
+        "--writers", str(arguments.writers), "--messages", str(arguments.messages), "--readers", str(arguments.readers)
+    ], env=worker_environment, check=True, capture_output=True, text=True).stdout
+    return json.loads(worker_output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Concurrent writer throughput of the storage layer, per configuration")
+    argument_parser.add_argument("--writers", type=int, default=16)
+    argument_parser.add_argument("--messages", type=int, default=100, help="Messages persisted by each writer")
+    argument_parser.add_argument("--readers", type=int, default=2)
+    argument_parser.add_argument("--database-url", help="Run once against this database (e.g. postgresql://...) instead of temporary SQLite files")
+    argument_parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    arguments = argument_parser.parse_args()
+
+    if arguments.worker:
+        print(json.dumps(run_concurrent_writers(arguments.writers, arguments.messages, arguments.readers)))
+        sys.exit(0)
+
+    if arguments.database_url:
+        configurations = {"inline inserts": {"WRITE_BEHIND": "off"}, "write-behind": {"WRITE_BEHIND": "on"}}
+    else:
+        configurations = STORAGE_CONFIGURATIONS
+    print(f"{arguments.writers} writers x {arguments.messages} messages, {arguments.readers} readers")
+    print(f"{'configuration':>34} {'msg/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7} {'reads/s':>8}")
+    for configuration_name, configuration_environment in configurations.items():
+        database_url = arguments.database_url or f"sqlite:///{tempfile.mkdtemp()}/concurrent_writes.db"
+        result = _run_configuration(configuration_environment, database_url, arguments)
+        p50, p95, p99 = result["latency_ms"]
+        print(f"{configuration_name:>34} {result['messages'] / result['elapsed_seconds']:8.1f} {p50:8.2f} {p95:8.2f} {p99:8.2f} "
+              f"{result['failed']:7d} {result['reads_per_second']:8.1f}")
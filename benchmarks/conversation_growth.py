@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import os
+import uuid
+
+FOLLOW_UP_MESSAGES = [
+    "Sure, the business justification is the quarterly close and the audit team needs it.",
+    "It is needed for about 4 hours tomorrow morning.",
+    "My manager Dana Whitfield approved it in the #it-approvals channel.",
+    "The data is classified as internal, there is no customer PII in it.",
+    "Just to add some context, this is the same setup we had last quarter when the finance systems were migrated and the reconciliation jobs ran late.",
+]
+
+async def _run_thread(number_of_turns, first_message):
+    from benchmarks.llm_response_cache import _count_chat_usage
+    from benchmarks.stub_openai import install_stub_clients
+    from main import MessageInput, process_incoming_message
+
+    _, async_client = install_stub_clients(embedding_latency=0, chat_latency=0)
+    chat_usage = _count_chat_usage(async_client)
+    thread_id = str(uuid.uuid4())
+    full_transcript_tokens = 0
+    print(f"{'turn':>4} {'prompt+completion tokens':>25} {'full transcript tokens':>23}")
+    for turn_number in range(number_of_turns):
+        message_text = first_message if turn_number == 0 else FOLLOW_UP_MESSAGES[(turn_number - 1) % len(FOLLOW_UP_MESSAGES)]
+        full_transcript_tokens += len(f"user: {message_text}\n") // 4
+        tokens_before_turn = chat_usage["tokens"]
+        await process_incoming_message(thread_id, MessageInput(text=message_text))
+        if turn_number < 5 or (turn_number + 1) % 20 == 0:
+            print(f"{turn_number + 1:4d} {chat_usage['tokens'] - tokens_before_turn:25d} {full_transcript_tokens:23d}")
+    print(f"total chat tokens over {number_of_turns} turns: {chat_usage['tokens']}")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Chat tokens spent per turn as a thread grows")
+    argument_parser.add_argument("--turns", type=int, default=120)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    os.environ.setdefault("LOCAL_CLASSIFIER_METHOD", "off")
+    from benchmarks.async_pipeline import _prepare_database
+    _prepare_database(arguments.csv)
+    asyncio.run(_run_thread(arguments.turns, "Requesting read access to the finance data warehouse export for the Q3 reconciliation."))
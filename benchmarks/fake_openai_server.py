@@ -0,0 +1,136 @@
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from benchmarks.stub_openai import _canned_chat_content, _deterministic_embedding
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+def _embedding_payload(request_body):
+    texts = [request_body["input"]] if isinstance(request_body["input"], str) else request_body["input"]
+    use_base64 = request_body.get("encoding_format") == "base64"
+    embedding_items = []
+    for text_index, text in enumerate(texts):
+        embedding = _deterministic_embedding(text)
+        if use_base64:
+            embedding = base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+        embedding_items.append({"object": "embedding", "index": text_index, "embedding": embedding})
+    prompt_tokens = sum(_estimate_tokens(text) for text in texts)
+    return {
+        "object": "list",
+        "data": embedding_items,
+        "model": request_body["model"],
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+    }
+
+def _chat_payload(request_body, require_field_mentions):
+    prompt = request_body["messages"][-1]["content"]
+    content = _canned_chat_content(prompt, request_body.get("response_format"), require_field_mentions)
+    prompt_tokens, completion_tokens = _estimate_tokens(prompt), _estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request_body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+def _chat_stream_chunks(request_body, require_field_mentions):
+    """The same canned completion as chat.completion.chunk objects, one per word, then a usage-only chunk."""
+    chat_payload = _chat_payload(request_body, require_field_mentions)
+    chunk_fields = {"id": chat_payload["id"], "object": "chat.completion.chunk", "created": chat_payload["created"], "model": chat_payload["model"]}
+    content_pieces = re.findall(r"\S+\s*", chat_payload["choices"][0]["message"]["content"])
+    for piece_index, content_piece in enumerate(content_pieces):
+        yield {**chunk_fields, "choices": [{
+            "index": 0, "delta": {"role": "assistant", "content": content_piece} if piece_index == 0 else {"content": content_piece},
+            "finish_reason": "stop" if piece_index == len(content_pieces) - 1 else None
+        }]}
+    if request_body.get("stream_options", {}).get("include_usage"):
+        yield {**chunk_fields, "choices": [], "usage": chat_payload["usage"]}
+
+class FakeOpenAIRequestHandler(BaseHTTPRequestHandler):
+    """Serves /v1/embeddings and /v1/chat/completions (streamed or not) with fixed latencies and canned responses."""
+
+    protocol_version = "HTTP/1.1"
+    embedding_latency = 0.05
+    chat_latency = 0.3
+    require_field_mentions = True
+    # Streamed completions send their first chunk after this share of chat_latency and finish at chat_latency.
+    first_chunk_latency_fraction = 0.25
+
+    def _send_json(self, status_code, payload):
+        response_body = json.dumps(payload).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        try:
+            self.wfile.write(response_body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The app cancels speculative requests it no longer needs.
+            self.close_connection = True
+
+    def _send_event_stream(self, stream_chunks):
+        stream_chunks = list(stream_chunks)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(self.chat_latency * self.first_chunk_latency_fraction)
+        chunk_interval = self.chat_latency * (1 - self.first_chunk_latency_fraction) / max(len(stream_chunks) - 1, 1)
+        try:
+            for chunk_index, stream_chunk in enumerate(stream_chunks):
+                if chunk_index:
+                    time.sleep(chunk_interval)
+                self.wfile.write(f"data: {json.dumps(stream_chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):
+        request_body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/embeddings"):
+            time.sleep(self.embedding_latency)
+            self._send_json(200, _embedding_payload(request_body))
+        elif self.path.endswith("/chat/completions") and request_body.get("stream"):
+            self._send_event_stream(_chat_stream_chunks(request_body, self.require_field_mentions))
+        elif self.path.endswith("/chat/completions"):
+            time.sleep(self.chat_latency)
+            self._send_json(200, _chat_payload(request_body, self.require_field_mentions))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_openai_server(port=0, embedding_latency=0.05, chat_latency=0.3, require_field_mentions=True):
+    """Start the fake API on a daemon thread; returns (server, base_url) for OPENAI_BASE_URL."""
+    handler_class = type("ConfiguredFakeOpenAIRequestHandler", (FakeOpenAIRequestHandler,), {
+        "embedding_latency": embedding_latency,
+        "chat_latency": chat_latency,
+        "require_field_mentions": require_field_mentions
+    })
+    fake_server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+    fake_server.daemon_threads = True
+    threading.Thread(target=fake_server.serve_forever, name="fake-openai", daemon=True).start()
+    return fake_server, f"http://127.0.0.1:{fake_server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI embeddings and chat completions API")
+    argument_parser.add_argument("--port", type=int, default=8100)
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--all-fields-provided", action="store_true", help="Extraction never reports missing fields")
+    arguments = argument_parser.parse_args()
+    _, base_url = start_fake_openai_server(arguments.port, arguments.embedding_latency, arguments.chat_latency, not arguments.all_fields_provided)
+    print(f"Fake OpenAI API listening on {base_url}", flush=True)
+    threading.Event().wait()
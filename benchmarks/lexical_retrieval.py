@@ -0,0 +1,73 @@
+import argparse
+import csv
+import time
+import numpy as np
+from ann_index import create_search_backend, normalize_rows
+from benchmarks.local_classifier import _hashed_bag_of_words, _openai_embeddings
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from vector_index import HYBRID_CANDIDATE_POOL
+
+def _retrieve(method, bm25_index, search_backend, query_text, query_vector, number_of_results, candidate_mask):
+    if method == "lexical":
+        return bm25_index.search(query_text, number_of_results, candidate_mask)
+    if method == "vector":
+        return search_backend.search(query_vector, number_of_results, candidate_mask)
+    candidate_pool = max(number_of_results, HYBRID_CANDIDATE_POOL)
+    return reciprocal_rank_fusion([
+        search_backend.search(query_vector, candidate_pool, candidate_mask),
+        bm25_index.search(query_text, candidate_pool, candidate_mask)
+    ], number_of_results)
+
+def evaluate(csv_file_path, embedding_source, number_of_results=5):
+    """Leave-one-out over the ticket CSV, ranking every other ticket the way HistoricalTicketIndex does.
+
+    known-item: the query is one part of a ticket (its summary, or its details) and the ticket itself must
+    be in the top results. same type: the share of the top results, the query ticket excluded, that have
+    the query ticket's request type.
+    """
+    with open(csv_file_path, newline="", encoding="utf-8") as csv_file:
+        ticket_rows = list(csv.DictReader(csv_file))
+    request_types = np.array([row['request_type'] for row in ticket_rows])
+    stored_texts = [f"{row['request_summary']}\n{row['details']}" for row in ticket_rows]
+    embed = _openai_embeddings if embedding_source == "openai" else _hashed_bag_of_words
+    bm25_index = BM25Index(stored_texts)
+    search_backend = create_search_backend(normalize_rows(embed([f"{row['request_type']}: {text}" for row, text in zip(ticket_rows, stored_texts)])))
+    query_sets = {
+        "summary": [row['request_summary'] for row in ticket_rows],
+        "details": [row['details'] for row in ticket_rows],
+        "full": stored_texts
+    }
+    query_vectors = {query_field: normalize_rows(embed(query_texts)) for query_field, query_texts in query_sets.items()}
+
+    print(f"{len(ticket_rows)} tickets, {embedding_source} embeddings, top {number_of_results}; search time excludes embedding the query")
+    print(f"{'method':>8} {'summary known-item':>18} {'details known-item':>18} {'same type':>9} {'search p50':>10} {'p99':>8}")
+    for method in ("vector", "lexical", "hybrid"):
+        known_item_recall = {}
+        search_seconds = []
+        for query_field in ("summary", "details"):
+            hits = 0
+            for ticket_index, query_text in enumerate(query_sets[query_field]):
+                search_started_at = time.perf_counter()
+                top_indices = _retrieve(method, bm25_index, search_backend, query_text, query_vectors[query_field][ticket_index], number_of_results, None)
+                search_seconds.append(time.perf_counter() - search_started_at)
+                hits += ticket_index in set(int(index) for index in top_indices)
+            known_item_recall[query_field] = hits / len(ticket_rows)
+        same_type_shares = []
+        candidate_mask = np.ones(len(ticket_rows), dtype=bool)
+        for ticket_index, query_text in enumerate(query_sets["full"]):
+            candidate_mask[ticket_index] = False
+            top_indices = _retrieve(method, bm25_index, search_backend, query_text, query_vectors["full"][ticket_index], number_of_results, candidate_mask)
+            candidate_mask[ticket_index] = True
+            if len(top_indices):
+                same_type_shares.append(np.mean(request_types[np.asarray(top_indices)] == request_types[ticket_index]))
+        search_milliseconds = np.array(search_seconds) * 1000
+        print(f"{method:>8} {known_item_recall['summary']:>18.3f} {known_item_recall['details']:>18.3f} {np.mean(same_type_shares):>9.3f} "
+              f"{np.percentile(search_milliseconds, 50):>7.2f} ms {np.percentile(search_milliseconds, 99):>5.2f} ms")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Recall and search time of vector, BM25 and hybrid retrieval over historical tickets")
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    argument_parser.add_argument("--embeddings", choices=("hashed", "openai"), default="hashed")
+    argument_parser.add_argument("--top", type=int, default=5)
+    arguments = argument_parser.parse_args()
+    evaluate(arguments.csv, arguments.embeddings, arguments.top)
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import os
+import numpy as np
+
+def _count_chat_usage(async_client):
+    """Wrap the stub's chat endpoint to count calls and tokens actually sent."""
+    chat_usage = {"calls": 0, "tokens": 0}
+    create_chat_completion = async_client.chat.completions.create
+
+    async def counted_create(**request_arguments):
+        response = await create_chat_completion(**request_arguments)
+        chat_usage["calls"] += 1
+        chat_usage["tokens"] += response.usage.total_tokens
+        return response
+
+    async_client.chat.completions.create = counted_create
+    return chat_usage
+
+def _repeated_request_texts(unique_texts, number_of_requests, repeat_fraction, random_generator):
+    """A request stream where repeat_fraction of requests re-send an earlier message (retries, duplicate deliveries)."""
+    request_texts = []
+    for request_number in range(number_of_requests):
+        if request_texts and random_generator.random() < repeat_fraction:
+            request_texts.append(request_texts[random_generator.integers(0, len(request_texts))])
+        else:
+            request_texts.append(unique_texts[request_number % len(unique_texts)])
+    return request_texts
+
+async def _run(request_texts, concurrency, chat_latency):
+    import llm_response_cache
+    from benchmarks.async_pipeline import run_async_path
+    from benchmarks.stub_openai import install_stub_clients
+
+    for cache_mode in ("off", "memory"):
+        llm_response_cache.LLM_RESPONSE_CACHE = cache_mode
+        llm_response_cache.set_llm_response_cache(None)
+        _, async_client = install_stub_clients(embedding_latency=0.05, chat_latency=chat_latency)
+        chat_usage = _count_chat_usage(async_client)
+        request_latencies, elapsed_seconds = await run_async_path(request_texts, concurrency)
+        latencies_ms = np.array(request_latencies) * 1000
+        llm_response_cache_instance = llm_response_cache.get_llm_response_cache()
+        hit_summary = ", ".join(
+            f"{call_site} {llm_response_cache_instance.hits[call_site]}/{llm_response_cache_instance.hits[call_site] + llm_response_cache_instance.misses[call_site]}"
+            for call_site in sorted(llm_response_cache_instance.misses)
+        ) if llm_response_cache_instance is not None else "-"
+        print(f"cache {cache_mode:>6}: p50 {np.percentile(latencies_ms, 50):7.1f} ms  p90 {np.percentile(latencies_ms, 90):7.1f} ms  "
+              f"chat calls {chat_usage['calls']:5d}  tokens {chat_usage['tokens']:8d}  hits {hit_summary}")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Latency and token spend with and without the LLM response cache")
+    argument_parser.add_argument("--requests", type=int, default=300)
+    argument_parser.add_argument("--repeat-fraction", type=float, default=0.3)
+    argument_parser.add_argument("--concurrency", type=int, default=20)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    os.environ.setdefault("LOCAL_CLASSIFIER_METHOD", "off")
+    from benchmarks.async_pipeline import _load_request_texts, _prepare_database
+    _prepare_database(arguments.csv)
+    request_texts = _repeated_request_texts(
+        _load_request_texts(arguments.csv, arguments.requests), arguments.requests, arguments.repeat_fraction, np.random.default_rng(0)
+    )
+    print(f"{arguments.requests} requests, {arguments.repeat_fraction:.0%} repeats, stub chat latency {arguments.chat_latency}s")
+    asyncio.run(_run(request_texts, arguments.concurrency, arguments.chat_latency))
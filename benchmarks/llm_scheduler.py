@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+import numpy as np
+
+class _StubRateLimitError(Exception):
+    status_code = 429
+    response = None
+
+def _inject_rate_limit_errors(async_client, error_rate, random_generator):
+    """Make a fraction of the stub's chat requests fail with a 429, and count the requests that reach it."""
+    api_requests = {"chat": 0, "rate_limited": 0}
+    create_chat_completion = async_client.chat.completions.create
+
+    async def flaky_create(**request_arguments):
+        api_requests["chat"] += 1
+        if random_generator.random() < error_rate:
+            api_requests["rate_limited"] += 1
+            raise _StubRateLimitError("Rate limit reached")
+        return await create_chat_completion(**request_arguments)
+
+    async_client.chat.completions.create = flaky_create
+    return api_requests
+
+def _install_scheduler(max_concurrent_requests):
+    import llm_scheduler
+    llm_scheduler.LLM_RETRY_BASE_SECONDS = 0.05
+    llm_scheduler._llm_scheduler = llm_scheduler.LLMScheduler(rate_limits={}, default_rate_limit=(0, 0), max_concurrent_requests=max_concurrent_requests)
+
+async def _interactive_latencies(request_texts, interactive_interval):
+    from main import MessageInput, process_incoming_message
+    request_latencies = []
+    for request_text in request_texts:
+        started_at = time.perf_counter()
+        await process_incoming_message(str(uuid.uuid4()), MessageInput(text=request_text))
+        request_latencies.append(time.perf_counter() - started_at)
+        await asyncio.sleep(interactive_interval)
+    return request_latencies
+
+async def run_priority_comparison(bulk_texts, interactive_texts, bulk_lane):
+    """Interactive /messages latency while a backlog batch runs in bulk_lane."""
+    import main
+    from llm_scheduler import llm_priority
+
+    async def run_backlog():
+        with llm_priority(bulk_lane):
+            async for _ in main.aprocess_message_batch([main.MessageBatchItem(text=bulk_text) for bulk_text in bulk_texts]):
+                pass
+
+    original_llm_priority, main.llm_priority = main.llm_priority, lambda lane: llm_priority(bulk_lane)
+    try:
+        backlog_task = asyncio.create_task(run_backlog())
+        await asyncio.sleep(0.5)
+        interactive_latencies = await _interactive_latencies(interactive_texts, 0.2)
+        await backlog_task
+    finally:
+        main.llm_priority = original_llm_priority
+    return interactive_latencies
+
+async def run_duplicate_posts(request_text, number_of_duplicates):
+    """The same message posted number_of_duplicates times at once, as Slack does on retried deliveries."""
+    from main import MessageInput, process_incoming_message
+    await asyncio.gather(*(process_incoming_message(str(uuid.uuid4()), MessageInput(text=request_text)) for _ in range(number_of_duplicates)))
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Priority lanes, request coalescing and 429 retries in the LLM scheduler")
+    argument_parser.add_argument("--bulk-messages", type=int, default=300)
+    argument_parser.add_argument("--interactive-messages", type=int, default=20)
+    argument_parser.add_argument("--max-concurrent-requests", type=int, default=8, help="Per-model cap, standing in for a tight rate limit")
+    argument_parser.add_argument("--rate-limit-error-rate", type=float, default=0.2)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    os.environ.setdefault("LLM_RESPONSE_CACHE", "off")
+    os.environ.setdefault("LOCAL_CLASSIFIER_METHOD", "off")
+    from benchmarks.async_pipeline import _load_request_texts, _prepare_database
+    from benchmarks.message_batch import _count_api_requests, _reset_caches
+    from benchmarks.stub_openai import install_stub_clients
+    _prepare_database(arguments.csv)
+    request_texts = _load_request_texts(arguments.csv, arguments.bulk_messages + arguments.interactive_messages)
+    bulk_texts, interactive_texts = request_texts[:arguments.bulk_messages], request_texts[arguments.bulk_messages:]
+
+    print(f"Backlog of {arguments.bulk_messages} messages with {arguments.interactive_messages} interactive messages alongside, "
+          f"{arguments.max_concurrent_requests} concurrent requests per model, chat latency {arguments.chat_latency}s")
+    for bulk_lane in ("interactive", "bulk"):
+        _reset_caches()
+        _install_scheduler(arguments.max_concurrent_requests)
+        install_stub_clients(0.05, arguments.chat_latency)
+        interactive_latencies_ms = np.array(asyncio.run(run_priority_comparison(bulk_texts, interactive_texts, bulk_lane))) * 1000
+        print(f"  backlog in {bulk_lane:>11} lane: interactive p50 {np.percentile(interactive_latencies_ms, 50):7.0f} ms  "
+              f"p95 {np.percentile(interactive_latencies_ms, 95):7.0f} ms")
+
+    _reset_caches()
+    _install_scheduler(arguments.max_concurrent_requests)
+    _, async_client = install_stub_clients(0.05, arguments.chat_latency)
+    api_requests = _count_api_requests(async_client)
+    asyncio.run(run_duplicate_posts(interactive_texts[0], 10))
+    print(f"10 identical concurrent posts: {api_requests['embeddings']} embedding requests, {api_requests['chat']} chat requests sent")
+
+    _reset_caches()
+    _install_scheduler(arguments.max_concurrent_requests)
+    _, async_client = install_stub_clients(0.05, arguments.chat_latency)
+    api_requests = _inject_rate_limit_errors(async_client, arguments.rate_limit_error_rate, random.Random(0))
+    started_at = time.perf_counter()
+    from benchmarks.async_pipeline import run_async_path
+    request_latencies, _ = asyncio.run(run_async_path(interactive_texts * 5, 20))
+    print(f"{len(request_latencies)} messages with {arguments.rate_limit_error_rate:.0%} of chat requests rate limited: all succeeded, "
+          f"{api_requests['rate_limited']} 429s retried, {time.perf_counter() - started_at:.1f} s")
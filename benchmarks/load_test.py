@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+def _free_port():
+    with socket.socket() as probe_socket:
+        probe_socket.bind(("127.0.0.1", 0))
+        return probe_socket.getsockname()[1]
+
+def _post_json(url, payload=None, timeout=120):
+    http_request = urllib.request.Request(url, data=json.dumps(payload or {}).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(http_request, timeout=timeout) as http_response:
+        return json.loads(http_response.read())
+
+def _wait_until_serving(url, server_process, timeout_seconds=120):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        if server_process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server_process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up within {timeout_seconds}s")
+
+def _database_size_bytes(database_path):
+    # Fold the WAL back into the main file first, otherwise its preallocated pages count as growth.
+    with sqlite3.connect(database_path) as database_connection:
+        database_connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return sum(os.path.getsize(path) for path in (database_path, f"{database_path}-wal") if os.path.exists(path))
+
+def _percentiles(values):
+    return np.percentile(np.asarray(values, dtype=float), [50, 95, 99]) if len(values) else (float("nan"),) * 3
+
+def _reply_with_fields(missing_fields, remaining_reply_turns):
+    """Answer roughly an even share of the fields the bot asked for, all of them on the last reply."""
+    fields_to_answer = missing_fields[:max(1, -(-len(missing_fields) // remaining_reply_turns))]
+    return " ".join(f"{field_name}: see the attached ticket." for field_name in fields_to_answer)
+
+def _run_thread(app_url, synthetic_thread):
+    thread_id = _post_json(f"{app_url}/threads")["thread_id"]
+    message_results = []
+    message_text = synthetic_thread["opening_message"]
+    for remaining_reply_turns in range(synthetic_thread["reply_turns"], -1, -1):
+        started_at = time.perf_counter()
+        message_response = _post_json(f"{app_url}/threads/{thread_id}/messages?include_timings=true", {"text": message_text})
+        message_results.append((time.perf_counter() - started_at, message_response["timings"]))
+        if not message_response["missing_fields"] or remaining_reply_turns == 0:
+            break
+        message_text = _reply_with_fields(message_response["missing_fields"], remaining_reply_turns)
+    return message_results
+
+def run_load_test(app_url, synthetic_threads, concurrency):
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        thread_results = list(executor.map(lambda synthetic_thread: _run_thread(app_url, synthetic_thread), synthetic_threads))
+    elapsed_seconds = time.perf_counter() - started_at
+    return [message_result for thread_result in thread_results for message_result in thread_result], elapsed_seconds
+
+def report_load_test(message_results, elapsed_seconds, number_of_threads, database_bytes_before, database_bytes_after):
+    client_latencies_ms = [client_seconds * 1000 for client_seconds, _ in message_results]
+    stage_latencies_ms = {}
+    for _, message_timings in message_results:
+        for stage, stage_milliseconds in message_timings["stages_ms"].items():
+            stage_latencies_ms.setdefault(stage, []).append(stage_milliseconds)
+    number_of_messages = len(message_results)
+
+    print(f"{number_of_threads} threads, {number_of_messages} messages in {elapsed_seconds:.1f} s: "
+          f"{number_of_messages / elapsed_seconds:.1f} messages/s, {number_of_threads / elapsed_seconds:.1f} threads/s")
+    print(f"{'stage':>22} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    print(f"{'end-to-end (client)':>22} {number_of_messages:6d} " + " ".join(f"{value:9.1f}" for value in _percentiles(client_latencies_ms)))
+    print(f"{'server total':>22} {number_of_messages:6d} " + " ".join(
+        f"{value:9.1f}" for value in _percentiles([message_timings["total_ms"] for _, message_timings in message_results])
+    ))
+    for stage, stage_values in sorted(stage_latencies_ms.items()):
+        print(f"{stage:>22} {len(stage_values):6d} " + " ".join(f"{value:9.1f}" for value in _percentiles(stage_values)))
+    print(f"LLM calls per message {np.mean([message_timings['llm_calls'] for _, message_timings in message_results]):.2f}, "
+          f"tokens per message {np.mean([message_timings['llm_tokens'] for _, message_timings in message_results]):.0f}, "
+          f"DB sessions per message {np.mean([message_timings['db_sessions'] for _, message_timings in message_results]):.2f}")
+    database_growth = database_bytes_after - database_bytes_before
+    print(f"DB size {database_bytes_before / 1e6:.2f} MB -> {database_bytes_after / 1e6:.2f} MB "
+          f"(+{database_growth / 1e3:.0f} kB, {database_growth / max(number_of_messages, 1):.0f} bytes/message)")
+
+def run_find_similar_microbenchmark(corpus_sizes, number_of_queries=200):
+    """find_similar_historical_tickets against an in-memory index of synthetic tickets, per corpus size."""
+    import vector_index
+    from benchmarks.synthetic_data import generate_clustered_embeddings
+    from llm_service import find_similar_historical_tickets
+
+    random_generator = np.random.default_rng(0)
+    vector_index.FINGERPRINT_CHECK_INTERVAL_SECONDS = float("inf")
+    print(f"{'tickets':>8} {'backend':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'filtered p50 ms':>16}")
+    for number_of_tickets in corpus_sizes:
+        embedding_matrix, topic_assignments = generate_clustered_embeddings(number_of_tickets + number_of_queries, 50, random_generator)
+        request_types = [f"Type {topic % 8}" for topic in topic_assignments[:number_of_tickets]]
+        ticket_metadata = [
+            {'request_summary': f"Synthetic ticket {ticket_index}", 'request_type': request_type, 'fields_provided': "",
+             'security_risk_score': 50, 'outcome': "Approved"}
+            for ticket_index, request_type in enumerate(request_types)
+        ]
+        historical_ticket_index = vector_index.HistoricalTicketIndex(embedding_matrix[:number_of_tickets], ticket_metadata)
+        vector_index._historical_ticket_index = historical_ticket_index
+        vector_index._index_is_stale = False
+        query_embeddings = embedding_matrix[number_of_tickets:]
+
+        def timed_queries(request_type=None):
+            query_latencies_ms = []
+            for query_embedding in query_embeddings:
+                started_at = time.perf_counter()
+                find_similar_historical_tickets("", number_of_tickets_to_retrieve=5, request_type=request_type, query_embedding=query_embedding)
+                query_latencies_ms.append((time.perf_counter() - started_at) * 1000)
+            return query_latencies_ms
+
+        timed_queries()
+        p50, p95, p99 = _percentiles(timed_queries())
+        filtered_p50 = _percentiles(timed_queries(request_type="Type 3"))[0]
+        backend_name = type(historical_ticket_index.search_backend).__name__.replace("SearchBackend", "").lower()
+        print(f"{number_of_tickets:>8} {backend_name:>8} {p50:8.3f} {p95:8.3f} {p99:8.3f} {filtered_p50:16.3f}")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Load-test the FastAPI app against a local fake OpenAI API")
+    argument_parser.add_argument("--threads", type=int, default=200, help="Synthetic conversations to run")
+    argument_parser.add_argument("--max-turns", type=int, default=3)
+    argument_parser.add_argument("--concurrency", type=int, default=20)
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    argument_parser.add_argument("--micro-sizes", type=int, nargs="*", default=[1000, 10000, 100000],
+                                 help="Corpus sizes for the find_similar_historical_tickets micro-benchmark (none to skip)")
+    arguments = argument_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    database_path = f"{working_directory}/load_test.db"
+    fake_openai_port, app_port = _free_port(), _free_port()
+    server_environment = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{database_path}",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_openai_port}/v1",
+        OPENAI_API_KEY="fake-key"
+    )
+    os.environ.update({key: server_environment[key] for key in ("DATABASE_URL", "OPENAI_BASE_URL", "OPENAI_API_KEY")})
+
+    fake_openai_process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(fake_openai_port),
+        "--embedding-latency", str(arguments.embedding_latency), "--chat-latency", str(arguments.chat_latency)
+    ], env=server_environment)
+    app_process = None
+    try:
+        subprocess.run([sys.executable, "-c", f"from initialize import initialize_database, load_historical_tickets_from_csv; "
+                        f"initialize_database(); load_historical_tickets_from_csv({arguments.csv!r})"],
+                       env=server_environment, check=True, stdout=subprocess.DEVNULL)
+        app_process = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"
+        ], env=server_environment)
+        app_url = f"http://127.0.0.1:{app_port}"
+        _wait_until_serving(f"{app_url}/metrics", app_process)
+
+        from benchmarks.synthetic_data import generate_synthetic_threads
+        synthetic_threads = generate_synthetic_threads(arguments.threads, arguments.csv, arguments.max_turns)
+        print(f"Fake OpenAI latency: embeddings {arguments.embedding_latency}s, chat {arguments.chat_latency}s; concurrency {arguments.concurrency}")
+        database_bytes_before = _database_size_bytes(database_path)
+        message_results, elapsed_seconds = run_load_test(app_url, synthetic_threads, arguments.concurrency)
+        report_load_test(message_results, elapsed_seconds, len(synthetic_threads), database_bytes_before, _database_size_bytes(database_path))
+    finally:
+        for server_process in (app_process, fake_openai_process):
+            if server_process is not None:
+                server_process.terminate()
+                server_process.wait()
+
+    if arguments.micro_sizes:
+        print()
+        run_find_similar_microbenchmark(arguments.micro_sizes)
@@ -0,0 +1,60 @@
+import argparse
+import csv
+import hashlib
+import re
+import numpy as np
+from request_classifier import LocalRequestClassifier
+
+HASHED_EMBEDDING_DIMENSIONS = 1536
+CONFIDENCE_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+def _hashed_bag_of_words(texts):
+    """Offline stand-in for text-embedding-3-small: log-scaled hashed token counts."""
+    embedding_matrix = np.zeros((len(texts), HASHED_EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for text_index, text in enumerate(texts):
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            embedding_matrix[text_index, int(hashlib.md5(token.encode()).hexdigest()[:8], 16) % HASHED_EMBEDDING_DIMENSIONS] += 1
+    return np.log1p(embedding_matrix)
+
+def _openai_embeddings(texts):
+    from embedding_cache import create_embeddings
+    return np.array(create_embeddings(texts), dtype=np.float32)
+
+def evaluate(csv_file_path, embedding_source, query_field="full", number_of_folds=5):
+    with open(csv_file_path, newline="", encoding="utf-8") as csv_file:
+        ticket_rows = list(csv.DictReader(csv_file))
+    request_types = np.array([row['request_type'] for row in ticket_rows])
+    stored_texts = [f"{row['request_type']}: {row['request_summary']}\n{row['details']}" for row in ticket_rows]
+    if query_field == "summary":
+        query_texts = [row['request_summary'] for row in ticket_rows]
+    else:
+        query_texts = [f"{row['request_summary']}\n{row['details']}" for row in ticket_rows]
+    embed = _openai_embeddings if embedding_source == "openai" else _hashed_bag_of_words
+    stored_embeddings, query_embeddings = embed(stored_texts), embed(query_texts)
+
+    fold_assignments = np.random.default_rng(0).integers(0, number_of_folds, len(ticket_rows))
+    print(f"{len(ticket_rows)} tickets, {len(set(request_types))} request types, {number_of_folds}-fold, {embedding_source} embeddings, {query_field} queries")
+    print(f"{'method':>8} {'threshold':>9} {'hit rate':>9} {'fast-path acc':>13} {'local acc':>9}")
+    for method in ("knn", "centroid"):
+        predictions, confidences = [], []
+        for fold in range(number_of_folds):
+            training_rows = fold_assignments != fold
+            local_request_classifier = LocalRequestClassifier(stored_embeddings[training_rows], request_types[training_rows], method=method)
+            for query_index in np.flatnonzero(~training_rows):
+                predicted_type, confidence = local_request_classifier.classify(query_embeddings[query_index])
+                predictions.append(predicted_type == request_types[query_index])
+                confidences.append(confidence)
+        predictions, confidences = np.array(predictions), np.array(confidences)
+        for confidence_threshold in CONFIDENCE_THRESHOLDS:
+            fast_path = confidences >= confidence_threshold
+            fast_path_accuracy = predictions[fast_path].mean() if fast_path.any() else float("nan")
+            print(f"{method:>8} {confidence_threshold:>9.1f} {fast_path.mean():>9.3f} {fast_path_accuracy:>13.3f} {predictions.mean():>9.3f}")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Fast-path hit rate and accuracy of the local request classifier")
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    argument_parser.add_argument("--embeddings", choices=("hashed", "openai"), default="hashed")
+    argument_parser.add_argument("--query-field", choices=("full", "summary"), default="full",
+                                 help="Query with summary and details, or the one-line summary only")
+    arguments = argument_parser.parse_args()
+    evaluate(arguments.csv, arguments.embeddings, arguments.query_field)
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import time
+import numpy as np
+
+def _count_api_requests(async_client):
+    """Wrap the stub's endpoints to count requests actually sent."""
+    api_requests = {"embeddings": 0, "chat": 0}
+    create_embeddings, create_chat_completion = async_client.embeddings.create, async_client.chat.completions.create
+
+    async def counted_create_embeddings(**request_arguments):
+        api_requests["embeddings"] += 1
+        return await create_embeddings(**request_arguments)
+
+    async def counted_create_chat_completion(**request_arguments):
+        api_requests["chat"] += 1
+        return await create_chat_completion(**request_arguments)
+
+    async_client.embeddings.create = counted_create_embeddings
+    async_client.chat.completions.create = counted_create_chat_completion
+    return api_requests
+
+def _reset_caches():
+    import embedding_cache
+    from llm_response_cache import set_llm_response_cache
+    embedding_cache._embedding_cache = None
+    set_llm_response_cache(None)
+
+async def run_batch_path(request_texts):
+    from main import MessageBatchItem, aprocess_message_batch
+
+    started_at = time.perf_counter()
+    first_result_seconds = None
+    async for _ in aprocess_message_batch([MessageBatchItem(text=request_text) for request_text in request_texts]):
+        first_result_seconds = first_result_seconds or time.perf_counter() - started_at
+    return first_result_seconds, time.perf_counter() - started_at
+
+def compare_retrieval(number_of_queries):
+    from vector_index import get_historical_ticket_index
+    historical_ticket_index = get_historical_ticket_index()
+    query_embeddings = np.random.default_rng(0).standard_normal((number_of_queries, historical_ticket_index.embedding_matrix.shape[1]))
+
+    started_at = time.perf_counter()
+    for query_embedding in query_embeddings:
+        historical_ticket_index.search(query_embedding, 5)
+    one_at_a_time_seconds = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    historical_ticket_index.search_many(query_embeddings, 5)
+    return one_at_a_time_seconds, time.perf_counter() - started_at
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Backlog ingestion: one request per message versus the batch pipeline")
+    argument_parser.add_argument("--messages", type=int, default=1000)
+    argument_parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests for the per-message path")
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    from benchmarks.async_pipeline import _load_request_texts, _prepare_database, run_async_path
+    from benchmarks.stub_openai import install_stub_clients
+    from write_behind import flush_write_behind
+    _prepare_database(arguments.csv)
+    request_texts = _load_request_texts(arguments.csv, arguments.messages)
+    print(f"{arguments.messages} messages, stub latency: embeddings {arguments.embedding_latency}s, chat {arguments.chat_latency}s")
+
+    _reset_caches()
+    _, async_client = install_stub_clients(arguments.embedding_latency, arguments.chat_latency)
+    api_requests = _count_api_requests(async_client)
+    _, elapsed_seconds = asyncio.run(run_async_path(request_texts, arguments.concurrency))
+    flush_write_behind()
+    print(f"per message: {arguments.messages / elapsed_seconds:7.1f} msg/s  {elapsed_seconds:6.1f} s  "
+          f"embedding requests {api_requests['embeddings']:5d}  chat requests {api_requests['chat']:5d}")
+
+    _reset_caches()
+    _, async_client = install_stub_clients(arguments.embedding_latency, arguments.chat_latency)
+    api_requests = _count_api_requests(async_client)
+    first_result_seconds, elapsed_seconds = asyncio.run(run_batch_path(request_texts))
+    flush_write_behind()
+    print(f"      batch: {arguments.messages / elapsed_seconds:7.1f} msg/s  {elapsed_seconds:6.1f} s  "
+          f"embedding requests {api_requests['embeddings']:5d}  chat requests {api_requests['chat']:5d}  "
+          f"first result after {first_result_seconds:.2f} s")
+
+    one_at_a_time_seconds, batched_seconds = compare_retrieval(arguments.messages)
+    print(f"retrieval for {arguments.messages} queries: {one_at_a_time_seconds * 1000:.1f} ms one at a time, "
+          f"{batched_seconds * 1000:.1f} ms with search_many")
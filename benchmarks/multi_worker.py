@@ -0,0 +1,111 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from benchmarks.load_test import _free_port, _wait_until_serving, run_load_test
+
+def _child_process_ids(parent_process_id):
+    try:
+        with open(f"/proc/{parent_process_id}/task/{parent_process_id}/children") as children_file:
+            return [int(process_id) for process_id in children_file.read().split()]
+    except OSError:
+        return []
+
+def _memory_kilobytes(process_id):
+    """RSS, PSS (shared pages split between the processes mapping them) and private memory, from smaps_rollup."""
+    memory_fields = {}
+    with open(f"/proc/{process_id}/smaps_rollup") as smaps_file:
+        for smaps_line in smaps_file:
+            field_name, _, field_value = smaps_line.partition(":")
+            if field_value.strip().endswith("kB"):
+                memory_fields[field_name] = int(field_value.split()[0])
+    return memory_fields["Rss"], memory_fields["Pss"], memory_fields["Private_Clean"] + memory_fields["Private_Dirty"]
+
+def _wait_until_all_workers_ready(app_url, number_of_workers, timeout_seconds=300):
+    """/ready is answered by whichever worker accepts the connection, so require a run of consecutive 200s."""
+    deadline = time.monotonic() + timeout_seconds
+    consecutive_ready = 0
+    while consecutive_ready < 4 * number_of_workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{app_url} workers did not all become ready within {timeout_seconds}s")
+        try:
+            with urllib.request.urlopen(f"{app_url}/ready", timeout=5):
+                consecutive_ready += 1
+        except (urllib.error.HTTPError, OSError):
+            consecutive_ready = 0
+            time.sleep(0.1)
+
+def measure_workers(server_environment, number_of_workers, synthetic_threads, concurrency):
+    app_port = _free_port()
+    app_url = f"http://127.0.0.1:{app_port}"
+    launch_started_at = time.perf_counter()
+    launcher_process = subprocess.Popen([
+        sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(app_port), "--workers", str(number_of_workers)
+    ], env=server_environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_serving(f"{app_url}/metrics", launcher_process)
+        _wait_until_all_workers_ready(app_url, number_of_workers)
+        ready_seconds = time.perf_counter() - launch_started_at
+        message_results, elapsed_seconds = run_load_test(app_url, synthetic_threads, concurrency)
+        worker_process_ids = _child_process_ids(launcher_process.pid) if number_of_workers > 1 else [launcher_process.pid]
+        # uvicorn's multiprocess supervisor also runs a resource tracker child; workers are the ones serving Python.
+        worker_memory = [_memory_kilobytes(process_id) for process_id in worker_process_ids]
+        worker_memory = sorted(worker_memory, reverse=True)[:number_of_workers]
+        return ready_seconds, len(message_results) / elapsed_seconds, worker_memory
+    finally:
+        launcher_process.terminate()
+        launcher_process.wait()
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Per-worker memory and aggregate throughput as uvicorn workers scale")
+    argument_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    argument_parser.add_argument("--tickets", type=int, default=50000)
+    argument_parser.add_argument("--threads", type=int, default=200, help="Synthetic conversations per run")
+    argument_parser.add_argument("--concurrency", type=int, default=32)
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.3)
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    fake_openai_port = _free_port()
+    server_environment = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{working_directory}/multi_worker.db",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_openai_port}/v1",
+        OPENAI_API_KEY="fake-key",
+        LLM_RESPONSE_CACHE="off"
+    )
+    fake_openai_process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(fake_openai_port),
+        "--embedding-latency", str(arguments.embedding_latency), "--chat-latency", str(arguments.chat_latency)
+    ], env=server_environment, stdout=subprocess.DEVNULL)
+    try:
+        from benchmarks.synthetic_data import generate_synthetic_threads, write_synthetic_ticket_csv
+        ticket_csv_path = f"{working_directory}/tickets.csv"
+        write_synthetic_ticket_csv(ticket_csv_path, arguments.tickets, arguments.csv)
+        subprocess.run([sys.executable, "-c", f"from initialize import initialize_database, load_historical_tickets_from_csv; "
+                        f"initialize_database(); load_historical_tickets_from_csv({ticket_csv_path!r})"],
+                       env=server_environment, check=True, stdout=subprocess.DEVNULL)
+        synthetic_threads = generate_synthetic_threads(arguments.threads, arguments.csv)
+        print(f"{arguments.tickets} historical tickets, {arguments.threads} threads at concurrency {arguments.concurrency}, "
+              f"{os.cpu_count()} CPUs; memory per worker in MB")
+        for index_source, snapshot_path in (("snapshot", None), ("database", "off")):
+            run_environment = server_environment if snapshot_path is None else dict(server_environment, INDEX_SNAPSHOT_PATH=snapshot_path)
+            for number_of_workers in arguments.workers:
+                try:
+                    ready_seconds, messages_per_second, worker_memory = measure_workers(run_environment, number_of_workers, synthetic_threads, arguments.concurrency)
+                except Exception as run_error:
+                    print(f"{index_source:>8} index, {number_of_workers} workers: failed ({run_error})")
+                    continue
+                rss, pss, private = (max(memory[field] for memory in worker_memory) / 1024 for field in range(3))
+                total_pss = sum(memory[1] for memory in worker_memory) / 1024
+                print(f"{index_source:>8} index, {number_of_workers} workers: ready {ready_seconds:5.1f} s  {messages_per_second:6.1f} msg/s  "
+                      f"RSS {rss:6.0f}  PSS {pss:6.0f}  private {private:6.0f}  total PSS {total_pss:6.0f}")
+    finally:
+        fake_openai_process.terminate()
+        fake_openai_process.wait()
@@ -0,0 +1,51 @@
+import argparse
+import numpy as np
+from embedding_store import decode_embedding_matrix, encode_embedding
+from ann_index import normalize_rows, top_k_indices
+from benchmarks.synthetic_data import generate_clustered_embeddings
+
+def _load_database_embeddings():
+    from vector_index import build_historical_ticket_index
+    return build_historical_ticket_index().embedding_matrix
+
+def _top_k_positions(embedding_matrix, query_embeddings, number_of_results):
+    similarity_scores = normalize_rows(query_embeddings) @ normalize_rows(embedding_matrix).T
+    return [set(top_k_indices(query_scores, number_of_results).tolist()) for query_scores in similarity_scores]
+
+def measure_quantized_recall(embedding_matrix, number_of_queries=200, number_of_results=5, random_generator=None):
+    random_generator = random_generator or np.random.default_rng(0)
+    encoded_embeddings = [encode_embedding(embedding, "int8") for embedding in embedding_matrix]
+    quantized_matrix = decode_embedding_matrix(
+        [blob for blob, _ in encoded_embeddings], [scale for _, scale in encoded_embeddings]
+    )
+    query_positions = random_generator.choice(len(embedding_matrix), size=number_of_queries, replace=False)
+    query_embeddings = embedding_matrix[query_positions] + random_generator.standard_normal(
+        (number_of_queries, embedding_matrix.shape[1])
+    ).astype(np.float32) * float(np.abs(embedding_matrix).mean())
+
+    expected_results = _top_k_positions(embedding_matrix, query_embeddings, number_of_results)
+    quantized_results = _top_k_positions(quantized_matrix, query_embeddings, number_of_results)
+    recall = np.mean([
+        len(expected & actual) / number_of_results for expected, actual in zip(expected_results, quantized_results)
+    ])
+
+    float32_bytes = embedding_matrix.shape[0] * embedding_matrix.shape[1] * 4
+    int8_bytes = sum(len(blob) + 8 for blob, _ in encoded_embeddings)
+    return recall, float32_bytes, int8_bytes
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Report int8 embedding ranking recall against float32")
+    argument_parser.add_argument("--from-database", action="store_true", help="Use embeddings stored in acme_bot.db")
+    argument_parser.add_argument("--tickets", type=int, default=10000)
+    argument_parser.add_argument("--top-k", type=int, default=5)
+    arguments = argument_parser.parse_args()
+
+    if arguments.from_database:
+        embedding_matrix = _load_database_embeddings()
+    else:
+        embedding_matrix, _ = generate_clustered_embeddings(arguments.tickets, 7, np.random.default_rng(0))
+
+    recall, float32_bytes, int8_bytes = measure_quantized_recall(embedding_matrix, number_of_results=arguments.top_k)
+    print(f"tickets: {len(embedding_matrix)}")
+    print(f"int8 recall@{arguments.top_k} vs float32: {recall:.3f}")
+    print(f"float32 storage: {float32_bytes / 1e6:.1f} MB, int8 storage: {int8_bytes / 1e6:.1f} MB")
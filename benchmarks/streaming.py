@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.load_test import _free_port, _percentiles, _post_json, _wait_until_serving
+
+def _time_blocking_message(app_url, message_text):
+    thread_id = _post_json(f"{app_url}/threads")["thread_id"]
+    started_at = time.perf_counter()
+    message_response = _post_json(f"{app_url}/threads/{thread_id}/messages", {"text": message_text})
+    elapsed_seconds = time.perf_counter() - started_at
+    # Nothing reaches the user before the whole response does.
+    return {"first_byte": elapsed_seconds, "first_token": elapsed_seconds, "complete": elapsed_seconds, "decided": message_response["final_decision"] is not None}
+
+def _time_streamed_message(app_url, message_text):
+    thread_id = _post_json(f"{app_url}/threads")["thread_id"]
+    http_request = urllib.request.Request(
+        f"{app_url}/threads/{thread_id}/messages/stream", data=json.dumps({"text": message_text}).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    started_at = time.perf_counter()
+    event_times = {}
+    with urllib.request.urlopen(http_request, timeout=120) as http_response:
+        for event_line in http_response:
+            message_event = json.loads(event_line)
+            event_times.setdefault("first_byte", time.perf_counter() - started_at)
+            if message_event["event"] == "token":
+                event_times.setdefault("first_token", time.perf_counter() - started_at)
+            elif message_event["event"] == "error":
+                raise RuntimeError(message_event["error"])
+            elif message_event["event"] == "result":
+                event_times["decided"] = message_event["final_decision"] is not None
+    event_times["complete"] = time.perf_counter() - started_at
+    event_times.setdefault("first_token", event_times["complete"])
+    return event_times
+
+def run_endpoint(time_message, app_url, message_texts, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda message_text: time_message(app_url, message_text), message_texts))
+
+def run_alternating(app_url, message_texts, concurrency, number_of_rounds):
+    """Timings per endpoint, measured in rounds that alternate which endpoint goes first.
+
+    Neither endpoint then always runs against the colder server or the fuller database.
+    """
+    endpoint_timings = {time_message: [] for time_message in (_time_blocking_message, _time_streamed_message)}
+    round_size = -(-len(message_texts) // number_of_rounds)
+    for round_index, start_index in enumerate(range(0, len(message_texts), round_size)):
+        round_endpoints = list(endpoint_timings) if round_index % 2 == 0 else list(reversed(endpoint_timings))
+        for time_message in round_endpoints:
+            endpoint_timings[time_message].extend(run_endpoint(time_message, app_url, message_texts[start_index:start_index + round_size], concurrency))
+    return endpoint_timings[_time_blocking_message], endpoint_timings[_time_streamed_message]
+
+def report_endpoint(endpoint_name, message_timings):
+    print(f"{endpoint_name} ({sum(timing['decided'] for timing in message_timings)} of {len(message_timings)} decided)")
+    for measurement in ("first_byte", "first_token", "complete"):
+        p50, p95, _ = _percentiles([timing[measurement] * 1000 for timing in message_timings])
+        print(f"  {measurement:>11}: p50 {p50:7.0f} ms  p95 {p95:7.0f} ms")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Time to first byte of /threads/{id}/messages versus its streaming variant")
+    argument_parser.add_argument("--messages", type=int, default=100)
+    argument_parser.add_argument("--concurrency", type=int, default=8)
+    argument_parser.add_argument("--warm-up-messages", type=int, default=8, help="Untimed messages sent to each endpoint first")
+    argument_parser.add_argument("--rounds", type=int, default=4, help="Measurement rounds, alternating which endpoint goes first")
+    argument_parser.add_argument("--embedding-latency", type=float, default=0.05)
+    argument_parser.add_argument("--chat-latency", type=float, default=0.6)
+    argument_parser.add_argument("--all-fields-provided", action="store_true", help="Every message goes straight to a decision instead of a follow-up question")
+    argument_parser.add_argument("--csv", default="data/acme_security_tickets.csv")
+    arguments = argument_parser.parse_args()
+
+    working_directory = tempfile.mkdtemp()
+    fake_openai_port, app_port = _free_port(), _free_port()
+    server_environment = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{working_directory}/streaming.db",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_openai_port}/v1",
+        OPENAI_API_KEY="fake-key",
+        LLM_RESPONSE_CACHE="off"
+    )
+    fake_openai_process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(fake_openai_port),
+        "--embedding-latency", str(arguments.embedding_latency), "--chat-latency", str(arguments.chat_latency)
+    ] + (["--all-fields-provided"] if arguments.all_fields_provided else []), env=server_environment)
+    app_process = None
+    try:
+        subprocess.run([sys.executable, "-c", f"from initialize import initialize_database, load_historical_tickets_from_csv; "
+                        f"initialize_database(); load_historical_tickets_from_csv({arguments.csv!r})"],
+                       env=server_environment, check=True, stdout=subprocess.DEVNULL)
+        app_process = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"
+        ], env=server_environment)
+        app_url = f"http://127.0.0.1:{app_port}"
+        # /ready only answers 200 once the lifespan warm-up has loaded the index and caches.
+        _wait_until_serving(f"{app_url}/ready", app_process)
+
+        from benchmarks.synthetic_data import generate_synthetic_threads
+        synthetic_threads = generate_synthetic_threads(arguments.messages + arguments.warm_up_messages, arguments.csv, 1)
+        message_texts = [synthetic_thread["opening_message"] for synthetic_thread in synthetic_threads]
+        warm_up_texts, message_texts = message_texts[:arguments.warm_up_messages], message_texts[arguments.warm_up_messages:]
+        for time_message in (_time_blocking_message, _time_streamed_message):
+            run_endpoint(time_message, app_url, warm_up_texts, arguments.concurrency)
+        print(f"{arguments.messages} messages in {arguments.rounds} alternating rounds after {arguments.warm_up_messages} warm-up messages "
+              f"per endpoint, concurrency {arguments.concurrency}, fake OpenAI latency: "
+              f"embeddings {arguments.embedding_latency}s, chat {arguments.chat_latency}s")
+        blocking_timings, streamed_timings = run_alternating(app_url, message_texts, arguments.concurrency, arguments.rounds)
+        report_endpoint("POST /threads/{id}/messages", blocking_timings)
+        report_endpoint("POST /threads/{id}/messages/stream", streamed_timings)
+    finally:
+        for server_process in (app_process, fake_openai_process):
+            if server_process is not None:
+                server_process.terminate()
+                server_process.wait()
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+import types
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+
+def _deterministic_embedding(text):
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32).tolist()
+
+def _canned_chat_content(prompt, response_format, require_field_mentions=False):
+    if response_format is None:
+        if "Classify this request" in prompt:
+            example_types = re.findall(r"' : (.+)", prompt) or re.findall(r"most similar past tickets: (.+?) \d+%", prompt)
+            return example_types[0].strip() if example_types else "Permission Change"
+        return "Could you share the missing details so I can finish reviewing this request?"
+    if "security decision engine" in prompt:
+        return json.dumps({"decision": "Approved", "rationale": "Matches approved historical cases.", "risk_score": 42, "confidence_score": 0.8})
+    if "Classify this request and extract" in prompt:
+        required_fields_by_type = dict(re.findall(r"^- (.+?): (.*)$", prompt, re.M))
+        similar_types = re.findall(r"most similar past tickets: (.+?) \d+%", prompt)
+        request_type = similar_types[0] if similar_types else next(iter(required_fields_by_type), "Permission Change")
+        request_text = re.search(r"^Request: (.*?)\nReply in JSON", prompt, re.S | re.M)
+        request_text = request_text.group(1).lower() if request_text else ""
+        return json.dumps({
+            "request_type": request_type,
+            "fields": {
+                field_name: "provided" if not require_field_mentions or field_name.lower() in request_text else "MISSING"
+                for field_name in (field.strip() for field in required_fields_by_type.get(request_type, "").split(";")) if field_name
+            },
+            "requested_access": "AWS admin access"
+        })
+    if "Extract information" in prompt:
+        required_fields = re.search(r"Required fields: (.*)", prompt)
+        field_names = [field.strip() for field in required_fields.group(1).split(",") if field.strip()] if required_fields else []
+        request_text = re.search(r"Request: (.*?)\n\s*Required fields:", prompt, re.S)
+        request_text = request_text.group(1).lower() if request_text else ""
+        extracted_fields = {
+            field_name: "provided" if not require_field_mentions or field_name.lower() in request_text else "MISSING"
+            for field_name in field_names
+        }
+        extracted_fields["requested_access"] = "AWS admin access"
+        return json.dumps(extracted_fields)
+    return json.dumps({"patterns_detected": [], "common_risk_factors": [], "recommendations": [], "alert_level": "low"})
+
+def _usage(prompt, completion):
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(completion) // 4
+    return types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+
+def _embedding_response(texts):
+    return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=_deterministic_embedding(text)) for text in texts])
+
+def _chat_response(messages, response_format):
+    prompt = messages[-1]["content"]
+    content = _canned_chat_content(prompt, response_format)
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+        usage=_usage(prompt, content)
+    )
+
+class StubOpenAI:
+    """Blocking stand-in for OpenAI with fixed latencies, deterministic embeddings and canned JSON."""
+
+    def __init__(self, embedding_latency=0.05, chat_latency=0.3):
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.embeddings = types.SimpleNamespace(create=self._create_embeddings)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create_chat_completion))
+
+    def _create_embeddings(self, model, input, **kwargs):
+        time.sleep(self.embedding_latency)
+        return _embedding_response([input] if isinstance(input, str) else input)
+
+    def _create_chat_completion(self, model, messages, response_format=None, **kwargs):
+        time.sleep(self.chat_latency)
+        return _chat_response(messages, response_format)
+
+class AsyncStubOpenAI(StubOpenAI):
+    async def _create_embeddings(self, model, input, **kwargs):
+        await asyncio.sleep(self.embedding_latency)
+        return _embedding_response([input] if isinstance(input, str) else input)
+
+    async def _create_chat_completion(self, model, messages, response_format=None, **kwargs):
+        await asyncio.sleep(self.chat_latency)
+        return _chat_response(messages, response_format)
+
+def install_stub_clients(embedding_latency=0.05, chat_latency=0.3):
+    import utils
+    utils._openai_client = StubOpenAI(embedding_latency, chat_latency)
+    utils._async_openai_client = AsyncStubOpenAI(embedding_latency, chat_latency)
+    return utils._openai_client, utils._async_openai_client
@@ -0,0 +1,86 @@
+from conversation_state import compact_conversation_state, load_conversation_state, save_conversation_state
+from embedding_cache import INCREMENTAL_THREAD_EMBEDDINGS, commit_thread_embedding, create_embedding, embed_conversation_turn
+from llm_service import (
+    analyze_security_request, extract_required_fields_from_request, find_similar_historical_tickets, generate_follow_up_questions,
+    make_security_decision, retrieval_query_embedding
+)
+from main import MessageInput, _create_audit_log, _save_user_message, _upsert_decision_record
+from metrics import message_profile, stage_timer
+from utils import get_db_session, request_scoped_db_session
+
+def _analyze_security_request(conversation_state, new_message_text: str, similar_historical_tickets, query_embedding=None):
+    if not conversation_state.is_classified:
+        return analyze_security_request(conversation_state.context_text(), similar_historical_tickets, query_embedding)
+    
+    provided_fields, missing_fields = conversation_state.provided_fields, conversation_state.missing_fields
+    fields_to_extract = conversation_state.fields_to_extract(new_message_text)
+    if fields_to_extract:
+        newly_provided_fields, _, _ = extract_required_fields_from_request(new_message_text, conversation_state.request_type, fields_to_extract=fields_to_extract)
+        provided_fields, missing_fields = conversation_state.merge_extracted_fields(newly_provided_fields)
+    return conversation_state.request_type, provided_fields, missing_fields, conversation_state.mandatory_fields
+
+def _determine_next_action(conversation_context: str, identified_request_type: str, provided_fields, missing_fields, similar_historical_tickets):
+    next_question_to_ask = None
+    final_decision_outcome = None
+    decision_rationale = None
+    calculated_risk_score = None
+    calculated_confidence_score = None
+    
+    if missing_fields:
+        next_question_to_ask = generate_follow_up_questions(missing_fields, conversation_context)
+    else:
+        final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = make_security_decision(
+            conversation_context, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
+        )
+    
+    return next_question_to_ask, final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score
+
+def process_incoming_message_sync(thread_id: str, message: MessageInput):
+    """The original thread-per-request path with the sync LLM client, kept only as the baseline async_pipeline measures."""
+    with message_profile(), request_scoped_db_session():
+        with stage_timer("db_read"), get_db_session() as database_session:
+            conversation_state = load_conversation_state(database_session, thread_id)
+        _save_user_message(thread_id, message.text)
+        conversation_state.append_message("user", message.text)
+        with stage_timer("summary"):
+            conversation_context = compact_conversation_state(conversation_state).context_text()
+        
+        thread_embedding_update = None
+        with stage_timer("embedding"):
+            if INCREMENTAL_THREAD_EMBEDDINGS:
+                query_embedding, thread_embedding_update = retrieval_query_embedding(
+                    lambda: embed_conversation_turn(thread_id, conversation_state.message_count, message.text, conversation_context)
+                ) or (None, None)
+            else:
+                query_embedding = retrieval_query_embedding(lambda: create_embedding(conversation_context))
+        similar_historical_tickets = find_similar_historical_tickets(
+            conversation_context, number_of_tickets_to_retrieve=5, query_embedding=query_embedding, embed_missing_query=False
+        )
+        
+        identified_request_type, provided_fields, missing_fields, mandatory_fields = _analyze_security_request(conversation_state, message.text, similar_historical_tickets, query_embedding)
+        
+        next_question_to_ask, final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = _determine_next_action(
+            conversation_context, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
+        )
+        
+        conversation_state.record_analysis(identified_request_type, provided_fields, missing_fields, mandatory_fields)
+        with stage_timer("db_write"), get_db_session() as database_session:
+            save_conversation_state(database_session, conversation_state)
+            _upsert_decision_record(
+                database_session, thread_id, identified_request_type, 
+                provided_fields, missing_fields, mandatory_fields,
+                final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score
+            )
+        if thread_embedding_update is not None:
+            commit_thread_embedding(*thread_embedding_update)
+        _create_audit_log(thread_id, message.text, identified_request_type, missing_fields, final_decision_outcome)
+    
+    return {
+        "request_type": identified_request_type,
+        "risk_score": calculated_risk_score,
+        "confidence_score": calculated_confidence_score,
+        "missing_fields": missing_fields,
+        "next_question": next_question_to_ask,
+        "final_decision": final_decision_outcome,
+        "rationale": decision_rationale
+    }
@@ -0,0 +1,45 @@
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+
+def generate_clustered_embeddings(number_of_tickets, number_of_topics, random_generator, noise_scale=1.5):
+    """Gaussian blobs around random topic centres, a rough stand-in for text embeddings."""
+    topic_centroids = random_generator.standard_normal((number_of_topics, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    topic_assignments = random_generator.integers(0, number_of_topics, number_of_tickets)
+    embedding_matrix = topic_centroids[topic_assignments]
+    embedding_matrix += random_generator.standard_normal((number_of_tickets, EMBEDDING_DIMENSIONS), dtype=np.float32) * noise_scale
+    embedding_matrix /= np.sqrt(EMBEDDING_DIMENSIONS)
+    return embedding_matrix, topic_assignments
+
+def write_synthetic_ticket_csv(output_csv_path, number_of_tickets, source_csv_path="data/acme_security_tickets.csv", random_seed=0):
+    """Resample real tickets into a larger CSV with fresh ticket_ids and a numbered summary, so every text is unique."""
+    import csv
+    import uuid
+    random_generator = np.random.default_rng(random_seed)
+    with open(source_csv_path, newline="", encoding="utf-8") as source_file:
+        source_reader = csv.DictReader(source_file)
+        column_names = source_reader.fieldnames
+        source_rows = list(source_reader)
+    with open(output_csv_path, "w", newline="", encoding="utf-8") as output_file:
+        csv_writer = csv.DictWriter(output_file, fieldnames=column_names)
+        csv_writer.writeheader()
+        for ticket_number, source_index in enumerate(random_generator.integers(0, len(source_rows), number_of_tickets)):
+            ticket_row = dict(source_rows[source_index])
+            ticket_row["ticket_id"] = str(uuid.UUID(int=int(random_generator.integers(0, 2 ** 63)) << 64 | ticket_number))
+            ticket_row["request_summary"] = f"{ticket_row['request_summary']} (#{ticket_number})"
+            csv_writer.writerow(ticket_row)
+
+def generate_synthetic_threads(number_of_threads, csv_file_path="data/acme_security_tickets.csv", max_turns=3, random_seed=0):
+    """Conversation openers built from real tickets, each with how many follow-up replies the requester will send."""
+    import csv
+    random_generator = np.random.default_rng(random_seed)
+    with open(csv_file_path, newline="", encoding="utf-8") as csv_file:
+        ticket_rows = list(csv.DictReader(csv_file))
+    synthetic_threads = []
+    for _ in range(number_of_threads):
+        ticket_row = ticket_rows[random_generator.integers(0, len(ticket_rows))]
+        synthetic_threads.append({
+            "opening_message": f"{ticket_row['request_summary']}. {ticket_row['details']}",
+            "reply_turns": int(random_generator.integers(0, max_turns)) if max_turns > 1 else 0
+        })
+    return synthetic_threads
@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+import numpy as np
+from vector_index import HistoricalTicketIndex
+
+EMBEDDING_DIMENSIONS = 1536
+
+def _generate_stored_tickets(number_of_tickets, random_generator):
+    embedding_matrix = random_generator.standard_normal((number_of_tickets, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    stored_embeddings = [json.dumps(embedding.tolist()) for embedding in embedding_matrix]
+    ticket_metadata = [
+        {
+            'request_summary': f"Synthetic ticket {ticket_index}",
+            'request_type': "Permission Change",
+            'fields_provided': "Business Justification",
+            'security_risk_score': 50,
+            'outcome': "Approved"
+        }
+        for ticket_index in range(number_of_tickets)
+    ]
+    return stored_embeddings, ticket_metadata
+
+def _legacy_search(query_embedding, stored_embeddings, ticket_metadata, number_of_results):
+    historical_ticket_embeddings = np.array([json.loads(embedding) for embedding in stored_embeddings])
+    historical_ticket_embeddings /= np.linalg.norm(historical_ticket_embeddings, axis=1, keepdims=True)
+    query_vector = np.asarray(query_embedding) / np.linalg.norm(query_embedding)
+    similarity_scores = historical_ticket_embeddings @ query_vector
+    top_similar_indices = similarity_scores.argsort()[-number_of_results:][::-1]
+    return [ticket_metadata[index] for index in top_similar_indices]
+
+def _time_call(function, repetitions):
+    started_at = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - started_at) / repetitions * 1000
+
+def run_benchmark(corpus_sizes, repetitions=5, number_of_results=5):
+    random_generator = np.random.default_rng(0)
+    print(f"{'tickets':>8} {'legacy ms':>10} {'index ms':>10} {'speedup':>8}")
+    for number_of_tickets in corpus_sizes:
+        stored_embeddings, ticket_metadata = _generate_stored_tickets(number_of_tickets, random_generator)
+        query_embedding = random_generator.standard_normal(EMBEDDING_DIMENSIONS).tolist()
+        historical_ticket_index = HistoricalTicketIndex(
+            np.array([json.loads(embedding) for embedding in stored_embeddings], dtype=np.float32), ticket_metadata,
+            search_backend="exact"
+        )
+
+        legacy_milliseconds = _time_call(
+            lambda: _legacy_search(query_embedding, stored_embeddings, ticket_metadata, number_of_results),
+            max(1, repetitions // 5) if number_of_tickets > 10000 else repetitions
+        )
+        index_milliseconds = _time_call(
+            lambda: historical_ticket_index.search(query_embedding, number_of_results), repetitions * 20
+        )
+        print(f"{number_of_tickets:>8} {legacy_milliseconds:>10.2f} {index_milliseconds:>10.3f} {legacy_milliseconds / index_milliseconds:>7.0f}x")
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Compare per-query JSON parsing retrieval with the resident vector index")
+    argument_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    argument_parser.add_argument("--repetitions", type=int, default=5)
+    arguments = argument_parser.parse_args()
+    run_benchmark(arguments.sizes, arguments.repetitions)
@@ -0,0 +1,197 @@
+import os
+import re
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from database import Message, ThreadState
+from async_llm_service import _acall_llm_for_text
+from llm_service import _call_llm_for_text
+
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500"))
+CHARACTERS_PER_TOKEN = 4
+# Times a save is replayed on top of turns that other requests saved to the same thread in the meantime.
+CONVERSATION_SAVE_ATTEMPTS = 5
+# Words of a field name this long or longer mark a message as mentioning that field ("duration", "manager").
+FIELD_MENTION_MIN_WORD_LENGTH = 5
+
+def estimate_tokens(text):
+    return len(text) // CHARACTERS_PER_TOKEN
+
+class ConversationState:
+    """Per-thread transcript, rolling summary and latest analysis, carried from turn to turn.
+
+    The transcript holds the recent messages verbatim; older ones are folded into rolling_summary
+    once the transcript outgrows the token budget, so prompts stay bounded however long the thread.
+    stored_message_count is the message_count of the stored row this state was loaded from (None when
+    there was none), and unsaved_messages the lines appended since, so a save can detect and replay
+    over a concurrent turn instead of overwriting it.
+    """
+
+    def __init__(self, thread_id, transcript="", rolling_summary=None, message_count=0, request_type=None,
+                 provided_fields=None, missing_fields=None, mandatory_fields=None, stored_message_count=None):
+        self.thread_id = thread_id
+        self.transcript = transcript
+        self.rolling_summary = rolling_summary
+        self.message_count = message_count
+        self.stored_message_count = stored_message_count
+        self.unsaved_messages = []
+        self.request_type = request_type
+        self.provided_fields = provided_fields or {}
+        self.missing_fields = missing_fields or []
+        self.mandatory_fields = mandatory_fields or []
+
+    @property
+    def is_classified(self):
+        return self.request_type is not None
+
+    def append_message(self, role, text):
+        self._append_line(f"{role}: {text}")
+
+    def _append_line(self, message_line):
+        self.transcript = f"{self.transcript}\n{message_line}" if self.transcript else message_line
+        self.message_count += 1
+        # Rebound rather than appended to, so shallow copies of the state do not share it.
+        self.unsaved_messages = [*self.unsaved_messages, message_line]
+
+    def context_text(self):
+        """Summary of earlier messages followed by the recent transcript, for prompts and embeddings."""
+        if not self.rolling_summary:
+            return self.transcript
+        return f"Summary of earlier messages: {self.rolling_summary}\n{self.transcript}"
+
+    def lines_over_budget(self, token_budget=CONVERSATION_TOKEN_BUDGET):
+        """Oldest transcript lines to summarize so the context fits in half the budget; [] when it already fits."""
+        if estimate_tokens(self.context_text()) <= token_budget:
+            return []
+        transcript_lines = self.transcript.split("\n")
+        remaining_tokens = estimate_tokens(self.context_text())
+        number_of_lines_to_fold = 0
+        # Keep at least the newest message verbatim.
+        while number_of_lines_to_fold < len(transcript_lines) - 1 and remaining_tokens > token_budget // 2:
+            remaining_tokens -= estimate_tokens(transcript_lines[number_of_lines_to_fold]) + 1
+            number_of_lines_to_fold += 1
+        return transcript_lines[:number_of_lines_to_fold]
+
+    def fold_into_summary(self, folded_lines, rolling_summary):
+        self.transcript = "\n".join(self.transcript.split("\n")[len(folded_lines):])
+        self.rolling_summary = rolling_summary
+
+    def record_analysis(self, request_type, provided_fields, missing_fields, mandatory_fields):
+        self.request_type = request_type
+        self.provided_fields = provided_fields
+        self.missing_fields = missing_fields
+        self.mandatory_fields = mandatory_fields
+
+    def rebase_onto(self, stored_state):
+        """Replay this turn's messages and analysis on top of a newer stored state of the same thread."""
+        unsaved_messages = self.unsaved_messages
+        self.transcript, self.rolling_summary = stored_state.transcript, stored_state.rolling_summary
+        self.message_count, self.stored_message_count = stored_state.message_count, stored_state.stored_message_count
+        self.unsaved_messages = []
+        for message_line in unsaved_messages:
+            self._append_line(message_line)
+        if self.request_type is None:
+            self.record_analysis(stored_state.request_type, stored_state.provided_fields, stored_state.missing_fields, stored_state.mandatory_fields)
+        elif stored_state.request_type == self.request_type:
+            self.provided_fields = {**stored_state.provided_fields, **self.provided_fields}
+            self.missing_fields = [field_name for field_name in self.missing_fields if field_name not in self.provided_fields]
+
+    def fields_to_extract(self, new_message_text):
+        """The missing fields, plus any provided field the new message mentions by name.
+
+        Mentioned fields are re-read so an earlier answer can be corrected without re-extracting every
+        field on every turn; empty when nothing is missing or mentioned, so no extraction call is made.
+        """
+        message_words = set(re.findall(r"[a-z]+", new_message_text.lower()))
+        mentioned_fields = [
+            field_name for field_name in self.mandatory_fields
+            if field_name in self.provided_fields and field_name not in self.missing_fields
+            and message_words.intersection(re.findall(rf"[a-z]{{{FIELD_MENTION_MIN_WORD_LENGTH},}}", field_name.lower()))
+        ]
+        return [*self.missing_fields, *mentioned_fields]
+
+    def merge_extracted_fields(self, newly_provided_fields):
+        """Add fields found in the newest message, which override earlier values so users can correct them. Returns (provided, missing)."""
+        provided_fields = {**self.provided_fields, **newly_provided_fields}
+        missing_fields = [field_name for field_name in self.missing_fields if field_name not in provided_fields]
+        return provided_fields, missing_fields
+
+def _build_summary_prompt(previous_summary, folded_lines):
+    folded_text = "\n".join(folded_lines)
+    return f"""Summarize this part of a security access request conversation in a few sentences.
+
+                Keep every concrete detail: who is asking, what access or resource, systems, durations, justification, approvals.
+
+                Earlier summary: {previous_summary or "none"}
+
+                Messages:
+                {folded_text}
+
+                Reply with just the summary."""
+
+def compact_conversation_state(conversation_state, token_budget=CONVERSATION_TOKEN_BUDGET):
+    folded_lines = conversation_state.lines_over_budget(token_budget)
+    if folded_lines:
+        summary_prompt = _build_summary_prompt(conversation_state.rolling_summary, folded_lines)
+        conversation_state.fold_into_summary(folded_lines, _call_llm_for_text(summary_prompt, call_site="summary"))
+    return conversation_state
+
+async def acompact_conversation_state(conversation_state, token_budget=CONVERSATION_TOKEN_BUDGET):
+    folded_lines = conversation_state.lines_over_budget(token_budget)
+    if folded_lines:
+        summary_prompt = _build_summary_prompt(conversation_state.rolling_summary, folded_lines)
+        conversation_state.fold_into_summary(folded_lines, await _acall_llm_for_text(summary_prompt, call_site="summary"))
+    return conversation_state
+
+def load_conversation_state(database_session, thread_id):
+    """Stored state for the thread; threads from before thread_states existed are rebuilt from their messages once."""
+    thread_state_record = database_session.get(ThreadState, thread_id, populate_existing=True)
+    if thread_state_record is not None:
+        return ConversationState(
+            thread_id,
+            transcript=thread_state_record.transcript or "",
+            rolling_summary=thread_state_record.rolling_summary,
+            message_count=thread_state_record.message_count or 0,
+            request_type=thread_state_record.request_type,
+            provided_fields=thread_state_record.extracted_fields,
+            missing_fields=thread_state_record.missing_fields,
+            mandatory_fields=thread_state_record.mandatory_fields,
+            stored_message_count=thread_state_record.message_count or 0
+        )
+
+    conversation_state = ConversationState(thread_id)
+    for message_record in database_session.query(Message).filter_by(thread_id=thread_id).order_by(Message.timestamp).all():
+        conversation_state.append_message(message_record.role, message_record.text)
+    return conversation_state
+
+def _write_conversation_state(database_session, conversation_state):
+    """Write the state unless another turn saved the thread since it was loaded; False on such a conflict."""
+    thread_state_values = {
+        "transcript": conversation_state.transcript,
+        "rolling_summary": conversation_state.rolling_summary,
+        "message_count": conversation_state.message_count,
+        "request_type": conversation_state.request_type,
+        "extracted_fields": conversation_state.provided_fields,
+        "missing_fields": conversation_state.missing_fields,
+        "mandatory_fields": conversation_state.mandatory_fields
+    }
+    if conversation_state.stored_message_count is None:
+        dialect_insert = postgresql.insert if database_session.get_bind().dialect.name == "postgresql" else sqlite.insert
+        thread_state_statement = dialect_insert(ThreadState).values(
+            thread_id=conversation_state.thread_id, **thread_state_values
+        ).on_conflict_do_nothing(index_elements=["thread_id"])
+    else:
+        thread_state_statement = update(ThreadState).where(
+            ThreadState.thread_id == conversation_state.thread_id,
+            ThreadState.message_count == conversation_state.stored_message_count
+        ).values(**thread_state_values).execution_options(synchronize_session=False)
+    return database_session.execute(thread_state_statement).rowcount == 1
+
+def save_conversation_state(database_session, conversation_state):
+    """Save the thread's state, replaying this turn over any turn saved concurrently rather than losing either."""
+    for _ in range(CONVERSATION_SAVE_ATTEMPTS):
+        if _write_conversation_state(database_session, conversation_state):
+            conversation_state.stored_message_count = conversation_state.message_count
+            conversation_state.unsaved_messages = []
+            return
+        conversation_state.rebase_onto(load_conversation_state(database_session, conversation_state.thread_id))
+    raise RuntimeError(f"Thread {conversation_state.thread_id} kept changing while its state was being saved")
@@ -1,9 +1,30 @@
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON, Float, Text
+import os
+from sqlalchemy import create_engine, event, insert, update, Column, Integer, String, DateTime, JSON, Float, Text, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 
-DATABASE_URL = "sqlite:///./acme_bot.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./acme_bot.db")
+ASYNC_DRIVER_PREFIXES = {"sqlite://": "sqlite+aiosqlite://", "postgresql://": "postgresql+asyncpg://", "postgres://": "postgresql+asyncpg://"}
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or next(
+    (DATABASE_URL.replace(sync_prefix, async_prefix, 1) for sync_prefix, async_prefix in ASYNC_DRIVER_PREFIXES.items() if DATABASE_URL.startswith(sync_prefix)),
+    DATABASE_URL
+)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "5"))
+DATABASE_POOL_TIMEOUT_SECONDS = float(os.getenv("DATABASE_POOL_TIMEOUT_SECONDS", "30"))
+# WAL lets readers run alongside the single writer; DELETE restores SQLite's rollback journal.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    # NORMAL is crash-safe under WAL; only the last commits before a power loss can be lost.
+    "synchronous": "NORMAL" if SQLITE_JOURNAL_MODE.upper() == "WAL" else "FULL",
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "temp_store": "MEMORY"
+}
 
 Base = declarative_base()
 
@@ -23,6 +44,18 @@ class Message(Base):
     text = Column(Text)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
+class ThreadState(Base):
+    __tablename__ = "thread_states"
+    thread_id = Column(String, primary_key=True)
+    transcript = Column(Text, default="")
+    rolling_summary = Column(Text, nullable=True)
+    message_count = Column(Integer, default=0)
+    request_type = Column(String, nullable=True)
+    extracted_fields = Column(JSON, nullable=True)
+    missing_fields = Column(JSON, nullable=True)
+    mandatory_fields = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
 class Decision(Base):
     __tablename__ = "decisions"
     id = Column(Integer, primary_key=True, index=True)
@@ -59,12 +92,78 @@ class HistoricalTicket(Base):
     outcome = Column(String, index=True)
     security_risk_score = Column(Integer)
     embedding = Column(JSON)
+    embedding_vector = Column(LargeBinary, nullable=True)
+    embedding_scale = Column(Float, nullable=True)
+    text_hash = Column(String, nullable=True)
     created_at = Column(DateTime)
     requester_department = Column(String)
     requester_title = Column(String)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# One row counting writes to historical_tickets, so workers can poll for changes without reading the table.
+class HistoricalTicketGeneration(Base):
+    __tablename__ = "historical_ticket_generation"
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, default=0)
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+    cache_key = Column(String, primary_key=True)
+    model = Column(String)
+    embedding_vector = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class LLMResponseCacheEntry(Base):
+    __tablename__ = "llm_response_cache"
+    cache_key = Column(String, primary_key=True)
+    model = Column(String)
+    call_site = Column(String)
+    response_content = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+def _engine_options(database_url):
+    """Bounded pool for file databases and servers; in-memory SQLite keeps SQLAlchemy's single-connection default."""
+    engine_options = {}
+    if database_url.startswith("sqlite"):
+        engine_options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in database_url or database_url.split("://", 1)[1] in ("", "/"):
+            return engine_options
+    else:
+        engine_options["pool_pre_ping"] = True
+    engine_options.update(pool_size=DATABASE_POOL_SIZE, max_overflow=DATABASE_MAX_OVERFLOW, pool_timeout=DATABASE_POOL_TIMEOUT_SECONDS)
+    return engine_options
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma_name, pragma_value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma_name}={pragma_value}")
+    cursor.close()
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=async_engine, expire_on_commit=False)
+
 def initialize_database():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+
+def ensure_historical_ticket_generation_table(bind):
+    HistoricalTicketGeneration.__table__.create(bind=bind, checkfirst=True)
+
+def record_historical_ticket_change(connection):
+    """Bump the generation workers poll; call it in the same transaction that writes historical_tickets."""
+    ensure_historical_ticket_generation_table(connection)
+    bumped_rows = connection.execute(update(HistoricalTicketGeneration).where(HistoricalTicketGeneration.id == 1).values(
+        generation=HistoricalTicketGeneration.generation + 1
+    )).rowcount
+    if not bumped_rows:
+        connection.execute(insert(HistoricalTicketGeneration).values(id=1, generation=1))
+
+@event.listens_for(Session, "after_flush")
+def _record_orm_historical_ticket_change(database_session, flush_context):
+    changed_instances = (*database_session.new, *database_session.dirty, *database_session.deleted)
+    if any(isinstance(instance, HistoricalTicket) for instance in changed_instances):
+        record_historical_ticket_change(database_session.connection())
\ No newline at end of file
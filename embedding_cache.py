@@ -0,0 +1,254 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from database import EmbeddingCacheEntry, engine
+from embedding_store import decode_embedding, encode_embedding
+from llm_scheduler import estimate_tokens, get_llm_scheduler
+from metrics import register_collector
+from utils import get_async_openai_client, get_openai_client, get_db_session
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "0") == "1"
+PERSISTENT_CACHE_MAX_ENTRIES = int(os.getenv("PERSISTENT_EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+PERSISTENT_CACHE_PRUNE_INTERVAL = 100
+INCREMENTAL_THREAD_EMBEDDINGS = os.getenv("INCREMENTAL_THREAD_EMBEDDINGS", "0") == "1"
+THREAD_EMBEDDING_MAX_THREADS = 5000
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def _cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Content-addressed LRU/TTL cache for embeddings with an optional SQLite tier."""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS, persist=EMBEDDING_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent_writes = 0
+        if persist:
+            EmbeddingCacheEntry.__table__.create(bind=engine, checkfirst=True)
+
+    def _get_from_memory(self, cache_key):
+        with self._lock:
+            cached_entry = self._entries.get(cache_key)
+            if cached_entry is None:
+                return None
+            stored_at, embedding = cached_entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return embedding
+
+    def _put_in_memory(self, cache_key, embedding):
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_persisted(self, cache_keys):
+        oldest_valid_time = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl_seconds)
+        with get_db_session() as database_session:
+            persisted_entries = database_session.query(EmbeddingCacheEntry).filter(
+                EmbeddingCacheEntry.cache_key.in_(cache_keys),
+                EmbeddingCacheEntry.created_at >= oldest_valid_time
+            ).all()
+            return {entry.cache_key: decode_embedding(entry.embedding_vector) for entry in persisted_entries}
+
+    def _put_persisted(self, model, embeddings_by_key):
+        with get_db_session() as database_session:
+            for cache_key, embedding in embeddings_by_key.items():
+                database_session.merge(EmbeddingCacheEntry(
+                    cache_key=cache_key,
+                    model=model,
+                    embedding_vector=encode_embedding(embedding, "float32")[0],
+                    created_at=datetime.datetime.utcnow()
+                ))
+            with self._lock:
+                self._persistent_writes += len(embeddings_by_key)
+                prune_is_due = self._persistent_writes >= PERSISTENT_CACHE_PRUNE_INTERVAL
+                if prune_is_due:
+                    self._persistent_writes = 0
+            if prune_is_due:
+                self._prune_persisted(database_session)
+
+    def _prune_persisted(self, database_session):
+        oldest_valid_time = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl_seconds)
+        database_session.query(EmbeddingCacheEntry).filter(EmbeddingCacheEntry.created_at < oldest_valid_time).delete()
+        first_evicted_time = database_session.query(EmbeddingCacheEntry.created_at).order_by(
+            EmbeddingCacheEntry.created_at.desc()
+        ).offset(PERSISTENT_CACHE_MAX_ENTRIES).limit(1).scalar()
+        if first_evicted_time is not None:
+            database_session.query(EmbeddingCacheEntry).filter(EmbeddingCacheEntry.created_at <= first_evicted_time).delete()
+
+    def get_many(self, model, texts):
+        """Return {text: embedding} for every text that is cached."""
+        cache_keys = {text: _cache_key(model, text) for text in texts}
+        cached_embeddings = {}
+        for text, cache_key in cache_keys.items():
+            embedding = self._get_from_memory(cache_key)
+            if embedding is not None:
+                cached_embeddings[text] = embedding
+
+        if self.persist and len(cached_embeddings) < len(cache_keys):
+            missing_keys = {cache_keys[text]: text for text in cache_keys if text not in cached_embeddings}
+            for cache_key, embedding in self._get_persisted(list(missing_keys)).items():
+                self._put_in_memory(cache_key, embedding)
+                cached_embeddings[missing_keys[cache_key]] = embedding
+
+        with self._lock:
+            self.hits += len(cached_embeddings)
+            self.misses += len(cache_keys) - len(cached_embeddings)
+        return cached_embeddings
+
+    def put_many(self, model, embeddings_by_text):
+        embeddings_by_key = {}
+        for text, embedding in embeddings_by_text.items():
+            cache_key = _cache_key(model, text)
+            embedding = np.asarray(embedding, dtype=np.float32)
+            self._put_in_memory(cache_key, embedding)
+            embeddings_by_key[cache_key] = embedding
+        if self.persist and embeddings_by_key:
+            self._put_persisted(model, embeddings_by_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def get_embedding_cache():
+    """Get or create the embedding cache singleton."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+def _collect_embedding_cache_metrics():
+    if _embedding_cache is None:
+        return []
+    return [
+        ("acme_embedding_cache_hits_total", "counter", "Embedding lookups served from the cache", [({}, _embedding_cache.hits)]),
+        ("acme_embedding_cache_misses_total", "counter", "Embedding lookups sent to the API", [({}, _embedding_cache.misses)]),
+        ("acme_embedding_cache_entries", "gauge", "Embeddings held in memory", [({}, len(_embedding_cache._entries))])
+    ]
+
+register_collector(_collect_embedding_cache_metrics)
+
+def _uncached_texts(texts, cached_embeddings):
+    return list(dict.fromkeys(text for text in texts if text not in cached_embeddings))
+
+def _store_generated_embeddings(embedding_cache, model, uncached_texts, embedding_response, cached_embeddings):
+    generated_embeddings = {
+        text: np.asarray(embedding_item.embedding, dtype=np.float32)
+        for text, embedding_item in zip(uncached_texts, embedding_response.data)
+    }
+    embedding_cache.put_many(model, generated_embeddings)
+    cached_embeddings.update(generated_embeddings)
+
+def create_embeddings(texts, model=EMBEDDING_MODEL):
+    """Embed texts through the cache; only uncached texts are sent to OpenAI, in one request."""
+    embedding_cache = get_embedding_cache()
+    cached_embeddings = embedding_cache.get_many(model, texts)
+    uncached_texts = _uncached_texts(texts, cached_embeddings)
+
+    if uncached_texts:
+        embedding_response = get_llm_scheduler().run(
+            model, lambda: get_openai_client().embeddings.create(model=model, input=uncached_texts),
+            estimate_tokens(uncached_texts), coalesce_key=_cache_key(model, "\0".join(uncached_texts))
+        )
+        _store_generated_embeddings(embedding_cache, model, uncached_texts, embedding_response, cached_embeddings)
+
+    return [cached_embeddings[text] for text in texts]
+
+def create_embedding(text, model=EMBEDDING_MODEL):
+    return create_embeddings([text], model)[0]
+
+async def acreate_embeddings(texts, model=EMBEDDING_MODEL):
+    embedding_cache = get_embedding_cache()
+    if embedding_cache.persist:
+        cached_embeddings = await asyncio.to_thread(embedding_cache.get_many, model, texts)
+    else:
+        cached_embeddings = embedding_cache.get_many(model, texts)
+    uncached_texts = _uncached_texts(texts, cached_embeddings)
+
+    if uncached_texts:
+        embedding_response = await get_llm_scheduler().arun(
+            model, lambda: get_async_openai_client().embeddings.create(model=model, input=uncached_texts),
+            estimate_tokens(uncached_texts), coalesce_key=_cache_key(model, "\0".join(uncached_texts))
+        )
+        if embedding_cache.persist:
+            await asyncio.to_thread(_store_generated_embeddings, embedding_cache, model, uncached_texts, embedding_response, cached_embeddings)
+        else:
+            _store_generated_embeddings(embedding_cache, model, uncached_texts, embedding_response, cached_embeddings)
+
+    return [cached_embeddings[text] for text in texts]
+
+async def acreate_embedding(text, model=EMBEDDING_MODEL):
+    return (await acreate_embeddings([text], model))[0]
+
+def _unit_vector(embedding):
+    return embedding / (np.linalg.norm(embedding) or 1.0)
+
+# thread_id -> (message_count, embedding_sum, embedded_turns) as of that thread's last saved turn.
+_thread_embeddings = OrderedDict()
+_thread_embeddings_lock = threading.Lock()
+
+def _text_for_thread_turn(thread_id, message_count, new_message_text, complete_conversation_text):
+    """The cached thread state to extend and the text to embed.
+
+    The cache is only extended when it covers exactly the messages before this one; after a failed,
+    concurrent or unseen turn the thread is reseeded from the whole conversation instead.
+    """
+    with _thread_embeddings_lock:
+        thread_state = _thread_embeddings.get(thread_id)
+    if thread_state is None or thread_state[0] != message_count - 1:
+        return None, complete_conversation_text
+    return thread_state, new_message_text
+
+def _next_thread_embedding(thread_id, message_count, thread_state, turn_embedding):
+    if thread_state is None:
+        embedding_sum, embedded_turns = _unit_vector(turn_embedding), 1
+    else:
+        embedding_sum, embedded_turns = thread_state[1] + _unit_vector(turn_embedding), thread_state[2] + 1
+    return embedding_sum / embedded_turns, (thread_id, message_count, embedding_sum, embedded_turns)
+
+def commit_thread_embedding(thread_id, message_count, embedding_sum, embedded_turns):
+    """Cache a turn's thread vector once the turn is saved; an older turn never replaces a newer one."""
+    with _thread_embeddings_lock:
+        cached_state = _thread_embeddings.get(thread_id)
+        if cached_state is not None and cached_state[0] >= message_count:
+            return
+        _thread_embeddings[thread_id] = (message_count, embedding_sum, embedded_turns)
+        _thread_embeddings.move_to_end(thread_id)
+        while len(_thread_embeddings) > THREAD_EMBEDDING_MAX_THREADS:
+            _thread_embeddings.popitem(last=False)
+
+def embed_conversation_turn(thread_id, message_count, new_message_text, complete_conversation_text):
+    """Thread query vector built from the new message and the cached running thread vector.
+
+    The thread vector is the mean of its normalized message embeddings. A thread seen for the first
+    time in this process is seeded from one embedding of the whole conversation so far. Returns
+    (query_embedding, thread_embedding_update); pass the update to commit_thread_embedding() after the
+    turn is saved, so a turn that fails never advances the cached vector.
+    """
+    thread_state, text_to_embed = _text_for_thread_turn(thread_id, message_count, new_message_text, complete_conversation_text)
+    return _next_thread_embedding(thread_id, message_count, thread_state, create_embedding(text_to_embed))
+
+async def aembed_conversation_turn(thread_id, message_count, new_message_text, complete_conversation_text):
+    thread_state, text_to_embed = _text_for_thread_turn(thread_id, message_count, new_message_text, complete_conversation_text)
+    return _next_thread_embedding(thread_id, message_count, thread_state, await acreate_embedding(text_to_embed))
@@ -0,0 +1,35 @@
+import os
+import numpy as np
+
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "float32")
+SUPPORTED_QUANTIZATIONS = ("float32", "int8")
+
+def encode_embedding(embedding, quantization=None):
+    """Encode an embedding as a BLOB. Returns (blob, scale); scale is None for float32 storage."""
+    quantization = quantization or EMBEDDING_QUANTIZATION
+    if quantization not in SUPPORTED_QUANTIZATIONS:
+        raise ValueError(f"Unsupported embedding quantization: {quantization}")
+    embedding_vector = np.asarray(embedding, dtype=np.float32)
+    if quantization == "float32":
+        return embedding_vector.tobytes(), None
+    max_magnitude = float(np.abs(embedding_vector).max()) if embedding_vector.size else 0.0
+    scale = max_magnitude / 127 if max_magnitude else 1.0
+    quantized_vector = np.clip(np.rint(embedding_vector / scale), -127, 127).astype(np.int8)
+    return quantized_vector.tobytes(), scale
+
+def decode_embedding(embedding_blob, embedding_scale=None):
+    if embedding_scale is None:
+        return np.frombuffer(embedding_blob, dtype=np.float32)
+    return np.frombuffer(embedding_blob, dtype=np.int8).astype(np.float32) * np.float32(embedding_scale)
+
+def decode_embedding_matrix(embedding_blobs, embedding_scales):
+    """Decode many BLOBs into one float32 matrix without parsing rows individually."""
+    number_of_vectors = len(embedding_blobs)
+    if number_of_vectors == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    if all(scale is None for scale in embedding_scales):
+        return np.frombuffer(b"".join(embedding_blobs), dtype=np.float32).reshape(number_of_vectors, -1)
+    if all(scale is not None for scale in embedding_scales):
+        quantized_matrix = np.frombuffer(b"".join(embedding_blobs), dtype=np.int8).reshape(number_of_vectors, -1)
+        return quantized_matrix.astype(np.float32) * np.asarray(embedding_scales, dtype=np.float32)[:, None]
+    return np.stack([decode_embedding(blob, scale) for blob, scale in zip(embedding_blobs, embedding_scales)])
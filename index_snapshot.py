@@ -0,0 +1,83 @@
+import json
+import os
+import struct
+import numpy as np
+from sqlalchemy.engine import make_url
+from database import DATABASE_URL
+
+SNAPSHOT_MAGIC = b"ACMEIDX1"
+SNAPSHOT_ALIGNMENT = 64
+
+def _default_snapshot_path():
+    database_url = make_url(DATABASE_URL)
+    if database_url.get_backend_name() == "sqlite" and database_url.database not in (None, "", ":memory:"):
+        return f"{database_url.database}.index"
+    return "historical_ticket_index.snapshot"
+
+# Read-only file every worker process maps, so the embeddings live once in the page cache; "off" to always load from the database.
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH") or _default_snapshot_path()
+
+def _aligned(offset):
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+def write_index_snapshot(snapshot_path, embedding_matrix, ticket_metadata, ticket_created_at, fingerprint):
+    """Write the normalized float32 matrix and ticket fields to snapshot_path, replacing it atomically.
+
+    Layout: magic, header length, JSON header, then at the next 64-byte boundary the row-major float32
+    embeddings followed by created_at as int64 seconds. Readers that already mapped the old file keep it.
+    """
+    embedding_matrix = np.ascontiguousarray(embedding_matrix, dtype="<f4")
+    snapshot_header = json.dumps({
+        "fingerprint": fingerprint,
+        "rows": embedding_matrix.shape[0],
+        "dimensions": embedding_matrix.shape[1] if embedding_matrix.ndim == 2 else 0,
+        "ticket_metadata": ticket_metadata
+    }).encode("utf-8")
+    temporary_path = f"{snapshot_path}.tmp-{os.getpid()}"
+    try:
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(SNAPSHOT_MAGIC + struct.pack("<Q", len(snapshot_header)) + snapshot_header)
+            snapshot_file.write(b"\0" * (_aligned(snapshot_file.tell()) - snapshot_file.tell()))
+            embedding_matrix.tofile(snapshot_file)
+            np.asarray(ticket_created_at, dtype="datetime64[s]").astype("<i8").tofile(snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, snapshot_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def read_index_snapshot_header(snapshot_path):
+    """(header, data_offset), or None when there is no readable snapshot."""
+    try:
+        with open(snapshot_path, "rb") as snapshot_file:
+            if snapshot_file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            header_length, = struct.unpack("<Q", snapshot_file.read(8))
+            snapshot_header = json.loads(snapshot_file.read(header_length))
+    except (OSError, ValueError, struct.error):
+        return None
+    return snapshot_header, _aligned(len(SNAPSHOT_MAGIC) + 8 + header_length)
+
+def open_index_snapshot(snapshot_path):
+    """Map a snapshot read-only: (header, embedding_matrix, ticket_created_at), or None if missing or empty."""
+    header_and_offset = read_index_snapshot_header(snapshot_path)
+    if header_and_offset is None:
+        return None
+    snapshot_header, data_offset = header_and_offset
+    number_of_rows, dimensions = snapshot_header["rows"], snapshot_header["dimensions"]
+    if number_of_rows == 0:
+        return None
+    embedding_matrix = np.memmap(snapshot_path, dtype="<f4", mode="r", offset=data_offset, shape=(number_of_rows, dimensions))
+    ticket_created_at = np.memmap(
+        snapshot_path, dtype="<i8", mode="r", offset=data_offset + embedding_matrix.nbytes, shape=(number_of_rows,)
+    ).view("datetime64[s]")
+    return snapshot_header, embedding_matrix, ticket_created_at
+
+def snapshot_file_identity(snapshot_path):
+    """Changes whenever the snapshot is replaced, so workers notice a new file without reading it."""
+    try:
+        snapshot_stat = os.stat(snapshot_path)
+    except OSError:
+        return None
+    return snapshot_stat.st_ino, snapshot_stat.st_mtime_ns, snapshot_stat.st_size
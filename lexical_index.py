@@ -0,0 +1,69 @@
+import re
+import numpy as np
+from ann_index import top_k_indices
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RECIPROCAL_RANK_FUSION_K = 60
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have i in is it its me my of on or our please the their this to was we
+with you your need needs needed would like can could will
+""".split())
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall((text or "").lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """Okapi BM25 over an inverted index: one (document indices, term frequencies) posting list per term."""
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.number_of_documents = len(documents)
+        term_frequencies_by_term = {}
+        document_lengths = np.zeros(len(documents), dtype=np.float32)
+        for document_index, document in enumerate(documents):
+            document_tokens = tokenize(document)
+            document_lengths[document_index] = len(document_tokens)
+            document_term_counts = {}
+            for token in document_tokens:
+                document_term_counts[token] = document_term_counts.get(token, 0) + 1
+            for token, term_count in document_term_counts.items():
+                term_frequencies_by_term.setdefault(token, []).append((document_index, term_count))
+
+        average_document_length = float(document_lengths.mean()) if len(documents) and document_lengths.any() else 1.0
+        # The document-length part of the BM25 denominator, precomputed once per document.
+        length_normalization = k1 * (1 - b + b * document_lengths / average_document_length)
+        self.postings = {}
+        for token, document_term_counts in term_frequencies_by_term.items():
+            document_indices = np.array([document_index for document_index, _ in document_term_counts], dtype=np.int32)
+            term_frequencies = np.array([term_count for _, term_count in document_term_counts], dtype=np.float32)
+            inverse_document_frequency = np.log(1 + (self.number_of_documents - len(document_indices) + 0.5) / (len(document_indices) + 0.5))
+            term_weights = inverse_document_frequency * term_frequencies * (k1 + 1) / (term_frequencies + length_normalization[document_indices])
+            self.postings[token] = (document_indices, term_weights.astype(np.float32))
+
+    def score(self, query_text):
+        """BM25 score of every document; only documents sharing a term with the query score above zero."""
+        document_scores = np.zeros(self.number_of_documents, dtype=np.float32)
+        for token in set(tokenize(query_text)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                document_scores[posting[0]] += posting[1]
+        return document_scores
+
+    def search(self, query_text, number_of_results, candidate_mask=None):
+        document_scores = self.score(query_text)
+        matching_documents = document_scores > 0
+        if candidate_mask is not None:
+            matching_documents &= candidate_mask
+        matching_indices = np.flatnonzero(matching_documents)
+        return matching_indices[top_k_indices(document_scores[matching_indices], number_of_results)]
+
+def reciprocal_rank_fusion(ranked_index_lists, number_of_results, k=RECIPROCAL_RANK_FUSION_K):
+    """Merge rankings by summing 1 / (k + rank) per list; earlier lists win ties."""
+    fused_scores = {}
+    for ranked_indices in ranked_index_lists:
+        for rank, index in enumerate(ranked_indices):
+            fused_scores[int(index)] = fused_scores.get(int(index), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused_scores, key=lambda index: -fused_scores[index])[:number_of_results]
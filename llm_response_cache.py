@@ -0,0 +1,155 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from database import LLMResponseCacheEntry, engine
+from metrics import register_collector
+from utils import get_db_session
+
+# "memory", "sqlite" (memory in front of a SQLite table) or "off"
+LLM_RESPONSE_CACHE = os.getenv("LLM_RESPONSE_CACHE", "memory")
+LLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+LLM_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+PERSISTENT_LLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("PERSISTENT_LLM_RESPONSE_CACHE_MAX_ENTRIES", "50000"))
+PERSISTENT_CACHE_PRUNE_INTERVAL = 100
+# Decisions are not cached unless "decision" is added here: a retried decision should see fresh judgement.
+LLM_CACHED_CALL_SITES = {
+    call_site.strip() for call_site in os.getenv("LLM_CACHED_CALL_SITES", "analysis,classification,extraction,follow_up").split(",") if call_site.strip()
+}
+
+_llm_response_cache = None
+_llm_response_cache_lock = threading.Lock()
+
+def llm_cache_key(model, prompt, response_format=None):
+    response_format_key = json.dumps(response_format, sort_keys=True) if response_format is not None else ""
+    return hashlib.sha256(f"{model}\0{response_format_key}\0{prompt}".encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """LRU/TTL cache of raw chat completion content, keyed on model, prompt and response_format.
+
+    Any object with the same get/put methods can replace it through set_llm_response_cache.
+    """
+
+    def __init__(self, max_entries=LLM_RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=LLM_RESPONSE_CACHE_TTL_SECONDS, persist=LLM_RESPONSE_CACHE == "sqlite"):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.hits = Counter()
+        self.misses = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent_writes = 0
+        if persist:
+            LLMResponseCacheEntry.__table__.create(bind=engine, checkfirst=True)
+
+    def _get_from_memory(self, cache_key):
+        with self._lock:
+            cached_entry = self._entries.get(cache_key)
+            if cached_entry is None:
+                return None
+            stored_at, response_content = cached_entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return response_content
+
+    def _put_in_memory(self, cache_key, response_content):
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic(), response_content)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_persisted(self, cache_key):
+        oldest_valid_time = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl_seconds)
+        with get_db_session() as database_session:
+            return database_session.query(LLMResponseCacheEntry.response_content).filter(
+                LLMResponseCacheEntry.cache_key == cache_key,
+                LLMResponseCacheEntry.created_at >= oldest_valid_time
+            ).scalar()
+
+    def _put_persisted(self, cache_key, model, call_site, response_content):
+        with get_db_session() as database_session:
+            database_session.merge(LLMResponseCacheEntry(
+                cache_key=cache_key,
+                model=model,
+                call_site=call_site,
+                response_content=response_content,
+                created_at=datetime.datetime.utcnow()
+            ))
+            with self._lock:
+                self._persistent_writes += 1
+                prune_is_due = self._persistent_writes >= PERSISTENT_CACHE_PRUNE_INTERVAL
+                if prune_is_due:
+                    self._persistent_writes = 0
+            if prune_is_due:
+                self._prune_persisted(database_session)
+
+    def _prune_persisted(self, database_session):
+        oldest_valid_time = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl_seconds)
+        database_session.query(LLMResponseCacheEntry).filter(LLMResponseCacheEntry.created_at < oldest_valid_time).delete()
+        first_evicted_time = database_session.query(LLMResponseCacheEntry.created_at).order_by(
+            LLMResponseCacheEntry.created_at.desc()
+        ).offset(PERSISTENT_LLM_RESPONSE_CACHE_MAX_ENTRIES).limit(1).scalar()
+        if first_evicted_time is not None:
+            database_session.query(LLMResponseCacheEntry).filter(LLMResponseCacheEntry.created_at <= first_evicted_time).delete()
+
+    def get(self, cache_key, call_site):
+        response_content = self._get_from_memory(cache_key)
+        if response_content is None and self.persist:
+            response_content = self._get_persisted(cache_key)
+            if response_content is not None:
+                self._put_in_memory(cache_key, response_content)
+        with self._lock:
+            if response_content is None:
+                self.misses[call_site] += 1
+            else:
+                self.hits[call_site] += 1
+        return response_content
+
+    def put(self, cache_key, model, call_site, response_content):
+        self._put_in_memory(cache_key, response_content)
+        if self.persist:
+            self._put_persisted(cache_key, model, call_site, response_content)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def get_llm_response_cache():
+    """Get or create the LLM response cache singleton, or None when LLM_RESPONSE_CACHE is off."""
+    global _llm_response_cache
+    if LLM_RESPONSE_CACHE == "off" and _llm_response_cache is None:
+        return None
+    with _llm_response_cache_lock:
+        if _llm_response_cache is None:
+            _llm_response_cache = LLMResponseCache()
+    return _llm_response_cache
+
+def set_llm_response_cache(llm_response_cache):
+    """Replace the process-wide response cache, e.g. with a shared store; None restores the default."""
+    global _llm_response_cache
+    with _llm_response_cache_lock:
+        _llm_response_cache = llm_response_cache
+
+def cache_for_call_site(call_site):
+    """The response cache to use for a call site, or None when that call site is not cached."""
+    if call_site is None or call_site not in LLM_CACHED_CALL_SITES:
+        return None
+    return get_llm_response_cache()
+
+def _collect_llm_response_cache_metrics():
+    if not hasattr(_llm_response_cache, "hits"):
+        return []
+    return [
+        ("acme_llm_response_cache_hits_total", "counter", "Chat completions served from the response cache",
+         [({"call_site": call_site}, hit_count) for call_site, hit_count in sorted(_llm_response_cache.hits.items())]),
+        ("acme_llm_response_cache_misses_total", "counter", "Cacheable chat completions sent to the API",
+         [({"call_site": call_site}, miss_count) for call_site, miss_count in sorted(_llm_response_cache.misses.items())])
+    ]
+
+register_collector(_collect_llm_response_cache_metrics)
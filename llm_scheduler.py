@@ -0,0 +1,359 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from metrics import Counter, Histogram, register_collector
+
+# Lower lanes are always admitted first: a queued /messages call never waits behind /health analysis or an import.
+PRIORITY_LANES = {"interactive": 0, "background": 1, "bulk": 2}
+# model=requests_per_minute:tokens_per_minute, comma separated; 0 disables that limit.
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "gpt-4o=5000:800000,text-embedding-3-small=5000:5000000")
+LLM_DEFAULT_RATE_LIMIT = os.getenv("LLM_DEFAULT_RATE_LIMIT", "500:200000")
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "64"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5"))
+# Every worker process runs its own scheduler, so each gets an even share of the account's limits.
+WORKER_PROCESSES = max(1, int(os.getenv("WORKER_PROCESSES", "1")))
+LLM_RETRY_BASE_SECONDS = 0.5
+LLM_RETRY_MAX_SECONDS = 30.0
+COMPLETION_TOKEN_ESTIMATE = 300
+CHARACTERS_PER_TOKEN = 4
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+LLM_QUEUE_WAIT_SECONDS = Histogram("acme_llm_queue_wait_seconds", "Time LLM requests wait for a rate limit slot", ["model", "lane"])
+LLM_RETRIES_TOTAL = Counter("acme_llm_retries_total", "LLM requests retried after a rate limit or transient error", ["model"])
+LLM_COALESCED_TOTAL = Counter("acme_llm_coalesced_requests_total", "Requests answered by an identical request already in flight", ["model"])
+
+_llm_scheduler = None
+_llm_scheduler_lock = threading.Lock()
+_current_priority_lane = contextvars.ContextVar("llm_priority_lane", default="interactive")
+
+@contextmanager
+def llm_priority(lane):
+    """Send LLM requests made in this context, including tasks and to_thread calls started inside it, in lane."""
+    if lane not in PRIORITY_LANES:
+        raise ValueError(f"Unknown LLM priority lane: {lane}")
+    context_token = _current_priority_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_priority_lane.reset(context_token)
+
+def estimate_tokens(texts, completion_tokens=0):
+    return sum(len(text) for text in texts) // CHARACTERS_PER_TOKEN + completion_tokens
+
+def _parse_rate_limits(rate_limits_text):
+    rate_limits = {}
+    for model_limit in rate_limits_text.split(","):
+        if "=" in model_limit:
+            model, limits = model_limit.strip().split("=", 1)
+            requests_per_minute, tokens_per_minute = limits.split(":")
+            rate_limits[model] = (float(requests_per_minute), float(tokens_per_minute))
+    return rate_limits
+
+def _is_retryable(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    import openai
+    return isinstance(error, openai.APIConnectionError)
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+class TokenBucket:
+    """Refills continuously up to one minute's allowance; goes negative when a request used more than estimated."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.available = self.capacity
+        self.refilled_at = time.monotonic()
+
+    def seconds_until_available(self, amount, now):
+        if self.capacity <= 0:
+            return 0.0
+        self.available = min(self.capacity, self.available + (now - self.refilled_at) * self.capacity / 60)
+        self.refilled_at = now
+        # A request bigger than the whole allowance waits for a full bucket instead of forever.
+        shortfall = min(amount, self.capacity) - self.available
+        return max(0.0, shortfall * 60 / self.capacity)
+
+    def consume(self, amount):
+        if self.capacity > 0:
+            self.available -= amount
+
+class _ModelLimits:
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrent_requests):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrent_requests = max_concurrent_requests
+        self.active_requests = 0
+        self.paused_until = 0.0
+        self.waiters = []
+
+class _Waiter:
+    def __init__(self, model, lane, estimated_tokens, wake):
+        self.model = model
+        self.lane = lane
+        self.estimated_tokens = estimated_tokens
+        self.wake = wake
+        self.enqueued_at = time.monotonic()
+        self.admitted = False
+        self.abandoned = False
+
+def _resolve_admission(admission_future):
+    if not admission_future.done():
+        admission_future.set_result(None)
+
+class LLMScheduler:
+    """Admits OpenAI requests per model under RPM/TPM token buckets and a concurrency cap, in priority order.
+
+    Identical requests already in flight are coalesced into one, and rate limits and transient errors are
+    retried with jittered exponential backoff. A 429 pauses the whole model for its Retry-After. Sync callers
+    block their thread; async callers await. One dispatcher thread serves both.
+    """
+
+    def __init__(self, rate_limits=None, default_rate_limit=None, max_concurrent_requests=LLM_MAX_CONCURRENT_REQUESTS, max_attempts=LLM_MAX_ATTEMPTS):
+        self.rate_limits = rate_limits if rate_limits is not None else _parse_rate_limits(LLM_RATE_LIMITS)
+        self.default_rate_limit = default_rate_limit or tuple(float(limit) for limit in LLM_DEFAULT_RATE_LIMIT.split(":"))
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_attempts = max_attempts
+        self._models = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._run_dispatcher, name="llm-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def _model_limits(self, model):
+        model_limits = self._models.get(model)
+        if model_limits is None:
+            requests_per_minute, tokens_per_minute = self.rate_limits.get(model, self.default_rate_limit)
+            model_limits = self._models[model] = _ModelLimits(
+                requests_per_minute / WORKER_PROCESSES, tokens_per_minute / WORKER_PROCESSES, self.max_concurrent_requests
+            )
+        return model_limits
+
+    def _admit_waiters(self):
+        """Admit every waiter that fits now; returns seconds until a bucket refill could admit more, or None."""
+        now = time.monotonic()
+        next_check_seconds = None
+        for model_limits in self._models.values():
+            while model_limits.waiters:
+                waiter = model_limits.waiters[0][2]
+                if waiter.abandoned:
+                    heapq.heappop(model_limits.waiters)
+                    continue
+                if model_limits.active_requests >= model_limits.max_concurrent_requests:
+                    break
+                wait_seconds = max(
+                    model_limits.paused_until - now,
+                    model_limits.request_bucket.seconds_until_available(1, now),
+                    model_limits.token_bucket.seconds_until_available(waiter.estimated_tokens, now)
+                )
+                if wait_seconds > 0:
+                    next_check_seconds = wait_seconds if next_check_seconds is None else min(next_check_seconds, wait_seconds)
+                    break
+                heapq.heappop(model_limits.waiters)
+                model_limits.request_bucket.consume(1)
+                model_limits.token_bucket.consume(waiter.estimated_tokens)
+                model_limits.active_requests += 1
+                waiter.admitted = True
+                LLM_QUEUE_WAIT_SECONDS.observe(now - waiter.enqueued_at, model=waiter.model, lane=waiter.lane)
+                try:
+                    waiter.wake()
+                except RuntimeError:
+                    # The waiting event loop has closed.
+                    model_limits.active_requests -= 1
+        return next_check_seconds
+
+    def _run_dispatcher(self):
+        with self._condition:
+            while True:
+                self._condition.wait(timeout=self._admit_waiters())
+
+    def _enqueue(self, model, estimated_tokens, wake):
+        lane = _current_priority_lane.get()
+        waiter = _Waiter(model, lane, estimated_tokens, wake)
+        with self._condition:
+            heapq.heappush(self._model_limits(model).waiters, (PRIORITY_LANES[lane], next(self._sequence), waiter))
+            self._condition.notify()
+        return waiter
+
+    def _release(self, model, estimated_tokens=0, actual_tokens=None):
+        with self._condition:
+            model_limits = self._model_limits(model)
+            model_limits.active_requests -= 1
+            if actual_tokens is not None:
+                model_limits.token_bucket.consume(actual_tokens - estimated_tokens)
+            self._condition.notify()
+
+    def _abandon(self, waiter):
+        with self._condition:
+            if waiter.admitted:
+                self._model_limits(waiter.model).active_requests -= 1
+                self._condition.notify()
+            else:
+                waiter.abandoned = True
+
+    def _retry_delay(self, model, attempt, error):
+        LLM_RETRIES_TOTAL.inc(model=model)
+        # Full jitter: anywhere up to the exponential backoff, so clients throttled together do not retry together.
+        retry_delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            retry_delay = max(retry_delay, retry_after)
+        if getattr(error, "status_code", None) == 429:
+            with self._condition:
+                model_limits = self._model_limits(model)
+                model_limits.paused_until = max(model_limits.paused_until, time.monotonic() + retry_delay)
+        return retry_delay
+
+    def _join_in_flight(self, coalesce_key):
+        """(shared future, True) for the caller that should send the request, (shared future, False) for the rest."""
+        with self._in_flight_lock:
+            shared_response = self._in_flight.get(coalesce_key)
+            if shared_response is not None:
+                return shared_response, False
+            shared_response = self._in_flight[coalesce_key] = concurrent.futures.Future()
+            return shared_response, True
+
+    def _finish_in_flight(self, coalesce_key, shared_response, response=None, error=None):
+        with self._in_flight_lock:
+            self._in_flight.pop(coalesce_key, None)
+        if isinstance(error, asyncio.CancelledError):
+            shared_response.cancel()
+        elif error is not None:
+            shared_response.set_exception(error)
+        else:
+            shared_response.set_result(response)
+
+    def _run_with_retries(self, model, request_function, estimated_tokens):
+        for attempt in range(self.max_attempts):
+            admitted = threading.Event()
+            self._enqueue(model, estimated_tokens, admitted.set)
+            admitted.wait()
+            try:
+                response = request_function()
+            except Exception as request_error:
+                self._release(model)
+                if attempt == self.max_attempts - 1 or not _is_retryable(request_error):
+                    raise
+                time.sleep(self._retry_delay(model, attempt, request_error))
+                continue
+            self._release(model, estimated_tokens, _usage_tokens(response))
+            return response
+
+    async def _arun_with_retries(self, model, request_function, estimated_tokens):
+        event_loop = asyncio.get_running_loop()
+        for attempt in range(self.max_attempts):
+            admitted = event_loop.create_future()
+            waiter = self._enqueue(model, estimated_tokens, lambda: event_loop.call_soon_threadsafe(_resolve_admission, admitted))
+            try:
+                await admitted
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+            try:
+                response = await request_function()
+            except Exception as request_error:
+                self._release(model)
+                if attempt == self.max_attempts - 1 or not _is_retryable(request_error):
+                    raise
+                await asyncio.sleep(self._retry_delay(model, attempt, request_error))
+                continue
+            except BaseException:
+                self._release(model)
+                raise
+            self._release(model, estimated_tokens, _usage_tokens(response))
+            return response
+
+    def run(self, model, request_function, estimated_tokens=0, coalesce_key=None):
+        """Call request_function() once model's limits allow, sharing the response with identical in-flight calls."""
+        if coalesce_key is None:
+            return self._run_with_retries(model, request_function, estimated_tokens)
+        while True:
+            shared_response, is_sender = self._join_in_flight((model, coalesce_key))
+            if not is_sender:
+                LLM_COALESCED_TOTAL.inc(model=model)
+                try:
+                    return shared_response.result()
+                except concurrent.futures.CancelledError:
+                    # The async caller sending it was cancelled; send it ourselves.
+                    continue
+            try:
+                response = self._run_with_retries(model, request_function, estimated_tokens)
+            except BaseException as request_error:
+                self._finish_in_flight((model, coalesce_key), shared_response, error=request_error)
+                raise
+            self._finish_in_flight((model, coalesce_key), shared_response, response)
+            return response
+
+    async def arun(self, model, request_function, estimated_tokens=0, coalesce_key=None):
+        """Async run(); request_function returns an awaitable."""
+        if coalesce_key is None:
+            return await self._arun_with_retries(model, request_function, estimated_tokens)
+        while True:
+            shared_response, is_sender = self._join_in_flight((model, coalesce_key))
+            if not is_sender:
+                LLM_COALESCED_TOTAL.inc(model=model)
+                try:
+                    # Shielded so a cancelled follower does not cancel the shared response for everyone else.
+                    return await asyncio.shield(asyncio.wrap_future(shared_response))
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling() or not shared_response.done():
+                        raise
+                    continue
+            try:
+                response = await self._arun_with_retries(model, request_function, estimated_tokens)
+            except BaseException as request_error:
+                self._finish_in_flight((model, coalesce_key), shared_response, error=request_error)
+                raise
+            self._finish_in_flight((model, coalesce_key), shared_response, response)
+            return response
+
+    def queue_depths(self):
+        with self._condition:
+            queue_depths = {}
+            for model, model_limits in self._models.items():
+                for _, _, waiter in model_limits.waiters:
+                    if not waiter.abandoned:
+                        queue_depths[(model, waiter.lane)] = queue_depths.get((model, waiter.lane), 0) + 1
+            active_requests = {model: model_limits.active_requests for model, model_limits in self._models.items()}
+        return queue_depths, active_requests
+
+def get_llm_scheduler():
+    """Get or create the process-wide scheduler that every OpenAI request goes through."""
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        with _llm_scheduler_lock:
+            if _llm_scheduler is None:
+                _llm_scheduler = LLMScheduler()
+    return _llm_scheduler
+
+def _collect_llm_scheduler_metrics():
+    if _llm_scheduler is None:
+        return []
+    queue_depths, active_requests = _llm_scheduler.queue_depths()
+    return [
+        ("acme_llm_queue_depth", "gauge", "LLM requests waiting for the scheduler",
+         [({"model": model, "lane": lane}, queue_depth) for (model, lane), queue_depth in sorted(queue_depths.items())]),
+        ("acme_llm_active_requests", "gauge", "LLM requests currently sent and awaiting a response",
+         [({"model": model}, active_count) for model, active_count in sorted(active_requests.items())])
+    ]
+
+register_collector(_collect_llm_scheduler_metrics)
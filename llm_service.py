@@ -1,73 +1,100 @@
 import json
-import numpy as np
-from database import HistoricalTicket
-from sklearn.metrics.pairwise import cosine_similarity
-from utils import get_openai_client, get_db_session
-
-def _call_llm_for_text(prompt):
-    openai_client = get_openai_client()
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content.strip()
-
-def _call_llm_for_json(prompt):
-    openai_client = get_openai_client()
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"}
+import os
+import time
+from embedding_cache import create_embedding
+from llm_response_cache import cache_for_call_site, llm_cache_key
+from llm_scheduler import COMPLETION_TOKEN_ESTIMATE, estimate_tokens, get_llm_scheduler
+from metrics import RETRIEVAL_EMBEDDING_FALLBACKS_TOTAL, record_llm_request, stage_timer
+from prompt_builder import (
+    MERGED_ANALYSIS, PROMPT_STYLE, build_analysis_prompt, build_compact_classification_prompt,
+    build_compact_decision_prompt, build_compact_extraction_prompt
+)
+from request_catalog import get_request_type_catalog
+from request_classifier import LOCAL_CLASSIFIER_METHOD, classify_request_locally
+from utils import get_openai_client
+from vector_index import RETRIEVAL_MODE, get_historical_ticket_index
+
+CHAT_MODEL = "gpt-4o"
+# Hybrid retrieval stops waiting for the query embedding after this long and ranks by BM25 alone.
+RETRIEVAL_EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_EMBEDDING_TIMEOUT_SECONDS", "2"))
+
+def _chat_request_arguments(prompt, response_format=None):
+    request_arguments = {"model": CHAT_MODEL, "messages": [{"role": "user", "content": prompt}]}
+    if response_format is not None:
+        request_arguments["response_format"] = response_format
+    return request_arguments
+
+def _call_llm(prompt, parse_content, response_format=None, call_site=None):
+    """Chat completion through the response cache when call_site is in LLM_CACHED_CALL_SITES."""
+    llm_response_cache = cache_for_call_site(call_site)
+    cache_key = llm_cache_key(CHAT_MODEL, prompt, response_format)
+    if llm_response_cache is not None:
+        cached_content = llm_response_cache.get(cache_key, call_site)
+        if cached_content is not None:
+            return parse_content(cached_content)
+
+    def request_chat_completion():
+        requested_at = time.perf_counter()
+        response = get_openai_client().chat.completions.create(**_chat_request_arguments(prompt, response_format))
+        record_llm_request(call_site, time.perf_counter() - requested_at, getattr(response, "usage", None))
+        return response
+
+    response = get_llm_scheduler().run(
+        CHAT_MODEL, request_chat_completion, estimate_tokens([prompt], COMPLETION_TOKEN_ESTIMATE), coalesce_key=cache_key
     )
-    return json.loads(response.choices[0].message.content)
-
-def find_similar_historical_tickets(query_text, number_of_tickets_to_retrieve=5):
-    openai_client = get_openai_client()
-    query_embedding = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=query_text
-    ).data[0].embedding
-    
-    with get_db_session() as database_session:
-        all_historical_tickets = database_session.query(HistoricalTicket).all()
-        
-        historical_ticket_embeddings = [json.loads(ticket.embedding) for ticket in all_historical_tickets]
-        similarity_scores = cosine_similarity([query_embedding], historical_ticket_embeddings)[0]
-        
-        top_similar_indices = similarity_scores.argsort()[-number_of_tickets_to_retrieve:][::-1]
-        most_similar_tickets = [all_historical_tickets[index] for index in top_similar_indices]
-        
-        tickets_data = [
-            {
-                'request_summary': ticket.request_summary,
-                'request_type': ticket.request_type,
-                'fields_provided': ticket.fields_provided,
-                'security_risk_score': ticket.security_risk_score,
-                'outcome': ticket.outcome
-            }
-            for ticket in most_similar_tickets
-        ]
+    response_content = response.choices[0].message.content
+    parsed_response = parse_content(response_content)
+
+    if llm_response_cache is not None:
+        llm_response_cache.put(cache_key, CHAT_MODEL, call_site, response_content)
+    return parsed_response
+
+def _call_llm_for_text(prompt, call_site=None):
+    return _call_llm(prompt, str.strip, call_site=call_site)
+
+def _call_llm_for_json(prompt, call_site=None):
+    return _call_llm(prompt, json.loads, {"type": "json_object"}, call_site)
+
+def retrieval_query_embedding(create_query_embedding):
+    """The query embedding RETRIEVAL_MODE needs: None in lexical mode, or in hybrid mode if embedding fails."""
+    if RETRIEVAL_MODE == "lexical":
+        return None
+    if RETRIEVAL_MODE != "hybrid":
+        return create_query_embedding()
+    try:
+        return create_query_embedding()
+    except Exception:
+        RETRIEVAL_EMBEDDING_FALLBACKS_TOTAL.inc()
+        return None
+
+def find_similar_historical_tickets(query_text, number_of_tickets_to_retrieve=5, request_type=None, outcome=None, created_after=None, created_before=None, query_embedding=None, embed_missing_query=True):
+    with stage_timer("retrieval"):
+        if query_embedding is None and embed_missing_query:
+            query_embedding = retrieval_query_embedding(lambda: create_embedding(query_text))
         
-        return tickets_data
+        return get_historical_ticket_index().retrieve(
+            query_text, query_embedding, number_of_tickets_to_retrieve,
+            request_type=request_type, outcome=outcome, created_after=created_after, created_before=created_before
+        )
 
-def classify_security_request(user_message, similar_historical_tickets=None):
-    if similar_historical_tickets is None:
-        similar_historical_tickets = find_similar_historical_tickets(user_message, number_of_tickets_to_retrieve=3)
-    
-    # Get all unique request_type from the database
-    with get_db_session() as database_session:
-        unique_request_types = database_session.query(HistoricalTicket.request_type).distinct().all()
-        request_types_list = sorted([rt[0] for rt in unique_request_types])
-        request_types_string = ", ".join(request_types_list)
+def predict_request_type_from_neighbours(similar_historical_tickets):
+    """Rank-weighted vote over the neighbours' request types, used to start type-dependent work early."""
+    request_type_votes = {}
+    for neighbour_rank, ticket in enumerate(similar_historical_tickets):
+        request_type_votes[ticket['request_type']] = request_type_votes.get(ticket['request_type'], 0) + 1 / (neighbour_rank + 1)
+    return max(request_type_votes, key=request_type_votes.get) if request_type_votes else None
+
+def _build_classification_prompt(user_message, similar_historical_tickets, request_types_list):
+    if PROMPT_STYLE == "compact":
+        return build_compact_classification_prompt(user_message, similar_historical_tickets, request_types_list)
+    request_types_string = ", ".join(request_types_list)
     
     formatted_examples = "\n".join([
         f"- '{ticket['request_summary']}' : {ticket['request_type']}"
         for ticket in similar_historical_tickets[:3]
     ])
-
-    print(formatted_examples)
     
-    classification_prompt = f"""Based on these examples:
+    return f"""Based on these examples:
                                 {formatted_examples}
 
                                 Classify this request into one of: {request_types_string}
@@ -75,15 +102,11 @@ def classify_security_request(user_message, similar_historical_tickets=None):
                                 Request: {user_message}
 
                                 Reply with just the request type."""
-    
-    return _call_llm_for_text(classification_prompt)
 
-def extract_required_fields_from_request(user_message, request_type):
-    with get_db_session() as database_session:
-        sample_ticket_for_request_type = database_session.query(HistoricalTicket).filter_by(request_type=request_type).first()
-        mandatory_fields_list = sample_ticket_for_request_type.mandatory_fields.split("; ") if sample_ticket_for_request_type else []
-    
-    extraction_prompt = f"""Extract information from this security request.
+def _build_extraction_prompt(user_message, mandatory_fields_list):
+    if PROMPT_STYLE == "compact":
+        return build_compact_extraction_prompt(user_message, mandatory_fields_list)
+    return f"""Extract information from this security request.
 
                             Request: {user_message}
 
@@ -98,18 +121,97 @@ def extract_required_fields_from_request(user_message, request_type):
                             "field_name": "value or MISSING",
                             "requested_access": "specific access requested"
                             }}"""
-    
-    extracted_fields_data = _call_llm_for_json(extraction_prompt)
-    
+
+def _split_extracted_fields(extracted_fields_data):
     requested_access = extracted_fields_data.pop("requested_access", None)
     if requested_access and requested_access != "MISSING":
         extracted_fields_data["Requested Access"] = requested_access
     
     provided_fields = {field_name: field_value for field_name, field_value in extracted_fields_data.items() if field_value != "MISSING"}
     missing_fields = [field_name for field_name, field_value in extracted_fields_data.items() if field_value == "MISSING"]
+    return provided_fields, missing_fields
+
+def _build_analysis_prompt(user_message, similar_historical_tickets, request_type_catalog):
+    return build_analysis_prompt(user_message, similar_historical_tickets, {
+        request_type: request_type_catalog.mandatory_fields(request_type) for request_type in request_type_catalog.request_types
+    })
+
+def _split_analysis(analysis_result, request_type_catalog):
+    """(request_type, provided_fields, missing_fields, mandatory_fields) from a merged classification and extraction."""
+    identified_request_type = analysis_result.get("request_type")
+    mandatory_fields_list = request_type_catalog.mandatory_fields(identified_request_type)
+    extracted_fields = analysis_result.get("fields") or {}
+    provided_fields, missing_fields = _split_extracted_fields({
+        **{field_name: extracted_fields.get(field_name, "MISSING") for field_name in mandatory_fields_list},
+        "requested_access": analysis_result.get("requested_access")
+    })
+    return identified_request_type, provided_fields, missing_fields, mandatory_fields_list
+
+def _classify_locally(user_message, query_embedding=None):
+    """Local kNN/centroid prediction: (request_type, confidence, is_confident).
+
+    Outside vector retrieval the query may deliberately have no embedding; then the LLM classifies instead.
+    """
+    if LOCAL_CLASSIFIER_METHOD == "off" or (query_embedding is None and RETRIEVAL_MODE != "vector"):
+        return None, 0.0, False
+    with stage_timer("local_classification"):
+        if query_embedding is None:
+            query_embedding = create_embedding(user_message)
+        return classify_request_locally(query_embedding)
+
+def classify_security_request(user_message, similar_historical_tickets=None, query_embedding=None):
+    local_request_type, _, is_confident = _classify_locally(user_message, query_embedding)
+    if is_confident:
+        return local_request_type
+    
+    return _classify_with_llm(user_message, similar_historical_tickets)
+
+def _classify_with_llm(user_message, similar_historical_tickets=None):
+    if similar_historical_tickets is None:
+        similar_historical_tickets = find_similar_historical_tickets(user_message, number_of_tickets_to_retrieve=3)
+    
+    with stage_timer("classification"):
+        request_types_list = get_request_type_catalog().request_types
+        
+        classification_prompt = _build_classification_prompt(user_message, similar_historical_tickets, request_types_list)
+        
+        return _call_llm_for_text(classification_prompt, call_site="classification")
+
+def _analyze_with_llm(user_message, similar_historical_tickets):
+    with stage_timer("analysis"):
+        request_type_catalog = get_request_type_catalog()
+        
+        analysis_prompt = _build_analysis_prompt(user_message, similar_historical_tickets, request_type_catalog)
+        
+        return _split_analysis(_call_llm_for_json(analysis_prompt, call_site="analysis"), request_type_catalog)
+
+def extract_required_fields_from_request(user_message, request_type, fields_to_extract=None):
+    with stage_timer("extraction"):
+        mandatory_fields_list = get_request_type_catalog().mandatory_fields(request_type)
+        
+        extraction_prompt = _build_extraction_prompt(user_message, mandatory_fields_list if fields_to_extract is None else fields_to_extract)
+        
+        extracted_fields_data = _call_llm_for_json(extraction_prompt, call_site="extraction")
+    
+    provided_fields, missing_fields = _split_extracted_fields(extracted_fields_data)
     
     return provided_fields, missing_fields, mandatory_fields_list
 
+def analyze_security_request(user_message, similar_historical_tickets, query_embedding=None):
+    """(request_type, provided_fields, missing_fields, mandatory_fields) for a new request.
+
+    With MERGED_ANALYSIS, a request the local classifier is not confident about is classified and
+    extracted by one LLM call instead of two.
+    """
+    local_request_type, _, is_confident = _classify_locally(user_message, query_embedding)
+    if is_confident:
+        identified_request_type = local_request_type
+    elif MERGED_ANALYSIS:
+        return _analyze_with_llm(user_message, similar_historical_tickets)
+    else:
+        identified_request_type = _classify_with_llm(user_message, similar_historical_tickets)
+    return (identified_request_type, *extract_required_fields_from_request(user_message, identified_request_type))
+
 def generate_follow_up_question(missing_field_name, conversation_context=""):
     question_prompt = f"""Generate a natural, friendly Slack message asking for: {missing_field_name}
 
@@ -117,25 +219,25 @@ def generate_follow_up_question(missing_field_name, conversation_context=""):
 
                         Keep it brief and conversational. One sentence. Use the person's actual name if provided."""
                             
-    return _call_llm_for_text(question_prompt)
+    return _call_llm_for_text(question_prompt, call_site="follow_up")
 
-def generate_follow_up_questions(missing_fields_list, conversation_context):
-    question_prompt = f"""Generate a natural, friendly Slack message asking for these missing fields: {', '.join(missing_fields_list)}
+def _build_follow_up_questions_prompt(missing_fields_list, conversation_context):
+    return f"""Generate a natural, friendly Slack message asking for these missing fields: {', '.join(missing_fields_list)}
 
                         Context: {conversation_context}
 
                         Keep it conversational and ask for all fields in one message. Use the person's name if provided. 
                         No new lines in the message. No emojis."""
-    
-    return _call_llm_for_text(question_prompt)
 
-def make_security_decision(user_message, request_type, provided_fields, missing_fields, similar_historical_tickets=None):
-    if missing_fields:
-        return "Info Requested", "Missing required fields", None, None
-    
-    if similar_historical_tickets is None:
-        similar_historical_tickets = find_similar_historical_tickets(user_message, number_of_tickets_to_retrieve=5)
+def generate_follow_up_questions(missing_fields_list, conversation_context):
+    question_prompt = _build_follow_up_questions_prompt(missing_fields_list, conversation_context)
     
+    with stage_timer("follow_up"):
+        return _call_llm_for_text(question_prompt, call_site="follow_up")
+
+def _build_decision_prompt(user_message, request_type, provided_fields, similar_historical_tickets):
+    if PROMPT_STYLE == "compact":
+        return build_compact_decision_prompt(user_message, request_type, provided_fields, similar_historical_tickets)
     historical_cases_context = "\n".join([
         f"Similar case: {ticket['request_summary']}\n"
         f"Fields: {ticket['fields_provided']}\n"
@@ -144,7 +246,7 @@ def make_security_decision(user_message, request_type, provided_fields, missing_
         for ticket in similar_historical_tickets
     ])
     
-    decision_prompt = f"""You are Acme's security decision engine.
+    return f"""You are Acme's security decision engine.
 
                 Historical similar cases:
                 {historical_cases_context}
@@ -163,7 +265,20 @@ def make_security_decision(user_message, request_type, provided_fields, missing_
                 "risk_score": 0-100,
                 "confidence_score": 0.0-1.0 (how confident are you in this decision based on similarity to historical cases)
                 }}"""
-                
-    decision_result = _call_llm_for_json(decision_prompt)
-    
+
+def _unpack_decision(decision_result):
     return decision_result["decision"], decision_result["rationale"], decision_result["risk_score"], decision_result["confidence_score"]
+
+def make_security_decision(user_message, request_type, provided_fields, missing_fields, similar_historical_tickets=None):
+    if missing_fields:
+        return "Info Requested", "Missing required fields", None, None
+    
+    if similar_historical_tickets is None:
+        similar_historical_tickets = find_similar_historical_tickets(user_message, number_of_tickets_to_retrieve=5, request_type=request_type)
+    
+    with stage_timer("decision"):
+        decision_prompt = _build_decision_prompt(user_message, request_type, provided_fields, similar_historical_tickets)
+        
+        decision_result = _call_llm_for_json(decision_prompt, call_site="decision")
+    
+    return _unpack_decision(decision_result)
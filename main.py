@@ -1,20 +1,89 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import copy
+import json
+import os
+import time
 import uuid
 from database import Thread, Message, Decision, AuditLog
-from llm_service import classify_security_request, extract_required_fields_from_request, generate_follow_up_questions, make_security_decision, find_similar_historical_tickets
-from utils import get_db_session
+from async_llm_service import aanalyze_security_request, aextract_required_fields_from_request, afind_similar_historical_tickets, aretrieval_query_embedding, agenerate_follow_up_questions, amake_security_decision, astream_follow_up_questions, astream_security_decision
+from conversation_state import acompact_conversation_state, load_conversation_state, save_conversation_state
+from embedding_cache import INCREMENTAL_THREAD_EMBEDDINGS, acreate_embedding, acreate_embeddings, aembed_conversation_turn, commit_thread_embedding, get_embedding_cache
+from llm_response_cache import get_llm_response_cache
+from llm_scheduler import get_llm_scheduler, llm_priority
+from metrics import message_profile, render_prometheus_text, stage_timer
+from request_catalog import get_request_type_catalog
+from request_classifier import get_local_request_classifier
+from risk_rollups import get_risk_posture, get_risk_rollups, record_decision_rollup
+from vector_index import RETRIEVAL_MODE, get_historical_ticket_index
+from utils import get_async_db_session, get_async_openai_client, get_db_session, get_openai_client, request_scoped_async_db_session
+from write_behind import flush_write_behind, get_write_behind_queue, insert_row_behind
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from llm_service import _call_llm_for_json
+from datetime import datetime
+from sqlalchemy import event
 
 load_dotenv()
 
-app = FastAPI()
+BATCH_LLM_WORKERS = int(os.getenv("BATCH_LLM_WORKERS", "16"))
+BATCH_COMMIT_ROWS = int(os.getenv("BATCH_COMMIT_ROWS", "100"))
+EMBEDDING_REQUEST_MAX_INPUTS = 2048
+# background: accept connections straight away and warm up behind them, with /ready reporting progress;
+# blocking: warm up before accepting connections; off: build everything on first use.
+WARM_UP = os.getenv("WARM_UP", "background")
+
+_warm_up_state = {"ready": WARM_UP == "off", "step_seconds": {}, "error": None}
+
+def _warm_up():
+    """Build everything the first message would otherwise build, timing each step for /ready."""
+    warm_up_steps = [
+        ("openai_clients", lambda: (get_openai_client(), get_async_openai_client())),
+        ("historical_ticket_index", get_historical_ticket_index),
+        ("local_request_classifier", get_local_request_classifier),
+        ("request_type_catalog", get_request_type_catalog),
+        ("risk_rollups", get_risk_rollups),
+        ("caches_and_queues", lambda: (get_embedding_cache(), get_llm_response_cache(), get_llm_scheduler(), get_write_behind_queue()))
+    ]
+    if RETRIEVAL_MODE != "vector":
+        warm_up_steps.insert(2, ("lexical_index", lambda: get_historical_ticket_index().lexical_index()))
+    try:
+        for step_name, warm_up_step in warm_up_steps:
+            step_started_at = time.perf_counter()
+            warm_up_step()
+            _warm_up_state["step_seconds"][step_name] = round(time.perf_counter() - step_started_at, 3)
+    except Exception as warm_up_error:
+        # Requests still work, building what they need lazily; /ready keeps reporting not ready.
+        _warm_up_state["error"] = str(warm_up_error)
+        print(f"Warm-up failed: {warm_up_error}")
+        return
+    _warm_up_state["ready"] = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = None
+    if WARM_UP == "blocking":
+        await asyncio.to_thread(_warm_up)
+    elif WARM_UP != "off":
+        warm_up_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        await warm_up_task
+    await asyncio.to_thread(flush_write_behind, 10)
+
+app = FastAPI(lifespan=lifespan)
 
 class MessageInput(BaseModel):
     text: str
 
+class MessageBatchItem(BaseModel):
+    thread_id: str | None = None
+    text: str
+
+class MessageBatchInput(BaseModel):
+    messages: list[MessageBatchItem]
+
 @app.post("/threads")
 def create_new_thread():
     unique_thread_identifier = str(uuid.uuid4())
@@ -25,22 +94,21 @@ def create_new_thread():
     
     return {"thread_id": unique_thread_identifier}
 
-def _save_user_message(database_session, thread_id: str, message_text: str):
-    user_message = Message(thread_id=thread_id, role="user", text=message_text)
-    database_session.add(user_message)
-    database_session.commit()
-
-def _build_conversation_history(database_session, thread_id: str) -> str:
-    all_messages_in_thread = database_session.query(Message).filter_by(thread_id=thread_id).order_by(Message.timestamp).all()
-    complete_conversation_text = "\n".join([f"{message_record.role}: {message_record.text}" for message_record in all_messages_in_thread])
-    return complete_conversation_text
+def _save_user_message(thread_id: str, message_text: str):
+    insert_row_behind(Message, thread_id=thread_id, role="user", text=message_text, timestamp=datetime.utcnow())
 
-def _analyze_security_request(complete_conversation_text: str, similar_historical_tickets):
-    identified_request_type = classify_security_request(complete_conversation_text, similar_historical_tickets)
-    provided_fields, missing_fields, mandatory_fields = extract_required_fields_from_request(complete_conversation_text, identified_request_type)
-    return identified_request_type, provided_fields, missing_fields, mandatory_fields
+async def _aanalyze_security_request(conversation_state, new_message_text: str, similar_historical_tickets, query_embedding=None):
+    if not conversation_state.is_classified:
+        return await aanalyze_security_request(conversation_state.context_text(), similar_historical_tickets, query_embedding=query_embedding)
+    
+    provided_fields, missing_fields = conversation_state.provided_fields, conversation_state.missing_fields
+    fields_to_extract = conversation_state.fields_to_extract(new_message_text)
+    if fields_to_extract:
+        newly_provided_fields, _, _ = await aextract_required_fields_from_request(new_message_text, conversation_state.request_type, fields_to_extract=fields_to_extract)
+        provided_fields, missing_fields = conversation_state.merge_extracted_fields(newly_provided_fields)
+    return conversation_state.request_type, provided_fields, missing_fields, conversation_state.mandatory_fields
 
-def _determine_next_action(complete_conversation_text: str, identified_request_type: str, provided_fields, missing_fields, similar_historical_tickets):
+async def _adetermine_next_action(conversation_context: str, identified_request_type: str, provided_fields, missing_fields, similar_historical_tickets):
     next_question_to_ask = None
     final_decision_outcome = None
     decision_rationale = None
@@ -48,10 +116,10 @@ def _determine_next_action(complete_conversation_text: str, identified_request_t
     calculated_confidence_score = None
     
     if missing_fields:
-        next_question_to_ask = generate_follow_up_questions(missing_fields, complete_conversation_text)
+        next_question_to_ask = await agenerate_follow_up_questions(missing_fields, conversation_context)
     else:
-        final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = make_security_decision(
-            complete_conversation_text, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
+        final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = await amake_security_decision(
+            conversation_context, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
         )
     
     return next_question_to_ask, final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score
@@ -70,7 +138,9 @@ def _upsert_decision_record(database_session, thread_id: str, identified_request
         existing_decision_record.rationale = decision_rationale
         existing_decision_record.risk_score = calculated_risk_score
         existing_decision_record.confidence_score = calculated_confidence_score
+        decision_created_at = existing_decision_record.created_at
     else:
+        decision_created_at = datetime.utcnow()
         new_decision_record = Decision(
             thread_id=thread_id,
             request_type=identified_request_type,
@@ -80,13 +150,19 @@ def _upsert_decision_record(database_session, thread_id: str, identified_request
             outcome=final_decision_outcome,
             rationale=decision_rationale,
             risk_score=calculated_risk_score,
-            confidence_score=calculated_confidence_score
+            confidence_score=calculated_confidence_score,
+            created_at=decision_created_at
         )
         database_session.add(new_decision_record)
+    
+    event.listen(database_session, "after_commit", lambda committed_session: record_decision_rollup(
+        thread_id, decision_created_at, identified_request_type, final_decision_outcome, calculated_risk_score
+    ), once=True)
 
-def _create_audit_log(database_session, thread_id: str, message_text: str, 
+def _create_audit_log(thread_id: str, message_text: str, 
                       identified_request_type: str, missing_fields, final_decision_outcome):
-    audit_log_entry = AuditLog(
+    insert_row_behind(
+        AuditLog,
         thread_id=thread_id,
         action="process_message",
         input_data={"text": message_text},
@@ -94,32 +170,64 @@ def _create_audit_log(database_session, thread_id: str, message_text: str,
             "request_type": identified_request_type,
             "missing_fields": missing_fields,
             "decision": final_decision_outcome
-        }
+        },
+        timestamp=datetime.utcnow()
     )
-    database_session.add(audit_log_entry)
 
-@app.post("/threads/{thread_id}/messages")
-def process_incoming_message(thread_id: str, message: MessageInput):
-    with get_db_session() as database_session:
-        _save_user_message(database_session, thread_id, message.text)
-        
-        complete_conversation_text = _build_conversation_history(database_session, thread_id)
-        
-        similar_historical_tickets = find_similar_historical_tickets(complete_conversation_text, number_of_tickets_to_retrieve=5)
-        
-        identified_request_type, provided_fields, missing_fields, mandatory_fields = _analyze_security_request(complete_conversation_text, similar_historical_tickets)
-        
-        next_question_to_ask, final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = _determine_next_action(
-            complete_conversation_text, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
-        )
-        
-        _upsert_decision_record(
-            database_session, thread_id, identified_request_type, 
-            provided_fields, missing_fields, mandatory_fields,
-            final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score
-        )
-        
-        _create_audit_log(database_session, thread_id, message.text, identified_request_type, missing_fields, final_decision_outcome)
+async def _aanalyze_incoming_message(thread_id: str, message: MessageInput):
+    with stage_timer("db_read"):
+        async with get_async_db_session() as database_session:
+            conversation_state = await database_session.run_sync(load_conversation_state, thread_id)
+    _save_user_message(thread_id, message.text)
+    conversation_state.append_message("user", message.text)
+    with stage_timer("summary"):
+        conversation_context = (await acompact_conversation_state(conversation_state)).context_text()
+    
+    thread_embedding_update = None
+    with stage_timer("embedding"):
+        if INCREMENTAL_THREAD_EMBEDDINGS:
+            query_embedding, thread_embedding_update = await aretrieval_query_embedding(
+                lambda: aembed_conversation_turn(thread_id, conversation_state.message_count, message.text, conversation_context)
+            ) or (None, None)
+        else:
+            query_embedding = await aretrieval_query_embedding(lambda: acreate_embedding(conversation_context))
+    similar_historical_tickets = await afind_similar_historical_tickets(
+        conversation_context, number_of_tickets_to_retrieve=5, query_embedding=query_embedding, embed_missing_query=False
+    )
+    
+    security_analysis = await _aanalyze_security_request(conversation_state, message.text, similar_historical_tickets, query_embedding)
+    return conversation_state, conversation_context, similar_historical_tickets, security_analysis, thread_embedding_update
+
+async def _asave_message_outcome(conversation_state, message_text: str, identified_request_type: str,
+                                 provided_fields, missing_fields, mandatory_fields,
+                                 final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score,
+                                 thread_embedding_update=None):
+    thread_id = conversation_state.thread_id
+    conversation_state.record_analysis(identified_request_type, provided_fields, missing_fields, mandatory_fields)
+    with stage_timer("db_write"):
+        async with get_async_db_session() as database_session:
+            await database_session.run_sync(save_conversation_state, conversation_state)
+            await database_session.run_sync(
+                _upsert_decision_record, thread_id, identified_request_type, 
+                provided_fields, missing_fields, mandatory_fields,
+                final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score
+            )
+    # Only a saved turn advances the cached thread vector.
+    if thread_embedding_update is not None:
+        commit_thread_embedding(*thread_embedding_update)
+    _create_audit_log(thread_id, message_text, identified_request_type, missing_fields, final_decision_outcome)
+
+async def _aprocess_incoming_message(thread_id: str, message: MessageInput):
+    conversation_state, conversation_context, similar_historical_tickets, (identified_request_type, provided_fields, missing_fields, mandatory_fields), thread_embedding_update = await _aanalyze_incoming_message(thread_id, message)
+    
+    next_question_to_ask, final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = await _adetermine_next_action(
+        conversation_context, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
+    )
+    
+    await _asave_message_outcome(
+        conversation_state, message.text, identified_request_type, provided_fields, missing_fields, mandatory_fields,
+        final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score, thread_embedding_update
+    )
     
     return {
         "request_type": identified_request_type,
@@ -131,76 +239,246 @@ def process_incoming_message(thread_id: str, message: MessageInput):
         "rationale": decision_rationale
     }
 
-@app.get("/health")
-def comprehensive_risk_posture():
+async def _astream_incoming_message(thread_id: str, message: MessageInput):
+    """_aprocess_incoming_message() as a sequence of events, streaming the follow-up question or decision rationale.
+
+    Yields {"event": "analysis"} once the request type and missing fields are known, {"event": "token"}
+    for each piece of generated text, then {"event": "result"} with the usual response after it is saved.
+    """
+    conversation_state, conversation_context, similar_historical_tickets, (identified_request_type, provided_fields, missing_fields, mandatory_fields), thread_embedding_update = await _aanalyze_incoming_message(thread_id, message)
+    yield {"event": "analysis", "request_type": identified_request_type, "missing_fields": missing_fields}
     
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+    next_question_to_ask = None
+    final_decision_outcome = None
+    decision_rationale = None
+    calculated_risk_score = None
+    calculated_confidence_score = None
     
-    with get_db_session() as database_session:
-        # Top 5 riskiest recent decisions
-        riskiest_decisions = database_session.query(Decision).filter(
-            Decision.created_at >= thirty_days_ago,
-            Decision.risk_score.isnot(None)
-        ).order_by(Decision.risk_score.desc()).limit(5).all()
-        
-        total_requests = database_session.query(Decision).filter(
-            Decision.created_at >= thirty_days_ago
-        ).count()
-        
-        risky_requests = []
-        for d in riskiest_decisions:
-            messages = database_session.query(Message).filter_by(
-                thread_id=d.thread_id,
-                role="user"
-            ).order_by(Message.timestamp).all()
-            
-            request_text = " ".join([m.text for m in messages])
-            
-            risky_requests.append({
-                "request_type": d.request_type,
-                "risk_score": d.risk_score,
-                "outcome": d.outcome,
-                "request_summary": request_text[:200],
-                "extracted_fields": d.extracted_fields,
-                "rationale": d.rationale
-            })
-        
-        formatted_requests = []
-        for i, request in enumerate(risky_requests, start=1):
-            formatted_request = (
-                f"{i}. [{request['request_type']}] Risk: {request['risk_score']}/100 - {request['outcome']}\n"
-                f"Summary: {request['request_summary']}\n"
-                f"Rationale: {request['rationale']}"
-            )
-            formatted_requests.append(formatted_request)
-        
-        risky_requests_text = "\n".join(formatted_requests)
-        
-        llm_prompt = f"""Analyze these 5 riskiest security requests from the last 30 days. Identify patterns and concerns.
-
-                        Riskiest Requests:
-                        {risky_requests_text}
-
-                        Provide JSON with:
-                        {{
-                            "patterns_detected": ["pattern 1", "pattern 2"],
-                            "common_risk_factors": ["factor 1", "factor 2"],
-                            "recommendations": ["action 1", "action 2"],
-                            "alert_level": "low/medium/high"
-                        }}"""
-
-        try:
-            pattern_analysis = _call_llm_for_json(llm_prompt)
-        except Exception:
-            pattern_analysis = {"error": "Analysis unavailable"}
+    if missing_fields:
+        question_parts = []
+        async for content_delta in astream_follow_up_questions(missing_fields, conversation_context):
+            question_parts.append(content_delta)
+            yield {"event": "token", "text": content_delta}
+        next_question_to_ask = "".join(question_parts).strip()
+    else:
+        async for rationale_delta, security_decision in astream_security_decision(
+            conversation_context, identified_request_type, provided_fields, similar_historical_tickets
+        ):
+            if security_decision is not None:
+                final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = security_decision
+            elif rationale_delta:
+                yield {"event": "token", "text": rationale_delta}
     
-    return {
-        "period": "last_30_days",
-        "total_requests": total_requests,
-        "top_5_riskiest": risky_requests,
-        "pattern_analysis": pattern_analysis
+    await _asave_message_outcome(
+        conversation_state, message.text, identified_request_type, provided_fields, missing_fields, mandatory_fields,
+        final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score, thread_embedding_update
+    )
+    
+    yield {
+        "event": "result",
+        "request_type": identified_request_type,
+        "risk_score": calculated_risk_score,
+        "confidence_score": calculated_confidence_score,
+        "missing_fields": missing_fields,
+        "next_question": next_question_to_ask,
+        "final_decision": final_decision_outcome,
+        "rationale": decision_rationale
     }
 
+def _load_batch_conversation_states(database_session, thread_ids, new_thread_ids):
+    for thread_id in new_thread_ids:
+        database_session.add(Thread(thread_id=thread_id, slack_thread_ts=thread_id))
+    return {thread_id: load_conversation_state(database_session, thread_id) for thread_id in dict.fromkeys(thread_ids)}
+
+def _save_batch_decisions(database_session, conversation_states, pending_decisions):
+    for thread_id, decision_arguments in pending_decisions.items():
+        save_conversation_state(database_session, conversation_states[thread_id])
+        _upsert_decision_record(database_session, thread_id, *decision_arguments)
+
+async def _aprocess_batch_item(conversation_state, message_text: str, query_embedding, similar_historical_tickets):
+    thread_id = conversation_state.thread_id
+    _save_user_message(thread_id, message_text)
+    conversation_state.append_message("user", message_text)
+    with stage_timer("summary"):
+        conversation_context = (await acompact_conversation_state(conversation_state)).context_text()
+    
+    identified_request_type, provided_fields, missing_fields, mandatory_fields = await _aanalyze_security_request(
+        conversation_state, message_text, similar_historical_tickets, query_embedding
+    )
+    
+    next_question_to_ask, final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score = await _adetermine_next_action(
+        conversation_context, identified_request_type, provided_fields, missing_fields, similar_historical_tickets
+    )
+    
+    conversation_state.record_analysis(identified_request_type, provided_fields, missing_fields, mandatory_fields)
+    _create_audit_log(thread_id, message_text, identified_request_type, missing_fields, final_decision_outcome)
+    
+    decision_arguments = (
+        identified_request_type, provided_fields, missing_fields, mandatory_fields,
+        final_decision_outcome, decision_rationale, calculated_risk_score, calculated_confidence_score
+    )
+    return {
+        "request_type": identified_request_type,
+        "risk_score": calculated_risk_score,
+        "confidence_score": calculated_confidence_score,
+        "missing_fields": missing_fields,
+        "next_question": next_question_to_ask,
+        "final_decision": final_decision_outcome,
+        "rationale": decision_rationale
+    }, decision_arguments
+
+async def aprocess_message_batch(message_items):
+    """Process many (thread_id, text) messages, yielding (item_index, result) as each one finishes.
+
+    Every query is embedded up front in as few embeddings requests as possible (unless retrieval is
+    lexical), and vector retrieval for the whole batch is one matrix product. A pool of BATCH_LLM_WORKERS
+    workers then takes one thread at a time, so messages in the same thread are still handled in order.
+    Items without a thread_id start a new thread. Decisions and thread states are committed together every BATCH_COMMIT_ROWS threads, so
+    a result can be yielded shortly before it is persisted.
+    """
+    thread_ids = [message_item.thread_id or str(uuid.uuid4()) for message_item in message_items]
+    new_thread_ids = [thread_id for message_item, thread_id in zip(message_items, thread_ids) if message_item.thread_id is None]
+    with stage_timer("db_read"):
+        async with get_async_db_session() as database_session:
+            conversation_states = await database_session.run_sync(_load_batch_conversation_states, thread_ids, new_thread_ids)
+    
+    # Query texts as the single-message path would build them, before any summary folding.
+    preview_states = {thread_id: copy.copy(conversation_state) for thread_id, conversation_state in conversation_states.items()}
+    query_texts = []
+    for message_item, thread_id in zip(message_items, thread_ids):
+        preview_states[thread_id].append_message("user", message_item.text)
+        query_texts.append(preview_states[thread_id].context_text())
+    
+    query_embeddings = [None] * len(query_texts)
+    if RETRIEVAL_MODE != "lexical":
+        with stage_timer("embedding"), llm_priority("bulk"):
+            query_embeddings = []
+            for start_index in range(0, len(query_texts), EMBEDDING_REQUEST_MAX_INPUTS):
+                query_embeddings.extend(await acreate_embeddings(query_texts[start_index:start_index + EMBEDDING_REQUEST_MAX_INPUTS]))
+    with stage_timer("retrieval"):
+        if RETRIEVAL_MODE == "vector":
+            similar_tickets_per_item = await asyncio.to_thread(lambda: get_historical_ticket_index().search_many(query_embeddings, 5))
+        else:
+            similar_tickets_per_item = await asyncio.to_thread(lambda: [
+                get_historical_ticket_index().retrieve(query_text, query_embedding, 5)
+                for query_text, query_embedding in zip(query_texts, query_embeddings)
+            ])
+    
+    item_indices_by_thread = {}
+    for item_index, thread_id in enumerate(thread_ids):
+        item_indices_by_thread.setdefault(thread_id, []).append(item_index)
+    pending_threads = asyncio.Queue()
+    for thread_id in item_indices_by_thread:
+        pending_threads.put_nowait(thread_id)
+    finished_items = asyncio.Queue()
+    
+    async def run_worker():
+        while not pending_threads.empty():
+            thread_id = pending_threads.get_nowait()
+            failed_item_index = None
+            for item_index in item_indices_by_thread[thread_id]:
+                if failed_item_index is not None:
+                    # Later messages in the thread would be answered without the one that failed.
+                    finished_items.put_nowait((item_index, {"error": f"Skipped because message {failed_item_index} in this thread failed"}, None))
+                    continue
+                state_before_item = copy.copy(conversation_states[thread_id])
+                try:
+                    item_result, decision_arguments = await _aprocess_batch_item(
+                        conversation_states[thread_id], message_items[item_index].text,
+                        query_embeddings[item_index], similar_tickets_per_item[item_index]
+                    )
+                except Exception as item_error:
+                    # Drop the half-processed transcript so an earlier item's pending decision saves the state it was made with.
+                    conversation_states[thread_id] = state_before_item
+                    failed_item_index = item_index
+                    item_result, decision_arguments = {"error": str(item_error)}, None
+                finished_items.put_nowait((item_index, item_result, decision_arguments))
+    
+    # Workers copy the context they are created in, so all their LLM calls queue behind interactive traffic.
+    with llm_priority("bulk"):
+        worker_tasks = [asyncio.create_task(run_worker()) for _ in range(min(BATCH_LLM_WORKERS, len(item_indices_by_thread)))]
+    pending_decisions = {}
+    try:
+        for _ in range(len(message_items)):
+            item_index, item_result, decision_arguments = await finished_items.get()
+            if decision_arguments is not None:
+                pending_decisions[thread_ids[item_index]] = decision_arguments
+            if len(pending_decisions) >= BATCH_COMMIT_ROWS:
+                committed_decisions, pending_decisions = pending_decisions, {}
+                with stage_timer("db_write"):
+                    async with get_async_db_session() as database_session:
+                        await database_session.run_sync(_save_batch_decisions, conversation_states, committed_decisions)
+            yield item_index, {"thread_id": thread_ids[item_index], **item_result}
+    finally:
+        for worker_task in worker_tasks:
+            worker_task.cancel()
+        if pending_decisions:
+            with stage_timer("db_write"):
+                async with get_async_db_session() as database_session:
+                    await database_session.run_sync(_save_batch_decisions, conversation_states, pending_decisions)
+
+@app.post("/threads/{thread_id}/messages")
+async def process_incoming_message(thread_id: str, message: MessageInput, include_timings: bool = False):
+    with message_profile() as profile:
+        async with request_scoped_async_db_session():
+            message_result = await _aprocess_incoming_message(thread_id, message)
+    if include_timings:
+        message_result["timings"] = profile.as_dict()
+    return message_result
+
+@app.post("/threads/{thread_id}/messages/stream")
+async def stream_incoming_message(thread_id: str, message: MessageInput, include_timings: bool = False):
+    """Streams the events of _astream_incoming_message() as NDJSON, so the reply can be shown as it is written."""
+    async def stream_message_events():
+        with message_profile() as profile:
+            async with request_scoped_async_db_session():
+                try:
+                    async for message_event in _astream_incoming_message(thread_id, message):
+                        if message_event["event"] == "result" and include_timings:
+                            message_event["timings"] = profile.as_dict()
+                        yield json.dumps(message_event) + "\n"
+                except Exception as message_error:
+                    # The 200 status has already been sent, so the failure has to travel in the stream.
+                    yield json.dumps({"event": "error", "error": str(message_error)}) + "\n"
+    
+    return StreamingResponse(stream_message_events(), media_type="application/x-ndjson")
+
+@app.post("/messages/batch")
+async def process_message_batch(message_batch: MessageBatchInput):
+    """Streams one NDJSON line per message, in completion order, each tagged with its index in the request."""
+    async def stream_item_results():
+        async for item_index, item_result in aprocess_message_batch(message_batch.messages):
+            yield json.dumps({"index": item_index, **item_result}) + "\n"
+    
+    return StreamingResponse(stream_item_results(), media_type="application/x-ndjson")
+
+@app.get("/health")
+def comprehensive_risk_posture():
+    return get_risk_posture()
+
+@app.get("/ready")
+def readiness():
+    """503 until the warm-up has finished, for load balancers and autoscalers to hold traffic back."""
+    return JSONResponse(_warm_up_state, status_code=200 if _warm_up_state["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(render_prometheus_text(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from vector_index import historical_ticket_index_snapshot_is_current, write_historical_ticket_index_snapshot
+    argument_parser = argparse.ArgumentParser(description="Serve the Acme security bot")
+    argument_parser.add_argument("--host", default="0.0.0.0")
+    argument_parser.add_argument("--port", type=int, default=8000)
+    argument_parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "1")), help="Worker processes, sharing one memory-mapped index snapshot")
+    arguments = argument_parser.parse_args()
+    if arguments.workers > 1:
+        # Written once here, so workers map the same file instead of each loading every embedding from the database.
+        if not historical_ticket_index_snapshot_is_current():
+            write_historical_ticket_index_snapshot()
+        os.environ["WORKER_PROCESSES"] = str(arguments.workers)
+        uvicorn.run("main:app", host=arguments.host, port=arguments.port, workers=arguments.workers)
+    else:
+        uvicorn.run(app, host=arguments.host, port=arguments.port)
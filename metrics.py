@@ -0,0 +1,175 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PER_MESSAGE_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+PER_MESSAGE_TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_registered_metrics = []
+_collectors = []
+_current_message_profile = contextvars.ContextVar("current_message_profile", default=None)
+
+def _escape_label_value(label_value):
+    return str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_pairs):
+    if not label_pairs:
+        return ""
+    return "{" + ",".join(f'{label_name}="{_escape_label_value(label_value)}"' for label_name, label_value in label_pairs) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registered_metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        label_values = tuple(labels.get(label_name, "") for label_name in self.label_names)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, label_values)))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registered_metrics.append(self)
+
+    def observe(self, value, **labels):
+        label_values = tuple(labels.get(label_name, "") for label_name in self.label_names)
+        with self._lock:
+            bucket_counts, observation_sum, observation_count = self._series.get(label_values, ([0] * len(self.buckets), 0.0, 0))
+            for bucket_index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[bucket_index] += 1
+            self._series[label_values] = (bucket_counts, observation_sum + value, observation_count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, observation_sum, observation_count) in sorted(self._series.items()):
+                label_pairs = list(zip(self.label_names, label_values))
+                for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(label_pairs + [('le', upper_bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(label_pairs + [('le', '+Inf')])} {observation_count}")
+                lines.append(f"{self.name}_sum{_format_labels(label_pairs)} {observation_sum}")
+                lines.append(f"{self.name}_count{_format_labels(label_pairs)} {observation_count}")
+        return lines
+
+STAGE_DURATION_SECONDS = Histogram("acme_stage_duration_seconds", "Time spent in each message pipeline stage", ["stage"])
+MESSAGE_DURATION_SECONDS = Histogram("acme_message_duration_seconds", "End-to-end time to process one Slack message")
+LLM_REQUEST_DURATION_SECONDS = Histogram("acme_llm_request_duration_seconds", "Chat completion latency by call site", ["call_site"])
+LLM_REQUESTS_TOTAL = Counter("acme_llm_requests_total", "Chat completions sent to the API by call site", ["call_site"])
+LLM_TOKENS_TOTAL = Counter("acme_llm_tokens_total", "Chat completion tokens by call site and kind", ["call_site", "kind"])
+LLM_CALLS_PER_MESSAGE = Histogram("acme_llm_calls_per_message", "Chat completions sent while processing one message", buckets=PER_MESSAGE_COUNT_BUCKETS)
+LLM_TOKENS_PER_MESSAGE = Histogram("acme_llm_tokens_per_message", "Chat completion tokens spent on one message", buckets=PER_MESSAGE_TOKEN_BUCKETS)
+DB_SESSIONS_TOTAL = Counter("acme_db_sessions_total", "Database sessions opened", ["kind"])
+DB_SESSION_DURATION_SECONDS = Histogram("acme_db_session_duration_seconds", "Time database sessions stay open", ["kind"])
+VECTOR_SEARCH_DURATION_SECONDS = Histogram("acme_vector_search_duration_seconds", "Historical ticket index search time", ["filtered"])
+LEXICAL_SEARCH_DURATION_SECONDS = Histogram("acme_lexical_search_duration_seconds", "BM25 search time over historical tickets", ["filtered"])
+RETRIEVAL_EMBEDDING_FALLBACKS_TOTAL = Counter("acme_retrieval_embedding_fallbacks_total", "Hybrid retrievals served lexically because the query embedding failed or timed out")
+
+class MessageProfile:
+    """Timings and LLM usage accumulated while one message is processed, for the optional response breakdown."""
+
+    def __init__(self):
+        self.stage_seconds = {}
+        self.llm_calls = 0
+        self.llm_tokens = 0
+        self.db_sessions = 0
+        self.total_seconds = None
+        self._lock = threading.Lock()
+
+    def add_stage_time(self, stage, elapsed_seconds):
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + elapsed_seconds
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.total_seconds * 1000, 2) if self.total_seconds is not None else None,
+            "stages_ms": {stage: round(elapsed_seconds * 1000, 2) for stage, elapsed_seconds in self.stage_seconds.items()},
+            "llm_calls": self.llm_calls,
+            "llm_tokens": self.llm_tokens,
+            "db_sessions": self.db_sessions
+        }
+
+@contextmanager
+def message_profile():
+    """Collect a MessageProfile for the enclosed work, including threads started with asyncio.to_thread."""
+    profile = MessageProfile()
+    context_token = _current_message_profile.set(profile)
+    started_at = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        _current_message_profile.reset(context_token)
+        profile.total_seconds = time.perf_counter() - started_at
+        MESSAGE_DURATION_SECONDS.observe(profile.total_seconds)
+        LLM_CALLS_PER_MESSAGE.observe(profile.llm_calls)
+        LLM_TOKENS_PER_MESSAGE.observe(profile.llm_tokens)
+
+@contextmanager
+def stage_timer(stage):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_seconds = time.perf_counter() - started_at
+        STAGE_DURATION_SECONDS.observe(elapsed_seconds, stage=stage)
+        profile = _current_message_profile.get()
+        if profile is not None:
+            profile.add_stage_time(stage, elapsed_seconds)
+
+def record_llm_request(call_site, elapsed_seconds, usage):
+    call_site = call_site or "other"
+    LLM_REQUESTS_TOTAL.inc(call_site=call_site)
+    LLM_REQUEST_DURATION_SECONDS.observe(elapsed_seconds, call_site=call_site)
+    total_tokens = 0
+    if usage is not None:
+        LLM_TOKENS_TOTAL.inc(usage.prompt_tokens, call_site=call_site, kind="prompt")
+        LLM_TOKENS_TOTAL.inc(usage.completion_tokens, call_site=call_site, kind="completion")
+        total_tokens = usage.total_tokens
+    profile = _current_message_profile.get()
+    if profile is not None:
+        with profile._lock:
+            profile.llm_calls += 1
+            profile.llm_tokens += total_tokens
+
+def record_db_session(kind, elapsed_seconds):
+    DB_SESSIONS_TOTAL.inc(kind=kind)
+    DB_SESSION_DURATION_SECONDS.observe(elapsed_seconds, kind=kind)
+    profile = _current_message_profile.get()
+    if profile is not None:
+        with profile._lock:
+            profile.db_sessions += 1
+
+def register_collector(collector):
+    """collector() returns [(name, type, documentation, [(labels_dict, value), ...])], read at scrape time."""
+    _collectors.append(collector)
+
+def render_prometheus_text():
+    lines = []
+    for registered_metric in _registered_metrics:
+        lines.extend(registered_metric.render())
+    for collector in _collectors:
+        for metric_name, metric_type, documentation, samples in collector():
+            lines.append(f"# HELP {metric_name} {documentation}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{metric_name}{_format_labels(sorted(labels.items()))} {value}")
+    return "\n".join(lines) + "\n"
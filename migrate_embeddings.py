@@ -0,0 +1,92 @@
+import argparse
+import json
+from sqlalchemy import bindparam, inspect, null, select, text, update
+from database import engine, record_historical_ticket_change, HistoricalTicket
+from embedding_store import EMBEDDING_QUANTIZATION, SUPPORTED_QUANTIZATIONS, decode_embedding, encode_embedding
+from ticket_importer import _text_hash, _ticket_embedding_text
+
+def _add_missing_embedding_columns():
+    existing_columns = {column["name"] for column in inspect(engine).get_columns("historical_tickets")}
+    with engine.begin() as connection:
+        if "embedding_vector" not in existing_columns:
+            embedding_vector_type = HistoricalTicket.__table__.c.embedding_vector.type.compile(dialect=engine.dialect)
+            connection.execute(text(f"ALTER TABLE historical_tickets ADD COLUMN embedding_vector {embedding_vector_type}"))
+        if "embedding_scale" not in existing_columns:
+            connection.execute(text("ALTER TABLE historical_tickets ADD COLUMN embedding_scale FLOAT"))
+        if "text_hash" not in existing_columns:
+            connection.execute(text("ALTER TABLE historical_tickets ADD COLUMN text_hash VARCHAR"))
+
+def _read_stored_embedding(ticket_row):
+    if ticket_row.embedding_vector is not None:
+        return decode_embedding(ticket_row.embedding_vector, ticket_row.embedding_scale)
+    if isinstance(ticket_row.embedding, str):
+        return json.loads(ticket_row.embedding)
+    return ticket_row.embedding
+
+def _is_in_target_format(ticket_row, quantization):
+    if ticket_row.embedding_vector is None:
+        return False
+    return (ticket_row.embedding_scale is not None) == (quantization == "int8")
+
+def migrate_historical_embeddings(quantization=EMBEDDING_QUANTIZATION, batch_size=500, vacuum=True):
+    """Convert JSON (or differently quantized) embeddings in historical_tickets to BLOB storage.
+
+    Also fills in text_hash where it is missing, so the index fingerprint can read it and the
+    importer recognises these tickets as unchanged instead of embedding them again.
+    """
+    _add_missing_embedding_columns()
+
+    with engine.connect() as connection:
+        ticket_rows = connection.execute(select(
+            HistoricalTicket.ticket_id,
+            HistoricalTicket.request_type,
+            HistoricalTicket.request_summary,
+            HistoricalTicket.details,
+            HistoricalTicket.text_hash,
+            HistoricalTicket.embedding,
+            HistoricalTicket.embedding_vector,
+            HistoricalTicket.embedding_scale
+        )).all()
+
+    pending_updates = []
+    pending_text_hashes = [
+        {"target_ticket_id": ticket_row.ticket_id, "text_hash": _text_hash(_ticket_embedding_text(ticket_row._mapping))}
+        for ticket_row in ticket_rows if ticket_row.text_hash is None
+    ]
+    for ticket_row in ticket_rows:
+        if _is_in_target_format(ticket_row, quantization):
+            continue
+        stored_embedding = _read_stored_embedding(ticket_row)
+        if stored_embedding is None:
+            continue
+        embedding_blob, embedding_scale = encode_embedding(stored_embedding, quantization)
+        pending_updates.append({"target_ticket_id": ticket_row.ticket_id, "vector": embedding_blob, "scale": embedding_scale})
+
+    update_statement = update(HistoricalTicket).where(
+        HistoricalTicket.ticket_id == bindparam("target_ticket_id")
+    ).values(embedding_vector=bindparam("vector"), embedding_scale=bindparam("scale"), embedding=null())
+    for start_index in range(0, len(pending_updates), batch_size):
+        with engine.begin() as connection:
+            connection.execute(update_statement, pending_updates[start_index:start_index + batch_size])
+            record_historical_ticket_change(connection)
+    text_hash_statement = update(HistoricalTicket).where(
+        HistoricalTicket.ticket_id == bindparam("target_ticket_id")
+    ).values(text_hash=bindparam("text_hash"))
+    for start_index in range(0, len(pending_text_hashes), batch_size):
+        with engine.begin() as connection:
+            connection.execute(text_hash_statement, pending_text_hashes[start_index:start_index + batch_size])
+            record_historical_ticket_change(connection)
+
+    if vacuum and pending_updates and engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+
+    print(f"Migrated {len(pending_updates)} of {len(ticket_rows)} historical ticket embeddings to {quantization}")
+    return len(pending_updates)
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Convert historical ticket embeddings to compact BLOB storage")
+    argument_parser.add_argument("--quantization", choices=SUPPORTED_QUANTIZATIONS, default=EMBEDDING_QUANTIZATION)
+    argument_parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM after converting")
+    arguments = argument_parser.parse_args()
+    migrate_historical_embeddings(arguments.quantization, vacuum=not arguments.no_vacuum)
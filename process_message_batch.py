@@ -0,0 +1,46 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import sys
+import time
+from main import MessageBatchItem, aprocess_message_batch
+from request_catalog import get_request_type_catalog
+from risk_rollups import get_risk_rollups
+from write_behind import flush_write_behind
+
+def read_message_items(input_file_path):
+    """Messages from a .jsonl file ({"thread_id": ..., "text": ...} per line) or a CSV with thread_id and text columns."""
+    with open(input_file_path, newline="", encoding="utf-8") as input_file:
+        if input_file_path.endswith(".csv"):
+            message_rows = list(csv.DictReader(input_file))
+        else:
+            message_rows = [json.loads(line) for line in input_file if line.strip()]
+    return [MessageBatchItem(thread_id=message_row.get("thread_id") or None, text=message_row["text"]) for message_row in message_rows]
+
+async def aprocess_message_file(input_file_path, output_file, chunk_size):
+    message_items = read_message_items(input_file_path)
+    await asyncio.to_thread(get_request_type_catalog)
+    await asyncio.to_thread(get_risk_rollups)
+    failed_items = 0
+    # Chunks run one after another, so a thread split across chunks still sees its messages in order.
+    for chunk_start in range(0, len(message_items), chunk_size):
+        async for item_index, item_result in aprocess_message_batch(message_items[chunk_start:chunk_start + chunk_size]):
+            failed_items += "error" in item_result
+            output_file.write(json.dumps({"index": chunk_start + item_index, **item_result}) + "\n")
+            output_file.flush()
+    await asyncio.to_thread(flush_write_behind)
+    return len(message_items), failed_items
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Process a backlog of Slack messages in bulk, writing one NDJSON result per message")
+    argument_parser.add_argument("input", help=".jsonl or .csv file of thread_id, text")
+    argument_parser.add_argument("--output", help="Results file (default: stdout)")
+    argument_parser.add_argument("--chunk-size", type=int, default=1000, help="Messages embedded and retrieved together")
+    arguments = argument_parser.parse_args()
+
+    started_at = time.perf_counter()
+    with (open(arguments.output, "w", encoding="utf-8") if arguments.output else contextlib.nullcontext(sys.stdout)) as output_file:
+        number_of_messages, failed_items = asyncio.run(aprocess_message_file(arguments.input, output_file, arguments.chunk_size))
+    print(f"Processed {number_of_messages} messages ({failed_items} failed) in {time.perf_counter() - started_at:.1f}s", file=sys.stderr)
@@ -0,0 +1,143 @@
+import os
+import numpy as np
+from llm_scheduler import CHARACTERS_PER_TOKEN, estimate_tokens
+
+# verbose: neighbour tickets pasted into prompts as text; compact: locally computed neighbour statistics,
+# with the request trimmed so each prompt stays within PROMPT_TOKEN_BUDGET.
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "verbose")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "600"))
+# Classify and extract in one JSON call instead of two when the local classifier is not confident.
+MERGED_ANALYSIS = os.getenv("MERGED_ANALYSIS", "0") == "1"
+MINIMUM_REQUEST_TOKENS = 64
+ELISION_MARKER = " [...] "
+
+def _field_list(field_list_text):
+    return [field.strip() for field in (field_list_text or "").split(";") if field.strip()]
+
+def _weighted_shares(labels, rank_weights):
+    unique_labels, label_codes = np.unique(labels, return_inverse=True)
+    label_weights = np.bincount(label_codes, weights=rank_weights) / rank_weights.sum()
+    return {str(unique_labels[label_code]): float(label_weights[label_code]) for label_code in np.argsort(-label_weights, kind="stable")}
+
+def neighbour_statistics(similar_historical_tickets, field_names=()):
+    """Rank-weighted aggregates over retrieved tickets, so prompts carry a few numbers instead of ticket text.
+
+    field_presence maps Approved and Rejected to the weighted share of those neighbours that provided each
+    field (None when no neighbour had that outcome), over field_names or else every field the neighbours list.
+    """
+    if not similar_historical_tickets:
+        return None
+    rank_weights = 1.0 / np.arange(1, len(similar_historical_tickets) + 1)
+    outcomes = np.array([ticket['outcome'] or "Unknown" for ticket in similar_historical_tickets])
+    request_types = np.array([ticket['request_type'] or "Unknown" for ticket in similar_historical_tickets])
+    risk_scores = np.array([
+        np.nan if ticket['security_risk_score'] is None else ticket['security_risk_score'] for ticket in similar_historical_tickets
+    ], dtype=float)
+    provided_field_sets = [set(_field_list(ticket['fields_provided'])) for ticket in similar_historical_tickets]
+    field_names = list(field_names) or list(dict.fromkeys(field for provided_fields in provided_field_sets for field in sorted(provided_fields)))
+    field_presence_matrix = np.array(
+        [[field in provided_fields for field in field_names] for provided_fields in provided_field_sets], dtype=float
+    ).reshape(len(similar_historical_tickets), len(field_names))
+
+    field_presence = {}
+    for outcome in ("Approved", "Rejected"):
+        outcome_mask = outcomes == outcome
+        field_presence[outcome] = dict(zip(field_names, (
+            rank_weights[outcome_mask] @ field_presence_matrix[outcome_mask] / rank_weights[outcome_mask].sum()
+        ).tolist())) if outcome_mask.any() else None
+    known_risk = ~np.isnan(risk_scores)
+    return {
+        "ticket_count": len(similar_historical_tickets),
+        "outcome_shares": _weighted_shares(outcomes, rank_weights),
+        "request_type_shares": _weighted_shares(request_types, rank_weights),
+        "mean_risk_score": float(np.average(risk_scores[known_risk], weights=rank_weights[known_risk])) if known_risk.any() else None,
+        "field_presence": field_presence
+    }
+
+def _format_shares(shares):
+    return ", ".join(f"{label} {share:.0%}" for label, share in shares.items())
+
+def _format_field_presence(field_presence):
+    approved_rates, rejected_rates = field_presence["Approved"] or {}, field_presence["Rejected"] or {}
+    return "; ".join(
+        f"{field} {approved_rates[field]:.0%}/{rejected_rates[field]:.0%}" if field in approved_rates and field in rejected_rates
+        else f"{field} {approved_rates[field]:.0%}/-" if field in approved_rates
+        else f"{field} -/{rejected_rates[field]:.0%}"
+        for field in dict.fromkeys([*approved_rates, *rejected_rates])
+    )
+
+def trim_to_token_budget(text, token_budget):
+    """Keep the start and the end of text within token_budget, eliding the middle."""
+    maximum_characters = max(0, token_budget) * CHARACTERS_PER_TOKEN
+    if len(text) <= maximum_characters:
+        return text
+    kept_characters = max(0, maximum_characters - len(ELISION_MARKER))
+    return text[:kept_characters // 2] + ELISION_MARKER + text[len(text) - (kept_characters - kept_characters // 2):]
+
+def _within_token_budget(build_prompt, request_text, token_budget):
+    """build_prompt(request) with the request trimmed to whatever token_budget leaves, but never below MINIMUM_REQUEST_TOKENS."""
+    request_token_budget = max(MINIMUM_REQUEST_TOKENS, token_budget - estimate_tokens([build_prompt("")]))
+    return build_prompt(trim_to_token_budget(request_text, request_token_budget))
+
+def _similar_types_line(similar_historical_tickets):
+    statistics = neighbour_statistics(similar_historical_tickets)
+    if statistics is None:
+        return ""
+    return f"Types of the {statistics['ticket_count']} most similar past tickets: {_format_shares(statistics['request_type_shares'])}\n"
+
+def build_compact_classification_prompt(user_message, similar_historical_tickets, request_types_list, token_budget=PROMPT_TOKEN_BUDGET):
+    similar_types_line = _similar_types_line(similar_historical_tickets)
+    return _within_token_budget(lambda request_text: (
+        f"Classify this request into one of: {', '.join(request_types_list)}\n"
+        f"{similar_types_line}"
+        f"Request: {request_text}\n"
+        f"Reply with just the request type."
+    ), user_message, token_budget)
+
+def build_compact_extraction_prompt(user_message, mandatory_fields_list, token_budget=PROMPT_TOKEN_BUDGET):
+    return _within_token_budget(lambda request_text: (
+        f"Extract information from this security request.\n"
+        f"Request: {request_text}\n"
+        f"Required fields: {', '.join(mandatory_fields_list)}\n"
+        f"For each field give the value found or \"MISSING\", and the specific permission, resource or access requested "
+        f"(e.g. \"AWS admin access\").\n"
+        f"Reply in JSON: {{\"<field name>\": \"value or MISSING\", \"requested_access\": \"access requested\"}}"
+    ), user_message, token_budget)
+
+def build_analysis_prompt(user_message, similar_historical_tickets, mandatory_fields_by_request_type, token_budget=PROMPT_TOKEN_BUDGET):
+    """One prompt that classifies the request and extracts the chosen type's required fields."""
+    request_type_lines = "\n".join(
+        f"- {request_type}: {'; '.join(mandatory_fields)}" for request_type, mandatory_fields in mandatory_fields_by_request_type.items()
+    )
+    similar_types_line = _similar_types_line(similar_historical_tickets)
+    return _within_token_budget(lambda request_text: (
+        f"Classify this request and extract its required fields.\n"
+        f"Request types and their required fields:\n{request_type_lines}\n"
+        f"{similar_types_line}"
+        f"Request: {request_text}\n"
+        f"Reply in JSON: {{\"request_type\": \"one of the types above\", "
+        f"\"fields\": {{\"<each required field of that type>\": \"value found or MISSING\"}}, "
+        f"\"requested_access\": \"the specific permission, resource or access requested, e.g. AWS admin access\"}}"
+    ), user_message, token_budget)
+
+def build_compact_decision_prompt(user_message, request_type, provided_fields, similar_historical_tickets, token_budget=PROMPT_TOKEN_BUDGET):
+    # Requested Access is extracted from every request but never recorded on historical tickets.
+    statistics = neighbour_statistics(similar_historical_tickets, [field for field in provided_fields if field != "Requested Access"])
+    if statistics is None:
+        neighbour_lines = "No similar past tickets.\n"
+    else:
+        mean_risk_score = "unknown" if statistics['mean_risk_score'] is None else f"{statistics['mean_risk_score']:.0f}"
+        neighbour_lines = (
+            f"{statistics['ticket_count']} most similar past tickets, rank-weighted: {_format_shares(statistics['outcome_shares'])}; "
+            f"mean risk {mean_risk_score}\n"
+        )
+        if statistics["field_presence"]["Approved"] is not None or statistics["field_presence"]["Rejected"] is not None:
+            neighbour_lines += f"Share that provided each field, approved/rejected: {_format_field_presence(statistics['field_presence'])}\n"
+    return _within_token_budget(lambda request_text: (
+        f"You are Acme's security decision engine.\n"
+        f"{neighbour_lines}"
+        f"Request ({request_type}; fields provided: {', '.join(provided_fields.keys())}): {request_text}\n"
+        f"Following Acme's historical practice, should this be Approved or Rejected?\n"
+        f"Reply in JSON: {{\"decision\": \"Approved or Rejected\", \"rationale\": \"brief explanation\", \"risk_score\": 0-100, "
+        f"\"confidence_score\": 0.0-1.0 (how closely the past tickets match)}}"
+    ), user_message, token_budget)
@@ -0,0 +1,94 @@
+import threading
+from collections import Counter
+import numpy as np
+from database import HistoricalTicket
+from utils import get_db_session
+from vector_index import add_historical_ticket_change_listener
+
+MANDATORY_FIELD_MAJORITY = 0.5
+
+_request_type_catalog = None
+_catalog_generation = 0
+_catalog_lock = threading.Lock()
+
+def _canonical_mandatory_fields(mandatory_field_strings):
+    """Fields listed on more than half of a type's tickets, most common first."""
+    field_counts = Counter()
+    for mandatory_fields in mandatory_field_strings:
+        field_counts.update(list(dict.fromkeys(field.strip() for field in (mandatory_fields or "").split(";") if field.strip())))
+    minimum_count = len(mandatory_field_strings) * MANDATORY_FIELD_MAJORITY
+    return [field for field, field_count in field_counts.most_common() if field_count > minimum_count]
+
+def _request_type_statistics(outcomes, risk_scores):
+    outcome_counts = Counter(outcomes)
+    decided_count = outcome_counts["Approved"] + outcome_counts["Rejected"]
+    known_risk_scores = np.array([risk_score for risk_score in risk_scores if risk_score is not None], dtype=float)
+    return {
+        "ticket_count": len(outcomes),
+        "outcome_counts": dict(outcome_counts),
+        "approval_rate": outcome_counts["Approved"] / decided_count if decided_count else None,
+        "mean_risk_score": float(known_risk_scores.mean()) if known_risk_scores.size else None,
+        "median_risk_score": float(np.median(known_risk_scores)) if known_risk_scores.size else None,
+        "p90_risk_score": float(np.percentile(known_risk_scores, 90)) if known_risk_scores.size else None
+    }
+
+class RequestTypeCatalog:
+    """Request types with their canonical mandatory fields and historical outcome/risk statistics."""
+
+    def __init__(self, request_type_profiles):
+        self.request_type_profiles = request_type_profiles
+        self.request_types = sorted(request_type_profiles)
+
+    def mandatory_fields(self, request_type):
+        request_type_profile = self.request_type_profiles.get(request_type)
+        return list(request_type_profile["mandatory_fields"]) if request_type_profile else []
+
+    def statistics(self, request_type):
+        request_type_profile = self.request_type_profiles.get(request_type)
+        return request_type_profile["statistics"] if request_type_profile else None
+
+def build_request_type_catalog():
+    with get_db_session() as database_session:
+        ticket_rows = database_session.query(
+            HistoricalTicket.request_type,
+            HistoricalTicket.mandatory_fields,
+            HistoricalTicket.outcome,
+            HistoricalTicket.security_risk_score
+        ).all()
+
+    rows_by_request_type = {}
+    for ticket_row in ticket_rows:
+        rows_by_request_type.setdefault(ticket_row.request_type, []).append(ticket_row)
+
+    return RequestTypeCatalog({
+        request_type: {
+            "mandatory_fields": _canonical_mandatory_fields([row.mandatory_fields for row in request_type_rows]),
+            "statistics": _request_type_statistics(
+                [row.outcome for row in request_type_rows], [row.security_risk_score for row in request_type_rows]
+            )
+        }
+        for request_type, request_type_rows in rows_by_request_type.items()
+    })
+
+def get_request_type_catalog():
+    """Get the process-wide request type catalog, building it on first use or after invalidation."""
+    global _request_type_catalog
+    request_type_catalog = _request_type_catalog
+    if request_type_catalog is not None:
+        return request_type_catalog
+    with _catalog_lock:
+        if _request_type_catalog is not None:
+            return _request_type_catalog
+        catalog_generation = _catalog_generation
+        request_type_catalog = build_request_type_catalog()
+        # Not kept if tickets changed while it was being built; the next call builds from the new rows.
+        if catalog_generation == _catalog_generation:
+            _request_type_catalog = request_type_catalog
+        return request_type_catalog
+
+def invalidate_request_type_catalog():
+    global _request_type_catalog, _catalog_generation
+    _catalog_generation += 1
+    _request_type_catalog = None
+
+add_historical_ticket_change_listener(invalidate_request_type_catalog)
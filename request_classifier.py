@@ -0,0 +1,76 @@
+import os
+import threading
+import numpy as np
+from ann_index import ExactSearchBackend, normalize_rows
+from vector_index import get_historical_ticket_index
+
+LOCAL_CLASSIFIER_METHOD = os.getenv("LOCAL_CLASSIFIER_METHOD", "knn")
+LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD", "0.8"))
+LOCAL_CLASSIFIER_NEIGHBOURS = int(os.getenv("LOCAL_CLASSIFIER_NEIGHBOURS", "10"))
+SIMILARITY_TEMPERATURE = 0.02
+
+_local_request_classifier = None
+_local_request_classifier_lock = threading.Lock()
+
+def _softmax(scores):
+    exponentials = np.exp((scores - scores.max()) / SIMILARITY_TEMPERATURE)
+    return exponentials / exponentials.sum()
+
+class LocalRequestClassifier:
+    """Predicts request_type from historical embeddings with a confidence in [0, 1].
+
+    "knn" is a similarity-weighted vote over the nearest tickets; "centroid" compares the query with
+    the mean embedding of each request type.
+    """
+
+    def __init__(self, embedding_matrix, request_types, method=LOCAL_CLASSIFIER_METHOD,
+                 number_of_neighbours=LOCAL_CLASSIFIER_NEIGHBOURS, search_backend=None, is_normalized=False):
+        embedding_matrix = np.asarray(embedding_matrix, dtype=np.float32)
+        self.embedding_matrix = embedding_matrix if is_normalized else normalize_rows(embedding_matrix)
+        self.request_type_names, self.request_type_codes = np.unique(np.asarray(request_types, dtype=str), return_inverse=True)
+        self.method = method
+        self.number_of_neighbours = number_of_neighbours
+        self.search_backend = search_backend or ExactSearchBackend(self.embedding_matrix)
+        type_membership = np.eye(len(self.request_type_names), dtype=np.float32)[self.request_type_codes]
+        self.type_centroids = normalize_rows(type_membership.T @ self.embedding_matrix)
+
+    def _knn_vote(self, query_vector):
+        neighbour_indices = self.search_backend.search(query_vector, self.number_of_neighbours)
+        neighbour_weights = _softmax(self.embedding_matrix[neighbour_indices] @ query_vector)
+        type_weights = np.bincount(self.request_type_codes[neighbour_indices], weights=neighbour_weights, minlength=len(self.request_type_names))
+        return type_weights
+
+    def _centroid_scores(self, query_vector):
+        return _softmax(self.type_centroids @ query_vector)
+
+    def classify(self, query_embedding):
+        """Return (request_type, confidence)."""
+        if len(self.request_type_names) == 0:
+            return None, 0.0
+        query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        type_probabilities = self._centroid_scores(query_vector) if self.method == "centroid" else self._knn_vote(query_vector)
+        best_type_code = int(np.argmax(type_probabilities))
+        return str(self.request_type_names[best_type_code]), float(type_probabilities[best_type_code])
+
+def get_local_request_classifier():
+    """Local classifier over the current historical ticket index, or None when disabled."""
+    global _local_request_classifier
+    if LOCAL_CLASSIFIER_METHOD == "off":
+        return None
+    historical_ticket_index = get_historical_ticket_index()
+    with _local_request_classifier_lock:
+        if _local_request_classifier is None or _local_request_classifier[0] is not historical_ticket_index:
+            request_types = [ticket['request_type'] for ticket in historical_ticket_index.ticket_metadata]
+            _local_request_classifier = (historical_ticket_index, LocalRequestClassifier(
+                historical_ticket_index.embedding_matrix, request_types,
+                search_backend=historical_ticket_index.search_backend, is_normalized=True
+            ))
+        return _local_request_classifier[1]
+
+def classify_request_locally(query_embedding, confidence_threshold=LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD):
+    """Return (request_type, confidence, is_confident); request_type is None when disabled."""
+    local_request_classifier = get_local_request_classifier()
+    if local_request_classifier is None:
+        return None, 0.0, False
+    request_type, confidence = local_request_classifier.classify(query_embedding)
+    return request_type, confidence, request_type is not None and confidence >= confidence_threshold
@@ -0,0 +1,267 @@
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from database import Decision, Message
+from llm_scheduler import llm_priority
+from llm_service import _call_llm_for_json
+from utils import get_db_session
+
+ROLLUP_WINDOW_DAYS = 30
+TOP_RISKIEST_COUNT = 5
+ROLLUP_RESYNC_SECONDS = 300
+EXPIRY_CHECK_INTERVAL = timedelta(minutes=1)
+PENDING_OUTCOME = "Info Requested"
+
+_risk_rollups = None
+_risk_rollups_lock = threading.Lock()
+_health_snapshot = {"top_riskiest": [], "pattern_analysis": {"status": "pending"}}
+_refresh_requested = threading.Event()
+_refresh_worker = None
+
+class RiskRollups:
+    """Per-day decision counts by request type and outcome, plus the riskiest recent decisions.
+
+    Kept in memory and updated on every decision write, so /health never scans the decisions table.
+    The riskiest decisions are a min-heap bounded at top_count; the window's decisions are only
+    rescanned when one already in it is rescored or expires.
+    """
+
+    def __init__(self, window_days=ROLLUP_WINDOW_DAYS, top_count=TOP_RISKIEST_COUNT):
+        self.window_days = window_days
+        self.top_count = top_count
+        self.daily_counts = Counter()
+        self.decisions = {}
+        self.top_riskiest = []
+        self.last_expired_at = datetime.min
+        self._top_riskiest_heap = []
+        self._updates_during_resync = None
+        self._lock = threading.Lock()
+
+    def _window_start(self, now=None):
+        return (now or datetime.utcnow()) - timedelta(days=self.window_days)
+
+    def _recompute_top_riskiest(self, now=None):
+        window_start = self._window_start(now)
+        self._top_riskiest_heap = heapq.nlargest(self.top_count, (
+            (risk_score, created_at, thread_id)
+            for thread_id, (created_at, _, _, risk_score) in self.decisions.items()
+            if risk_score is not None and created_at >= window_start
+        ))
+        self.top_riskiest = list(self._top_riskiest_heap)
+        heapq.heapify(self._top_riskiest_heap)
+
+    def _offer_top_riskiest(self, top_riskiest_entry):
+        if len(self._top_riskiest_heap) < self.top_count:
+            heapq.heappush(self._top_riskiest_heap, top_riskiest_entry)
+        elif top_riskiest_entry > self._top_riskiest_heap[0]:
+            heapq.heapreplace(self._top_riskiest_heap, top_riskiest_entry)
+        else:
+            return
+        self.top_riskiest = sorted(self._top_riskiest_heap, reverse=True)
+
+    def _load(self, decision_rows):
+        self.daily_counts.clear()
+        self.decisions.clear()
+        for decision_row in decision_rows:
+            self._apply(decision_row.thread_id, decision_row.created_at, decision_row.request_type, decision_row.outcome, decision_row.risk_score)
+
+    def resync(self, load_decision_rows):
+        """Replace the rollups with load_decision_rows(), replaying decisions recorded while it ran.
+
+        Those decisions may have committed after the rows were read, so the reload alone would drop them.
+        """
+        with self._lock:
+            self._updates_during_resync = []
+        try:
+            decision_rows = load_decision_rows()
+        except Exception:
+            with self._lock:
+                self._updates_during_resync = None
+            raise
+        with self._lock:
+            updates_during_resync, self._updates_during_resync = self._updates_during_resync, None
+            self._load(decision_rows)
+            for decision_update in updates_during_resync:
+                self._apply(*decision_update)
+            self._recompute_top_riskiest()
+
+    def _apply(self, thread_id, created_at, request_type, outcome, risk_score):
+        previous_decision = self.decisions.get(thread_id)
+        if previous_decision is not None:
+            previous_key = (previous_decision[0].date(), previous_decision[1], previous_decision[2] or PENDING_OUTCOME)
+            self.daily_counts[previous_key] -= 1
+            if self.daily_counts[previous_key] <= 0:
+                del self.daily_counts[previous_key]
+        self.daily_counts[(created_at.date(), request_type, outcome or PENDING_OUTCOME)] += 1
+        self.decisions[thread_id] = (created_at, request_type, outcome, risk_score)
+
+    def record_decision(self, thread_id, created_at, request_type, outcome, risk_score):
+        """Apply one decision upsert. Returns True when the set of riskiest threads changed."""
+        with self._lock:
+            if self._updates_during_resync is not None:
+                self._updates_during_resync.append((thread_id, created_at, request_type, outcome, risk_score))
+            previous_thread_ids = self.top_riskiest_thread_ids()
+            self._apply(thread_id, created_at, request_type, outcome, risk_score)
+            if thread_id in previous_thread_ids:
+                # Rescored in place, possibly lower, so whatever replaces it has to come from the whole window.
+                self._recompute_top_riskiest()
+            elif risk_score is not None and created_at >= self._window_start():
+                self._offer_top_riskiest((risk_score, created_at, thread_id))
+            return self.top_riskiest_thread_ids() != previous_thread_ids
+
+    def expire_old_decisions(self, now=None):
+        """Drop decisions that left the window. Returns True when the set of riskiest threads changed."""
+        now = now or datetime.utcnow()
+        if now - self.last_expired_at < EXPIRY_CHECK_INTERVAL:
+            return False
+        window_start = self._window_start(now)
+        with self._lock:
+            self.last_expired_at = now
+            previous_thread_ids = self.top_riskiest_thread_ids()
+            for day_key in [day_key for day_key in self.daily_counts if day_key[0] < window_start.date()]:
+                del self.daily_counts[day_key]
+            for thread_id in [thread_id for thread_id, decision in self.decisions.items() if decision[0] < window_start]:
+                del self.decisions[thread_id]
+            if any(created_at < window_start for _, created_at, _ in self.top_riskiest):
+                self._recompute_top_riskiest(now)
+            return self.top_riskiest_thread_ids() != previous_thread_ids
+
+    def top_riskiest_thread_ids(self):
+        return tuple(thread_id for _, _, thread_id in self.top_riskiest)
+
+    def counts_by_type_and_outcome(self, now=None):
+        window_start_day = self._window_start(now).date()
+        type_outcome_counts = {}
+        with self._lock:
+            for (day, request_type, outcome), decision_count in self.daily_counts.items():
+                if day >= window_start_day:
+                    outcome_counts = type_outcome_counts.setdefault(request_type or "Unclassified", {})
+                    outcome_counts[outcome] = outcome_counts.get(outcome, 0) + decision_count
+        return type_outcome_counts
+
+    def total_requests(self, now=None):
+        return sum(sum(outcome_counts.values()) for outcome_counts in self.counts_by_type_and_outcome(now).values())
+
+def _load_window_decisions(window_days=ROLLUP_WINDOW_DAYS):
+    window_start = datetime.utcnow() - timedelta(days=window_days)
+    with get_db_session() as database_session:
+        return database_session.query(
+            Decision.thread_id, Decision.created_at, Decision.request_type, Decision.outcome, Decision.risk_score
+        ).filter(Decision.created_at >= window_start).all()
+
+def _build_pattern_analysis_prompt(risky_requests):
+    formatted_requests = []
+    for i, request in enumerate(risky_requests, start=1):
+        formatted_request = (
+            f"{i}. [{request['request_type']}] Risk: {request['risk_score']}/100 - {request['outcome']}\n"
+            f"Summary: {request['request_summary']}\n"
+            f"Rationale: {request['rationale']}"
+        )
+        formatted_requests.append(formatted_request)
+
+    risky_requests_text = "\n".join(formatted_requests)
+
+    return f"""Analyze these 5 riskiest security requests from the last 30 days. Identify patterns and concerns.
+
+                        Riskiest Requests:
+                        {risky_requests_text}
+
+                        Provide JSON with:
+                        {{
+                            "patterns_detected": ["pattern 1", "pattern 2"],
+                            "common_risk_factors": ["factor 1", "factor 2"],
+                            "recommendations": ["action 1", "action 2"],
+                            "alert_level": "low/medium/high"
+                        }}"""
+
+def _load_risky_requests(thread_ids):
+    with get_db_session() as database_session:
+        decisions_by_thread = {
+            decision.thread_id: decision
+            for decision in database_session.query(Decision).filter(Decision.thread_id.in_(thread_ids)).all()
+        }
+        user_messages_by_thread = {}
+        for message in database_session.query(Message).filter(
+            Message.thread_id.in_(thread_ids), Message.role == "user"
+        ).order_by(Message.timestamp).all():
+            user_messages_by_thread.setdefault(message.thread_id, []).append(message.text)
+
+        return [
+            {
+                "request_type": decisions_by_thread[thread_id].request_type,
+                "risk_score": decisions_by_thread[thread_id].risk_score,
+                "outcome": decisions_by_thread[thread_id].outcome,
+                "request_summary": " ".join(user_messages_by_thread.get(thread_id, []))[:200],
+                "extracted_fields": decisions_by_thread[thread_id].extracted_fields,
+                "rationale": decisions_by_thread[thread_id].rationale
+            }
+            for thread_id in thread_ids if thread_id in decisions_by_thread
+        ]
+
+def _refresh_health_snapshot():
+    global _health_snapshot
+    top_thread_ids = get_risk_rollups().top_riskiest_thread_ids()
+    risky_requests = _load_risky_requests(top_thread_ids)
+    try:
+        with llm_priority("background"):
+            pattern_analysis = _call_llm_for_json(_build_pattern_analysis_prompt(risky_requests), call_site="pattern_analysis")
+    except Exception:
+        pattern_analysis = {"error": "Analysis unavailable"}
+    _health_snapshot = {
+        "top_riskiest": risky_requests,
+        "pattern_analysis": pattern_analysis,
+        "analyzed_at": datetime.utcnow().isoformat()
+    }
+
+def _run_refresh_worker():
+    while True:
+        refresh_was_requested = _refresh_requested.wait(timeout=ROLLUP_RESYNC_SECONDS)
+        _refresh_requested.clear()
+        try:
+            if not refresh_was_requested:
+                previous_thread_ids = get_risk_rollups().top_riskiest_thread_ids()
+                get_risk_rollups().resync(_load_window_decisions)
+                if get_risk_rollups().top_riskiest_thread_ids() == previous_thread_ids:
+                    continue
+            _refresh_health_snapshot()
+        except Exception as refresh_error:
+            print(f"Risk posture refresh failed: {refresh_error}")
+
+def _request_snapshot_refresh():
+    global _refresh_worker
+    with _risk_rollups_lock:
+        if _refresh_worker is None:
+            _refresh_worker = threading.Thread(target=_run_refresh_worker, name="risk-posture-refresh", daemon=True)
+            _refresh_worker.start()
+    _refresh_requested.set()
+
+def get_risk_rollups():
+    """Get the process-wide rollups, loading the current window from the database on first use."""
+    global _risk_rollups
+    if _risk_rollups is not None:
+        return _risk_rollups
+    with _risk_rollups_lock:
+        if _risk_rollups is None:
+            risk_rollups = RiskRollups()
+            risk_rollups.resync(_load_window_decisions)
+            _risk_rollups = risk_rollups
+    _request_snapshot_refresh()
+    return _risk_rollups
+
+def record_decision_rollup(thread_id, created_at, request_type, outcome, risk_score):
+    if get_risk_rollups().record_decision(thread_id, created_at, request_type, outcome, risk_score):
+        _request_snapshot_refresh()
+
+def get_risk_posture():
+    """The /health payload: live window counts with the latest cached pattern analysis."""
+    risk_rollups = get_risk_rollups()
+    if risk_rollups.expire_old_decisions():
+        _request_snapshot_refresh()
+    return {
+        "period": "last_30_days",
+        "total_requests": risk_rollups.total_requests(),
+        "requests_by_type_and_outcome": risk_rollups.counts_by_type_and_outcome(),
+        "top_5_riskiest": _health_snapshot["top_riskiest"],
+        "pattern_analysis": _health_snapshot["pattern_analysis"]
+    }
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from sqlalchemy import delete, inspect, insert, select, text
+from database import engine, initialize_database, record_historical_ticket_change, HistoricalTicket
+from embedding_cache import acreate_embeddings
+from embedding_store import encode_embedding
+from llm_scheduler import llm_priority
+from vector_index import historical_ticket_index_snapshot_is_current, invalidate_historical_ticket_index, write_historical_ticket_index_snapshot
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "5000"))
+IMPORT_EMBEDDING_BATCH_SIZE = int(os.getenv("IMPORT_EMBEDDING_BATCH_SIZE", "100"))
+IMPORT_EMBEDDING_CONCURRENCY = int(os.getenv("IMPORT_EMBEDDING_CONCURRENCY", "8"))
+
+def _ticket_embedding_text(ticket_row):
+    return f"{ticket_row['request_type']}: {ticket_row['request_summary']}\n{ticket_row['details']}"
+
+def _text_hash(ticket_text):
+    return hashlib.sha256(ticket_text.encode("utf-8")).hexdigest()
+
+def _add_missing_text_hash_column():
+    existing_columns = {column["name"] for column in inspect(engine).get_columns("historical_tickets")}
+    if "text_hash" not in existing_columns:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE historical_tickets ADD COLUMN text_hash VARCHAR"))
+
+def _load_existing_text_hashes():
+    with engine.connect() as connection:
+        return dict(connection.execute(select(HistoricalTicket.ticket_id, HistoricalTicket.text_hash)).all())
+
+def _csv_identity(csv_file_path):
+    csv_file_stat = os.stat(csv_file_path)
+    return {"csv_file_path": os.path.abspath(csv_file_path), "size": csv_file_stat.st_size, "modified_at": csv_file_stat.st_mtime}
+
+def _read_checkpoint(checkpoint_path, csv_file_path):
+    """Number of CSV rows already committed by an interrupted import of this exact file."""
+    if not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint.get("csv") != _csv_identity(csv_file_path):
+        return 0
+    return checkpoint.get("rows_processed", 0)
+
+def _write_checkpoint(checkpoint_path, csv_file_path, rows_processed):
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump({"csv": _csv_identity(csv_file_path), "rows_processed": rows_processed}, checkpoint_file)
+    os.replace(temporary_path, checkpoint_path)
+
+async def _embed_batch(texts, concurrency_limit):
+    # Through the embedding cache, whose scheduler retries failures and enforces the account-wide limits;
+    # the bulk lane yields to interactive traffic.
+    async with concurrency_limit:
+        with llm_priority("bulk"):
+            return await acreate_embeddings(texts)
+
+async def _embed_texts(texts, concurrency_limit, batch_size):
+    embedding_batches = await asyncio.gather(*(
+        _embed_batch(texts[start_index:start_index + batch_size], concurrency_limit)
+        for start_index in range(0, len(texts), batch_size)
+    ))
+    return [embedding for embedding_batch in embedding_batches for embedding in embedding_batch]
+
+def _build_ticket_record(ticket_row, ticket_text_hash, embedding):
+    embedding_blob, embedding_scale = encode_embedding(embedding)
+    return {
+        "ticket_id": ticket_row['ticket_id'],
+        "request_type": ticket_row['request_type'],
+        "request_summary": ticket_row['request_summary'],
+        "details": ticket_row['details'],
+        "mandatory_fields": ticket_row['mandatory_fields'],
+        "fields_provided": ticket_row['fields_provided'],
+        "outcome": ticket_row['outcome'],
+        "security_risk_score": int(ticket_row['security_risk_score']),
+        "embedding_vector": embedding_blob,
+        "embedding_scale": embedding_scale,
+        "text_hash": ticket_text_hash,
+        "created_at": datetime.strptime(ticket_row['created_at'], "%Y-%m-%d %H:%M:%S"),
+        "requester_department": ticket_row['requester_department'],
+        "requester_title": ticket_row['requester_title']
+    }
+
+def _write_ticket_records(ticket_records, replaced_ticket_ids):
+    with engine.begin() as connection:
+        if replaced_ticket_ids:
+            connection.execute(delete(HistoricalTicket).where(HistoricalTicket.ticket_id.in_(replaced_ticket_ids)))
+        if ticket_records:
+            connection.execute(insert(HistoricalTicket), ticket_records)
+        if replaced_ticket_ids or ticket_records:
+            record_historical_ticket_change(connection)
+
+def _commit_chunk(ticket_records, replaced_ticket_ids, checkpoint_path, csv_file_path, rows_processed):
+    _write_ticket_records(ticket_records, replaced_ticket_ids)
+    _write_checkpoint(checkpoint_path, csv_file_path, rows_processed)
+
+async def aimport_historical_tickets(csv_file_path, checkpoint_path=None, chunk_rows=IMPORT_CHUNK_ROWS,
+                                     embedding_batch_size=IMPORT_EMBEDDING_BATCH_SIZE,
+                                     embedding_concurrency=IMPORT_EMBEDDING_CONCURRENCY):
+    """Stream a ticket CSV into historical_tickets, embedding only new or changed tickets.
+
+    Chunks are embedded concurrently, within the LLM scheduler's rate limits, and written with Core
+    bulk inserts while the next chunk is embedded. Progress is checkpointed after every committed
+    chunk, so rerunning an interrupted import resumes where it stopped; tickets already stored with
+    the same text hash are skipped.
+    """
+    import pandas as pd
+    started_at = time.perf_counter()
+    _add_missing_text_hash_column()
+    checkpoint_path = checkpoint_path or f"{csv_file_path}.import-checkpoint"
+    rows_to_resume_after = _read_checkpoint(checkpoint_path, csv_file_path)
+    stored_text_hashes = _load_existing_text_hashes()
+    concurrency_limit = asyncio.Semaphore(embedding_concurrency)
+    import_summary = {"rows_read": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    pending_commit = None
+
+    for ticket_chunk in pd.read_csv(csv_file_path, chunksize=chunk_rows, dtype={"created_at": str}):
+        rows_processed = import_summary["rows_read"] + len(ticket_chunk)
+        chunk_rows_to_skip = min(len(ticket_chunk), max(0, rows_to_resume_after - import_summary["rows_read"]))
+        import_summary["rows_read"] = rows_processed
+        ticket_rows = ticket_chunk.iloc[chunk_rows_to_skip:].astype(object).where(ticket_chunk.notna(), None).to_dict("records")
+        import_summary["skipped"] += chunk_rows_to_skip
+
+        pending_tickets = {}
+        for ticket_row in ticket_rows:
+            ticket_text = _ticket_embedding_text(ticket_row)
+            ticket_text_hash = _text_hash(ticket_text)
+            if stored_text_hashes.get(ticket_row['ticket_id']) == ticket_text_hash:
+                import_summary["skipped"] += 1
+                continue
+            pending_tickets[ticket_row['ticket_id']] = (ticket_row, ticket_text, ticket_text_hash)
+
+        replaced_ticket_ids = [ticket_id for ticket_id in pending_tickets if ticket_id in stored_text_hashes]
+        embeddings = await _embed_texts([ticket_text for _, ticket_text, _ in pending_tickets.values()], concurrency_limit, embedding_batch_size)
+        ticket_records = [
+            _build_ticket_record(ticket_row, ticket_text_hash, embedding)
+            for (ticket_row, _, ticket_text_hash), embedding in zip(pending_tickets.values(), embeddings)
+        ]
+        for ticket_record in ticket_records:
+            stored_text_hashes[ticket_record["ticket_id"]] = ticket_record["text_hash"]
+        import_summary["updated"] += len(replaced_ticket_ids)
+        import_summary["inserted"] += len(ticket_records) - len(replaced_ticket_ids)
+
+        if pending_commit is not None:
+            await pending_commit
+        pending_commit = asyncio.create_task(asyncio.to_thread(
+            _commit_chunk, ticket_records, replaced_ticket_ids, checkpoint_path, csv_file_path, rows_processed
+        ))
+
+    if pending_commit is not None:
+        await pending_commit
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if import_summary["inserted"] or import_summary["updated"]:
+        invalidate_historical_ticket_index()
+    if import_summary["inserted"] or import_summary["updated"] or not await asyncio.to_thread(historical_ticket_index_snapshot_is_current):
+        await asyncio.to_thread(write_historical_ticket_index_snapshot)
+
+    import_summary["elapsed_seconds"] = time.perf_counter() - started_at
+    import_summary["rows_per_second"] = import_summary["rows_read"] / import_summary["elapsed_seconds"] if import_summary["elapsed_seconds"] else 0.0
+    return import_summary
+
+def import_historical_tickets(csv_file_path, **import_options):
+    return asyncio.run(aimport_historical_tickets(csv_file_path, **import_options))
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Import historical security tickets from a CSV file")
+    argument_parser.add_argument("csv_file_path", nargs="?", default="data/acme_security_tickets.csv")
+    argument_parser.add_argument("--checkpoint", help="Checkpoint file (default: <csv>.import-checkpoint)")
+    argument_parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    argument_parser.add_argument("--batch-size", type=int, default=IMPORT_EMBEDDING_BATCH_SIZE)
+    argument_parser.add_argument("--concurrency", type=int, default=IMPORT_EMBEDDING_CONCURRENCY)
+    arguments = argument_parser.parse_args()
+    initialize_database()
+    import_summary = import_historical_tickets(
+        arguments.csv_file_path, checkpoint_path=arguments.checkpoint, chunk_rows=arguments.chunk_rows,
+        embedding_batch_size=arguments.batch_size, embedding_concurrency=arguments.concurrency
+    )
+    print(f"Read {import_summary['rows_read']} rows: {import_summary['inserted']} inserted, {import_summary['updated']} updated, "
+          f"{import_summary['skipped']} unchanged ({import_summary['rows_per_second']:.0f} rows/s)")
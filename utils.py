@@ -1,25 +1,57 @@
-from contextlib import contextmanager
-from openai import OpenAI
+from contextlib import asynccontextmanager, contextmanager
 from dotenv import load_dotenv
+from metrics import record_db_session
+import contextvars
 import os
+import time
 
 load_dotenv()
 
 _openai_client = None
+_async_openai_client = None
+_request_db_session = contextvars.ContextVar("request_db_session", default=None)
+_request_async_db_session = contextvars.ContextVar("request_async_db_session", default=None)
 
 def get_openai_client():
     """Get or create the OpenAI client singleton."""
     global _openai_client
     if _openai_client is None:
+        from openai import OpenAI
         api_key = os.getenv("OPENAI_API_KEY")
-        _openai_client = OpenAI(api_key=api_key) if api_key else OpenAI()
+        # Retries happen in the LLM scheduler, which also pauses the whole model on a 429.
+        _openai_client = OpenAI(api_key=api_key, max_retries=0) if api_key else OpenAI(max_retries=0)
     return _openai_client
 
+def get_async_openai_client():
+    """Get or create the AsyncOpenAI client singleton."""
+    global _async_openai_client
+    if _async_openai_client is None:
+        from openai import AsyncOpenAI
+        api_key = os.getenv("OPENAI_API_KEY")
+        _async_openai_client = AsyncOpenAI(api_key=api_key, max_retries=0) if api_key else AsyncOpenAI(max_retries=0)
+    return _async_openai_client
+
 @contextmanager
 def get_db_session():
-    """Context manager for database sessions."""
+    """Context manager for database sessions; inside request_scoped_db_session() the request's session is reused."""
+    request_session = _request_db_session.get()
+    if request_session is not None:
+        try:
+            yield request_session
+            # after_commit hooks that open their own get_db_session() must not reuse a session mid-commit.
+            context_token = _request_db_session.set(None)
+            try:
+                request_session.commit()
+            finally:
+                _request_db_session.reset(context_token)
+        except Exception:
+            request_session.rollback()
+            raise
+        return
+
     from database import SessionLocal
     session = SessionLocal()
+    opened_at = time.perf_counter()
     try:
         yield session
         session.commit()
@@ -28,3 +60,59 @@ def get_db_session():
         raise
     finally:
         session.close()
+        record_db_session("sync", time.perf_counter() - opened_at)
+
+@asynccontextmanager
+async def get_async_db_session():
+    """Async context manager for database sessions; inside request_scoped_async_db_session() the request's session is reused."""
+    request_session = _request_async_db_session.get()
+    if request_session is not None:
+        try:
+            yield request_session
+            await request_session.commit()
+        except Exception:
+            await request_session.rollback()
+            raise
+        return
+
+    from database import AsyncSessionLocal
+    session = AsyncSessionLocal()
+    opened_at = time.perf_counter()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+        record_db_session("async", time.perf_counter() - opened_at)
+
+@contextmanager
+def request_scoped_db_session():
+    """One session for everything a request does; each get_db_session() block inside still commits on exit,
+    so the connection goes back to the pool between blocks instead of being held across LLM calls."""
+    if _request_db_session.get() is not None:
+        with get_db_session() as session:
+            yield session
+        return
+    with get_db_session() as session:
+        context_token = _request_db_session.set(session)
+        try:
+            yield session
+        finally:
+            _request_db_session.reset(context_token)
+
+@asynccontextmanager
+async def request_scoped_async_db_session():
+    """Async counterpart of request_scoped_db_session(); blocks must not run concurrently within one request."""
+    if _request_async_db_session.get() is not None:
+        async with get_async_db_session() as session:
+            yield session
+        return
+    async with get_async_db_session() as session:
+        context_token = _request_async_db_session.set(session)
+        try:
+            yield session
+        finally:
+            _request_async_db_session.reset(context_token)
\ No newline at end of file
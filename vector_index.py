@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from ann_index import create_search_backend, normalize_rows
+from database import HistoricalTicket, HistoricalTicketGeneration, engine, ensure_historical_ticket_generation_table
+from embedding_store import decode_embedding, decode_embedding_matrix
+from index_snapshot import INDEX_SNAPSHOT_PATH, open_index_snapshot, read_index_snapshot_header, snapshot_file_identity, write_index_snapshot
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from metrics import LEXICAL_SEARCH_DURATION_SECONDS, VECTOR_SEARCH_DURATION_SECONDS
+from utils import get_db_session
+
+FINGERPRINT_CHECK_INTERVAL_SECONDS = 30
+FINGERPRINT_ROWS_PER_FETCH = 10000
+# vector: embedding similarity only; lexical: BM25 only, so queries are never embedded for retrieval;
+# hybrid: BM25 fused with embedding similarity, falling back to BM25 when the query embedding is unavailable.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Tickets taken from each of the vector and BM25 rankings before reciprocal-rank fusion.
+HYBRID_CANDIDATE_POOL = 50
+
+_historical_ticket_index = None
+_index_is_stale = True
+_last_fingerprint_check = 0.0
+_generation_table_is_ready = False
+_index_lock = threading.Lock()
+_change_listeners = []
+
+def _encode_labels(label_values):
+    label_codes = {}
+    encoded_labels = np.array([label_codes.setdefault(label, len(label_codes)) for label in label_values], dtype=np.int32)
+    return encoded_labels, label_codes
+
+def _parse_embedding(ticket_row):
+    if ticket_row.embedding_vector is not None:
+        return decode_embedding(ticket_row.embedding_vector, ticket_row.embedding_scale)
+    if isinstance(ticket_row.embedding, str):
+        return json.loads(ticket_row.embedding)
+    return ticket_row.embedding
+
+def _load_embedding_matrix(ticket_rows):
+    if not ticket_rows:
+        return np.zeros((0, 0), dtype=np.float32)
+    if all(row.embedding_vector is not None for row in ticket_rows):
+        return decode_embedding_matrix(
+            [row.embedding_vector for row in ticket_rows],
+            [row.embedding_scale for row in ticket_rows]
+        )
+    return np.array([_parse_embedding(row) for row in ticket_rows], dtype=np.float32)
+
+class HistoricalTicketIndex:
+    """Pre-normalized float32 embedding matrix plus the ticket fields returned by retrieval."""
+
+    def __init__(self, embedding_matrix, ticket_metadata, fingerprint=None, ticket_created_at=None, search_backend=None, is_normalized=False):
+        # A matrix mapped from a snapshot is already normalized and must stay a view of the shared file.
+        self.embedding_matrix = embedding_matrix if is_normalized else np.ascontiguousarray(normalize_rows(np.asarray(embedding_matrix, dtype=np.float32)))
+        self.ticket_metadata = ticket_metadata
+        self.fingerprint = fingerprint
+        self.change_marker = None
+        self.snapshot_identity = None
+        self.request_type_codes, self.request_type_lookup = _encode_labels([ticket['request_type'] for ticket in ticket_metadata])
+        self.outcome_codes, self.outcome_lookup = _encode_labels([ticket['outcome'] for ticket in ticket_metadata])
+        self.ticket_created_at = np.array(
+            ticket_created_at if ticket_created_at is not None else [None] * len(ticket_metadata), dtype="datetime64[s]"
+        )
+        self.search_backend = create_search_backend(self.embedding_matrix, search_backend)
+        self._lexical_index = None
+        self._lexical_index_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ticket_metadata)
+
+    def _build_candidate_mask(self, request_type=None, outcome=None, created_after=None, created_before=None):
+        if request_type is None and outcome is None and created_after is None and created_before is None:
+            return None
+        candidate_mask = np.ones(len(self.ticket_metadata), dtype=bool)
+        if request_type is not None:
+            candidate_mask &= self.request_type_codes == self.request_type_lookup.get(request_type, -1)
+        if outcome is not None:
+            candidate_mask &= self.outcome_codes == self.outcome_lookup.get(outcome, -1)
+        if created_after is not None:
+            candidate_mask &= self.ticket_created_at >= np.datetime64(created_after, "s")
+        if created_before is not None:
+            candidate_mask &= self.ticket_created_at < np.datetime64(created_before, "s")
+        return candidate_mask
+
+    def lexical_index(self):
+        """BM25 over request_summary and details, built on first use from the same rows in the same order."""
+        if self._lexical_index is None:
+            with self._lexical_index_lock:
+                if self._lexical_index is None:
+                    lexical_rows = _load_lexical_rows()
+                    if [row.request_summary for row in lexical_rows] != [ticket['request_summary'] for ticket in self.ticket_metadata]:
+                        # The table changed after this index was built: fall back to summaries and rebuild soon.
+                        invalidate_historical_ticket_index()
+                        lexical_rows = [_LexicalRow(ticket['request_summary'], None) for ticket in self.ticket_metadata]
+                    self._lexical_index = BM25Index([f"{row.request_summary}\n{row.details or ''}" for row in lexical_rows])
+        return self._lexical_index
+
+    def _vector_search_indices(self, query_embedding, number_of_results, candidate_mask):
+        search_started_at = time.perf_counter()
+        query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        top_indices = self.search_backend.search(query_vector, number_of_results, candidate_mask)
+        VECTOR_SEARCH_DURATION_SECONDS.observe(time.perf_counter() - search_started_at, filtered=str(candidate_mask is not None).lower())
+        return top_indices
+
+    def _lexical_search_indices(self, query_text, number_of_results, candidate_mask):
+        lexical_index = self.lexical_index()
+        search_started_at = time.perf_counter()
+        top_indices = lexical_index.search(query_text, number_of_results, candidate_mask)
+        LEXICAL_SEARCH_DURATION_SECONDS.observe(time.perf_counter() - search_started_at, filtered=str(candidate_mask is not None).lower())
+        return top_indices
+
+    def search(self, query_embedding, number_of_results=5, request_type=None, outcome=None, created_after=None, created_before=None):
+        if len(self.ticket_metadata) == 0 or number_of_results <= 0:
+            return []
+        candidate_mask = self._build_candidate_mask(request_type, outcome, created_after, created_before)
+        if candidate_mask is not None and not candidate_mask.any():
+            return []
+        top_indices = self._vector_search_indices(query_embedding, number_of_results, candidate_mask)
+        return [dict(self.ticket_metadata[index]) for index in top_indices]
+
+    def search_lexical(self, query_text, number_of_results=5, request_type=None, outcome=None, created_after=None, created_before=None):
+        """search() by BM25 on the query text alone; tickets sharing no term with it are never returned."""
+        if len(self.ticket_metadata) == 0 or number_of_results <= 0:
+            return []
+        candidate_mask = self._build_candidate_mask(request_type, outcome, created_after, created_before)
+        if candidate_mask is not None and not candidate_mask.any():
+            return []
+        top_indices = self._lexical_search_indices(query_text, number_of_results, candidate_mask)
+        return [dict(self.ticket_metadata[index]) for index in top_indices]
+
+    def search_hybrid(self, query_text, query_embedding, number_of_results=5, request_type=None, outcome=None, created_after=None, created_before=None):
+        """Reciprocal-rank fusion of the vector and BM25 rankings; BM25 alone when query_embedding is None."""
+        if query_embedding is None:
+            return self.search_lexical(query_text, number_of_results, request_type, outcome, created_after, created_before)
+        if len(self.ticket_metadata) == 0 or number_of_results <= 0:
+            return []
+        candidate_mask = self._build_candidate_mask(request_type, outcome, created_after, created_before)
+        if candidate_mask is not None and not candidate_mask.any():
+            return []
+        candidate_pool = max(number_of_results, HYBRID_CANDIDATE_POOL)
+        top_indices = reciprocal_rank_fusion([
+            self._vector_search_indices(query_embedding, candidate_pool, candidate_mask),
+            self._lexical_search_indices(query_text, candidate_pool, candidate_mask)
+        ], number_of_results)
+        return [dict(self.ticket_metadata[index]) for index in top_indices]
+
+    def retrieve(self, query_text, query_embedding, number_of_results=5, **ticket_filters):
+        """search(), search_lexical() or search_hybrid(), as RETRIEVAL_MODE selects."""
+        if RETRIEVAL_MODE == "lexical":
+            return self.search_lexical(query_text, number_of_results, **ticket_filters)
+        if RETRIEVAL_MODE == "hybrid":
+            return self.search_hybrid(query_text, query_embedding, number_of_results, **ticket_filters)
+        return self.search(query_embedding, number_of_results, **ticket_filters)
+
+    def search_many(self, query_embeddings, number_of_results=5, request_type=None, outcome=None, created_after=None, created_before=None):
+        """search() for a batch of queries with the same filters; one result list per query."""
+        if len(self.ticket_metadata) == 0 or number_of_results <= 0 or len(query_embeddings) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+        candidate_mask = self._build_candidate_mask(request_type, outcome, created_after, created_before)
+        if candidate_mask is not None and not candidate_mask.any():
+            return [[] for _ in range(len(query_embeddings))]
+        search_started_at = time.perf_counter()
+        query_matrix = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        top_index_rows = self.search_backend.search_many(query_matrix, number_of_results, candidate_mask)
+        VECTOR_SEARCH_DURATION_SECONDS.observe(time.perf_counter() - search_started_at, filtered=str(candidate_mask is not None).lower())
+        return [[dict(self.ticket_metadata[index]) for index in top_indices] for top_indices in top_index_rows]
+
+class _LexicalRow:
+    def __init__(self, request_summary, details):
+        self.request_summary = request_summary
+        self.details = details
+
+def _load_lexical_rows():
+    with get_db_session() as database_session:
+        return database_session.query(HistoricalTicket.request_summary, HistoricalTicket.details).order_by(HistoricalTicket.ticket_id).all()
+
+def _read_change_marker():
+    """Row count plus the write generation: cheap enough to poll, unlike the content fingerprint."""
+    global _generation_table_is_ready
+    if not _generation_table_is_ready:
+        ensure_historical_ticket_generation_table(engine)
+        _generation_table_is_ready = True
+    with get_db_session() as database_session:
+        row_count = database_session.query(func.count(HistoricalTicket.ticket_id)).scalar()
+        generation = database_session.query(HistoricalTicketGeneration.generation).filter(HistoricalTicketGeneration.id == 1).scalar()
+    return f"{row_count}:{generation or 0}"
+
+def _read_fingerprint(database_session):
+    """Row count plus a hash of the indexed columns, so in-place edits change it as well as inserts and deletes.
+
+    text_hash stands in for the embedded text (type, summary and details) and embedding_scale for a re-encoded vector.
+    Reading it is O(rows), so it only validates a snapshot when one is written or opened.
+    """
+    fingerprint_hash = hashlib.sha256()
+    number_of_rows = 0
+    for ticket_row in database_session.query(
+        HistoricalTicket.ticket_id,
+        HistoricalTicket.text_hash,
+        HistoricalTicket.request_type,
+        HistoricalTicket.request_summary,
+        HistoricalTicket.fields_provided,
+        HistoricalTicket.security_risk_score,
+        HistoricalTicket.outcome,
+        HistoricalTicket.created_at,
+        HistoricalTicket.embedding_scale
+    ).order_by(HistoricalTicket.ticket_id).yield_per(FINGERPRINT_ROWS_PER_FETCH):
+        fingerprint_hash.update(repr(tuple(ticket_row)).encode("utf-8"))
+        number_of_rows += 1
+    return f"{number_of_rows}:{fingerprint_hash.hexdigest()[:32]}"
+
+def build_historical_ticket_index():
+    with get_db_session() as database_session:
+        fingerprint = _read_fingerprint(database_session)
+        ticket_rows = database_session.query(
+            HistoricalTicket.request_summary,
+            HistoricalTicket.request_type,
+            HistoricalTicket.fields_provided,
+            HistoricalTicket.security_risk_score,
+            HistoricalTicket.outcome,
+            HistoricalTicket.created_at,
+            HistoricalTicket.embedding,
+            HistoricalTicket.embedding_vector,
+            HistoricalTicket.embedding_scale
+        ).order_by(HistoricalTicket.ticket_id).all()
+
+    ticket_metadata = [
+        {
+            'request_summary': row.request_summary,
+            'request_type': row.request_type,
+            'fields_provided': row.fields_provided,
+            'security_risk_score': row.security_risk_score,
+            'outcome': row.outcome
+        }
+        for row in ticket_rows
+    ]
+    ticket_created_at = [row.created_at for row in ticket_rows]
+    return HistoricalTicketIndex(_load_embedding_matrix(ticket_rows), ticket_metadata, fingerprint, ticket_created_at)
+
+def _snapshot_is_enabled(snapshot_path):
+    return snapshot_path != "off"
+
+def load_historical_ticket_index_snapshot(snapshot_path=INDEX_SNAPSHOT_PATH, fingerprint=None):
+    """Map the snapshot read-only if it matches the table (or fingerprint, when given); otherwise None."""
+    if not _snapshot_is_enabled(snapshot_path):
+        return None
+    index_snapshot = open_index_snapshot(snapshot_path)
+    if index_snapshot is None:
+        return None
+    snapshot_header, embedding_matrix, ticket_created_at = index_snapshot
+    if fingerprint is None:
+        with get_db_session() as database_session:
+            fingerprint = _read_fingerprint(database_session)
+    if snapshot_header["fingerprint"] != fingerprint:
+        return None
+    return HistoricalTicketIndex(
+        embedding_matrix, snapshot_header["ticket_metadata"], fingerprint, ticket_created_at,
+        is_normalized=True
+    )
+
+def load_historical_ticket_index(use_snapshot=True):
+    """The index from the shared snapshot when it is current, otherwise built from the database."""
+    snapshot_identity = snapshot_file_identity(INDEX_SNAPSHOT_PATH) if _snapshot_is_enabled(INDEX_SNAPSHOT_PATH) else None
+    # Read before the rows, so a write landing in between shows up as a change at the next check.
+    change_marker = _read_change_marker()
+    historical_ticket_index = (use_snapshot and load_historical_ticket_index_snapshot()) or build_historical_ticket_index()
+    # Remembered even for a stale snapshot, so only a newly written file triggers another reload.
+    historical_ticket_index.snapshot_identity = snapshot_identity
+    historical_ticket_index.change_marker = change_marker
+    return historical_ticket_index
+
+def historical_ticket_index_snapshot_is_current(snapshot_path=INDEX_SNAPSHOT_PATH):
+    header_and_offset = read_index_snapshot_header(snapshot_path)
+    if header_and_offset is None:
+        return False
+    with get_db_session() as database_session:
+        return header_and_offset[0]["fingerprint"] == _read_fingerprint(database_session)
+
+def write_historical_ticket_index_snapshot(snapshot_path=INDEX_SNAPSHOT_PATH):
+    """Rebuild the snapshot from the database; running workers switch to it at their next check."""
+    if not _snapshot_is_enabled(snapshot_path):
+        return
+    historical_ticket_index = build_historical_ticket_index()
+    write_index_snapshot(
+        snapshot_path, historical_ticket_index.embedding_matrix, historical_ticket_index.ticket_metadata,
+        historical_ticket_index.ticket_created_at, historical_ticket_index.fingerprint
+    )
+
+def _index_needs_rebuild():
+    global _last_fingerprint_check
+    if _index_is_stale or _historical_ticket_index is None:
+        return True
+    if time.monotonic() - _last_fingerprint_check < FINGERPRINT_CHECK_INTERVAL_SECONDS:
+        return False
+    _last_fingerprint_check = time.monotonic()
+    if _snapshot_is_enabled(INDEX_SNAPSHOT_PATH) and snapshot_file_identity(INDEX_SNAPSHOT_PATH) != _historical_ticket_index.snapshot_identity:
+        return True
+    return _read_change_marker() != _historical_ticket_index.change_marker
+
+def get_historical_ticket_index():
+    """Get the process-wide historical ticket index, rebuilding it if the table changed."""
+    global _historical_ticket_index, _index_is_stale, _last_fingerprint_check
+    current_index = _historical_ticket_index
+    if not _index_needs_rebuild():
+        return current_index
+    with _index_lock:
+        if _historical_ticket_index is not current_index:
+            return _historical_ticket_index
+        # After a write in this process the snapshot is most likely older than the table, so build from the database
+        # rather than hashing the table once to reject the snapshot and again to build.
+        changed_locally = _index_is_stale and current_index is not None
+        _index_is_stale = False
+        _historical_ticket_index = load_historical_ticket_index(use_snapshot=not changed_locally)
+        _last_fingerprint_check = time.monotonic()
+    if current_index is not None and current_index.fingerprint != _historical_ticket_index.fingerprint:
+        _notify_change_listeners()
+    return _historical_ticket_index
+
+def add_historical_ticket_change_listener(listener):
+    """Call listener() whenever historical_tickets is known to have changed."""
+    _change_listeners.append(listener)
+
+def _notify_change_listeners():
+    for listener in _change_listeners:
+        listener()
+
+def invalidate_historical_ticket_index():
+    global _index_is_stale
+    _index_is_stale = True
+    _notify_change_listeners()
+
+# Invalidating at flush time would let a concurrent rebuild read the rows before they commit and then
+# serve them as current, so a flush only marks the session and the index is invalidated once it commits.
+@event.listens_for(Session, "after_flush")
+def _on_historical_ticket_flush(database_session, flush_context):
+    changed_instances = (*database_session.new, *database_session.dirty, *database_session.deleted)
+    if any(isinstance(instance, HistoricalTicket) for instance in changed_instances):
+        database_session.info["historical_tickets_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _on_historical_ticket_commit(database_session):
+    if database_session.info.pop("historical_tickets_changed", False):
+        invalidate_historical_ticket_index()
+
+@event.listens_for(Session, "after_rollback")
+def _on_historical_ticket_rollback(database_session):
+    database_session.info.pop("historical_tickets_changed", None)
@@ -0,0 +1,179 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from database import engine
+from metrics import Counter, Histogram, register_collector
+
+# "on" batches append-only rows (messages, audit log) on a background thread; "off" inserts them inline.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "on")
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "50"))
+# Rows held in memory before enqueueing callers insert inline instead, so a stalled writer cannot grow the queue without bound.
+WRITE_BEHIND_MAX_QUEUED_ROWS = int(os.getenv("WRITE_BEHIND_MAX_QUEUED_ROWS", "10000"))
+WRITE_BEHIND_RETRY_SECONDS = 1.0
+WRITE_BEHIND_MAX_ATTEMPTS = 5
+
+WRITE_BEHIND_ROWS_TOTAL = Counter("acme_write_behind_rows_total", "Rows written by the write-behind queue", ["table"])
+WRITE_BEHIND_FAILED_ROWS_TOTAL = Counter("acme_write_behind_failed_rows_total", "Rows the write-behind queue could not write and dropped", ["table"])
+WRITE_BEHIND_INLINE_ROWS_TOTAL = Counter("acme_write_behind_inline_rows_total", "Rows inserted inline because the write-behind queue was full", ["table"])
+WRITE_BEHIND_FLUSH_SECONDS = Histogram("acme_write_behind_flush_seconds", "Time to write one write-behind batch")
+
+_write_behind_queue = None
+_write_behind_queue_lock = threading.Lock()
+
+def _is_transient_write_error(write_error):
+    """Lock contention that a later attempt can get past, as opposed to a row that will never insert."""
+    error_message = str(write_error).lower()
+    return isinstance(write_error, OperationalError) and ("locked" in error_message or "busy" in error_message)
+
+def _insert_rows(model_class, model_rows):
+    with engine.begin() as connection:
+        connection.execute(insert(model_class), model_rows)
+
+class WriteBehindQueue:
+    """Buffers inserts of append-only rows and writes them in one transaction per batch.
+
+    A batch is written once it reaches batch_rows or flush_interval_ms after its first row, whichever
+    comes first. Rows still queued when the process is killed are lost, so only rows nothing reads
+    back within the same request belong here. A batch that keeps failing is written row by row and
+    only the rows that still fail are dropped; when max_queued_rows are waiting, new rows are inserted inline.
+    """
+
+    def __init__(self, batch_rows=WRITE_BEHIND_BATCH_ROWS, flush_interval_ms=WRITE_BEHIND_FLUSH_INTERVAL_MS,
+                 max_queued_rows=WRITE_BEHIND_MAX_QUEUED_ROWS):
+        self.batch_rows = batch_rows
+        self.flush_interval_seconds = flush_interval_ms / 1000
+        self._pending_rows = queue.Queue(maxsize=max_queued_rows)
+        self._idle = threading.Condition()
+        self._unwritten_rows = 0
+        self._stopping = False
+        self._writer = threading.Thread(target=self._run_writer, name="write-behind", daemon=True)
+        self._writer.start()
+
+    def enqueue(self, model_class, row_values):
+        with self._idle:
+            self._unwritten_rows += 1
+        try:
+            self._pending_rows.put_nowait((model_class, row_values))
+        except queue.Full:
+            with self._idle:
+                self._unwritten_rows -= 1
+                self._idle.notify_all()
+            _insert_rows(model_class, [row_values])
+            WRITE_BEHIND_INLINE_ROWS_TOTAL.inc(table=model_class.__tablename__)
+
+    def depth(self):
+        return self._unwritten_rows
+
+    def _next_batch(self):
+        first_row = self._pending_rows.get()
+        if first_row is None:
+            return None
+        batch = [first_row]
+        flush_deadline = time.monotonic() + self.flush_interval_seconds
+        while len(batch) < self.batch_rows:
+            remaining_seconds = flush_deadline - time.monotonic()
+            if remaining_seconds <= 0:
+                break
+            try:
+                pending_row = self._pending_rows.get(timeout=remaining_seconds)
+            except queue.Empty:
+                break
+            if pending_row is None:
+                self._stopping = True
+                break
+            batch.append(pending_row)
+        return batch
+
+    def _write_batch(self, batch):
+        rows_by_model = defaultdict(list)
+        for model_class, row_values in batch:
+            rows_by_model[model_class].append(row_values)
+        started_at = time.perf_counter()
+        with engine.begin() as connection:
+            for model_class, model_rows in rows_by_model.items():
+                connection.execute(insert(model_class), model_rows)
+        WRITE_BEHIND_FLUSH_SECONDS.observe(time.perf_counter() - started_at)
+        for model_class, model_rows in rows_by_model.items():
+            WRITE_BEHIND_ROWS_TOTAL.inc(len(model_rows), table=model_class.__tablename__)
+
+    def _write_batch_or_rows(self, batch):
+        """Write the batch, retrying lock contention a few times, then fall back to one transaction per row."""
+        for attempt_number in range(1, WRITE_BEHIND_MAX_ATTEMPTS + 1):
+            try:
+                self._write_batch(batch)
+                return
+            except Exception as write_error:
+                if not _is_transient_write_error(write_error) or attempt_number == WRITE_BEHIND_MAX_ATTEMPTS:
+                    print(f"Write-behind batch of {len(batch)} rows failed ({write_error}), writing its rows one at a time")
+                    break
+                print(f"Write-behind batch of {len(batch)} rows failed ({write_error}), retrying in {WRITE_BEHIND_RETRY_SECONDS:.0f}s")
+                time.sleep(WRITE_BEHIND_RETRY_SECONDS)
+        for model_class, row_values in batch:
+            try:
+                self._write_batch([(model_class, row_values)])
+            except Exception as row_error:
+                WRITE_BEHIND_FAILED_ROWS_TOTAL.inc(table=model_class.__tablename__)
+                print(f"Write-behind dropped a {model_class.__tablename__} row for thread {row_values.get('thread_id')}: {row_error}")
+
+    def _run_writer(self):
+        while not self._stopping:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._write_batch_or_rows(batch)
+            with self._idle:
+                self._unwritten_rows -= len(batch)
+                self._idle.notify_all()
+
+    def flush(self, timeout_seconds=None):
+        """Block until every row queued so far is written; returns False if the timeout ran out first."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unwritten_rows == 0, timeout=timeout_seconds)
+
+    def close(self, timeout_seconds=10):
+        try:
+            self._pending_rows.put(None, timeout=timeout_seconds)
+        except queue.Full:
+            return
+        self._writer.join(timeout_seconds)
+
+def get_write_behind_queue():
+    """Get or create the write-behind queue singleton, or None when WRITE_BEHIND is off."""
+    global _write_behind_queue
+    if WRITE_BEHIND == "off":
+        return None
+    with _write_behind_queue_lock:
+        if _write_behind_queue is None:
+            _write_behind_queue = WriteBehindQueue()
+            atexit.register(_write_behind_queue.close)
+    return _write_behind_queue
+
+def insert_row_behind(model_class, **row_values):
+    """Insert an append-only row, batched through the write-behind queue unless WRITE_BEHIND is off.
+
+    Column defaults such as timestamps are not applied until the batch is written, so callers that
+    care about ordering pass them explicitly.
+    """
+    write_behind_queue = get_write_behind_queue()
+    if write_behind_queue is None:
+        _insert_rows(model_class, [row_values])
+        return
+    write_behind_queue.enqueue(model_class, row_values)
+
+def flush_write_behind(timeout_seconds=None):
+    if _write_behind_queue is None:
+        return True
+    return _write_behind_queue.flush(timeout_seconds)
+
+def _collect_write_behind_metrics():
+    if _write_behind_queue is None:
+        return []
+    return [("acme_write_behind_queue_depth", "gauge", "Rows waiting to be written by the write-behind queue", [({}, _write_behind_queue.depth())])]
+
+register_collector(_collect_write_behind_metrics)